@@ -0,0 +1,206 @@
+"""
+Benchmark each stage of GutenbergDataLoader on a synthetic corpus.
+
+Times load_splits, enrich_all_data, tokenize_all_text, lemmatize_all_text,
+random_chunk_all_text and save_pickle/load_pickle separately, for each number of workers, and
+writes throughput (books/s, MB/s), peak RSS and worker scaling to a JSON file so runs can be
+compared between commits.  The workers outlive every stage, so their CPU time and peak RSS come
+from the loader's telemetry, which the workers report them to:
+
+    python -m benchmarks.bench_loader --books 200 --workers 1 2 4 --out bench.json
+
+Stages that can't run (e.g. NLTK data not installed) are recorded with their error and skipped,
+along with the stages that depend on them.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
+
+# pylint: disable=wrong-import-position
+from benchmarks.synthetic_corpus import generate_corpus
+from src.data_loader import GutenbergDataLoader
+from src.telemetry import LoaderTelemetry, peak_rss_bytes
+
+SPLIT_CSVS = ('final_train.csv', 'final_val.csv', 'final_test.csv')
+
+
+def _megabytes(num_bytes):
+    return None if num_bytes is None else round(num_bytes / 2**20, 1)
+
+
+def peak_rss_mb(telemetry):
+    """
+    Peak resident set size so far of this process and of its largest worker, in MB (None if unknown).
+    """
+    return {'self': _megabytes(peak_rss_bytes()),
+            'workers': _megabytes(telemetry.worker_usage()['peak_rss_bytes'])}
+
+
+def git_commit():
+    """
+    Commit of the repository being benchmarked, or None outside of git.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_PATH, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def text_megabytes(loader):
+    """
+    Size of the loaded text of all splits, in MB.
+    """
+    return sum(df['text'].map(lambda text: len(text) if isinstance(text, str) else 0).sum()
+               for df in (loader.train_df, loader.val_df, loader.test_df)) / 2**20
+
+
+def time_stage(name, func, num_books, megabytes, results, telemetry):
+    """
+    Run func, recording its wall and CPU time, throughput and peak RSS under results[name].
+    Returns whether it succeeded.
+    """
+    start_cpu = time.process_time()
+    start_workers_cpu = telemetry.worker_usage()['cpu_s']
+    start = time.perf_counter()
+    try:
+        func()
+    except Exception as e:  # pylint: disable=broad-except
+        results[name] = {'error': f'{type(e).__name__}: {" ".join(str(e).split())}'}
+        print(f'  {name:<12} failed: {results[name]["error"][:120]}')
+        return False
+
+    wall = time.perf_counter() - start
+    workers_cpu = telemetry.worker_usage()['cpu_s'] - start_workers_cpu
+    results[name] = {'wall_s': round(wall, 4),
+                     'cpu_s': round(time.process_time() - start_cpu, 4),
+                     'workers_cpu_s': round(workers_cpu, 4),
+                     'books_per_s': round(num_books / wall, 2) if wall > 0 else None,
+                     'mb_per_s': round(megabytes / wall, 2) if wall > 0 else None,
+                     'peak_rss_mb': peak_rss_mb(telemetry)}
+    print(f'  {name:<12} {wall:8.3f}s  {results[name]["books_per_s"]} books/s')
+    return True
+
+
+def run_benchmark(dataset_dir, gutenberg_path, num_workers, skip_first_and_last_words=100,
+                  num_chunks=10, chunk_size=1000):
+    """
+    Time every loader stage with num_workers workers, returning {stage: measurements}.
+    """
+    results = {}
+    telemetry = LoaderTelemetry()
+    loader = GutenbergDataLoader(dataset_dir, gutenberg_repo_path=gutenberg_path, num_threads=num_workers,
+                                 telemetry=telemetry)
+    pickle_dir = tempfile.mkdtemp(prefix='bench_pickle_')
+    try:
+        # Start the workers up front so pool startup isn't charged to the first stage using it
+        loader.start_workers()
+
+        num_books = sum(len(loader.read_split_csv(csv_file)) for csv_file in SPLIT_CSVS)
+
+        def load():
+            loader.load_splits(*SPLIT_CSVS, skip_first_and_last_words=skip_first_and_last_words)
+
+        if not time_stage('load', load, num_books, 0, results, telemetry):
+            return results
+        megabytes = text_megabytes(loader)
+        results['load']['mb_per_s'] = round(megabytes / results['load']['wall_s'], 2)
+
+        time_stage('enrich', loader.enrich_all_data, num_books, megabytes, results, telemetry)
+
+        if time_stage('tokenize', loader.tokenize_all_text, num_books, megabytes, results, telemetry):
+            time_stage('lemmatize', loader.lemmatize_all_text, num_books, megabytes, results, telemetry)
+
+        def save():
+            loader.save_pickle(pickle_dir, 'bench')
+
+        def load_pickle():
+            loader.load_pickle(pickle_dir, 'bench')
+
+        if time_stage('save_pickle', save, num_books, megabytes, results, telemetry):
+            time_stage('load_pickle', load_pickle, num_books, megabytes, results, telemetry)
+
+        def chunk():
+            loader.random_chunk_all_text(num_chunks=num_chunks, chunk_size=chunk_size, seed=0)
+
+        time_stage('chunk', chunk, num_books, megabytes, results, telemetry)
+    finally:
+        loader.close()
+        shutil.rmtree(pickle_dir, ignore_errors=True)
+
+    return results
+
+
+def add_scaling(runs):
+    """
+    Speedup and parallel efficiency of each stage relative to the run with the fewest workers.
+    """
+    baseline = min(runs, key=lambda run: run['workers'])
+    for run in runs:
+        for stage, measurements in run['stages'].items():
+            base = baseline['stages'].get(stage, {})
+            if 'wall_s' in measurements and base.get('wall_s'):
+                speedup = base['wall_s'] / measurements['wall_s']
+                measurements['speedup'] = round(speedup, 3)
+                measurements['efficiency'] = round(speedup * baseline['workers'] / run['workers'], 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the GutenbergDataLoader stages')
+    parser.add_argument('--books', type=int, default=200)
+    parser.add_argument('--authors', type=int, default=20)
+    parser.add_argument('--mean-words', type=int, default=50000)
+    parser.add_argument('--vocabulary-size', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--corpus-dir', default=None,
+                        help='Reuse (or create) the synthetic corpus here instead of a temporary directory')
+    parser.add_argument('--out', default='bench_loader.json')
+    args = parser.parse_args()
+
+    corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix='bench_corpus_')
+    try:
+        dataset_dir = os.path.join(corpus_dir, 'dataset')
+        gutenberg_path = os.path.join(corpus_dir, 'gutenberg')
+        if not os.path.exists(os.path.join(dataset_dir, SPLIT_CSVS[0])):
+            print(f'Generating {args.books} synthetic books in {corpus_dir}')
+            generate_corpus(corpus_dir, num_books=args.books, num_authors=args.authors,
+                            mean_words=args.mean_words, vocabulary_size=args.vocabulary_size,
+                            seed=args.seed)
+
+        runs = []
+        for num_workers in args.workers:
+            print(f'{num_workers} workers')
+            runs.append({'workers': num_workers,
+                         'stages': run_benchmark(dataset_dir, gutenberg_path, num_workers)})
+        add_scaling(runs)
+    finally:
+        if args.corpus_dir is None:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    report = {'commit': git_commit(),
+              'timestamp': datetime.now(timezone.utc).isoformat(),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'cpu_count': os.cpu_count(),
+              'corpus': {'books': args.books, 'authors': args.authors, 'mean_words': args.mean_words,
+                         'vocabulary_size': args.vocabulary_size, 'seed': args.seed},
+              'runs': runs}
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
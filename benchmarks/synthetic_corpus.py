@@ -0,0 +1,145 @@
+"""
+Generate a synthetic, Gutenberg-shaped corpus for benchmarking the data loader.
+
+Writes the SPGC layout (``data/text``, ``data/counts``, ``data/tokens``) under a gutenberg
+directory, plus final_train/val/test.csv split files with the same columns as sample_dataset.
+Word frequencies follow a Zipf distribution and book lengths a log-normal one, so the
+corpus behaves roughly like the real one under tokenization, counting and lemmatization.
+"""
+import os
+import argparse
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+PUNCTUATION = ['.', ',', ';', '!', '?', ':']
+PUNCTUATION_WEIGHTS = [0.45, 0.35, 0.06, 0.05, 0.05, 0.04]
+SPLIT_FRACTIONS = {'train': 0.7, 'val': 0.15, 'test': 0.15}
+
+
+def make_vocabulary(rng, size):
+    """
+    Random lower case words, shorter words being more likely.
+    """
+    letters = np.array(list('etaoinshrdlcumwfgypbvkjxqz'))
+    letter_p = np.linspace(2, 0.2, len(letters))
+    letter_p /= letter_p.sum()
+
+    words = set()
+    while len(words) < size:
+        length = min(1 + rng.poisson(4), 14)
+        words.add(''.join(rng.choice(letters, size=length, p=letter_p)))
+    return sorted(words)
+
+
+def make_book(rng, vocabulary, zipf_p, num_words):
+    """
+    Lines of a book of num_words words: Zipf distributed words, sentences of varying length
+    starting with a capital letter, occasional punctuation within sentences, lines of 8-14 words
+    and paragraph breaks.
+    """
+    words = np.asarray(vocabulary, dtype=object)[rng.choice(len(vocabulary), size=num_words, p=zipf_p)]
+
+    sentence_ends = np.cumsum(rng.integers(4, 30, size=num_words // 4 + 1)) - 1
+    sentence_ends = sentence_ends[sentence_ends < num_words]
+    sentence_starts = np.concatenate([[0], sentence_ends + 1])[:len(sentence_ends) + 1]
+    sentence_starts = sentence_starts[sentence_starts < num_words]
+
+    words[sentence_starts] = [word.capitalize() for word in words[sentence_starts]]
+    words[sentence_ends] += rng.choice(['.', '!', '?'], size=len(sentence_ends), p=[0.8, 0.1, 0.1])
+
+    within = rng.random(num_words) < 0.08
+    within[sentence_ends] = False
+    words[within] += rng.choice(PUNCTUATION, size=within.sum(), p=PUNCTUATION_WEIGHTS)
+
+    line_ends = np.cumsum(rng.integers(8, 15, size=num_words // 8 + 1))
+    line_ends = np.concatenate([line_ends[line_ends < num_words], [num_words]])
+    paragraph_breaks = rng.random(len(line_ends)) < 0.1
+
+    lines = []
+    start = 0
+    for end, paragraph_break in zip(line_ends, paragraph_breaks):
+        lines.append(' '.join(words[start:end]))
+        if paragraph_break:
+            lines.append('')
+        start = end
+
+    return lines
+
+
+def generate_corpus(out_dir, num_books=200, num_authors=20, mean_words=50000, vocabulary_size=20000,
+                    seed=0):
+    """
+    Generate a corpus under out_dir: out_dir/gutenberg/data/{text,counts,tokens} and
+    out_dir/dataset/final_{train,val,test}.csv.  Returns (dataset_dir, gutenberg_repo_path).
+    """
+    rng = np.random.default_rng(seed)
+    gutenberg_path = os.path.join(out_dir, 'gutenberg')
+    dataset_dir = os.path.join(out_dir, 'dataset')
+    for sub_dir in ('text', 'counts', 'tokens'):
+        os.makedirs(os.path.join(gutenberg_path, 'data', sub_dir), exist_ok=True)
+    os.makedirs(dataset_dir, exist_ok=True)
+
+    vocabulary = make_vocabulary(rng, vocabulary_size)
+    zipf_p = 1 / np.arange(1, vocabulary_size + 1)
+    zipf_p /= zipf_p.sum()
+
+    # Log-normal book lengths with the requested mean
+    sigma = 0.8
+    lengths = rng.lognormal(np.log(mean_words) - sigma**2 / 2, sigma, size=num_books).astype(int) + 300
+
+    rows = []
+    for i, num_words in enumerate(lengths):
+        pg_id = f'PG{10000 + i}'
+        lines = make_book(rng, vocabulary, zipf_p, int(num_words))
+
+        with open(os.path.join(gutenberg_path, 'data', 'text', f'{pg_id}_text.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        # The SPGC token and count files are lower cased words without punctuation
+        tokens = [token.strip(''.join(PUNCTUATION)).lower() for line in lines for token in line.split()]
+        with open(os.path.join(gutenberg_path, 'data', 'tokens', f'{pg_id}_tokens.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(tokens) + '\n')
+        with open(os.path.join(gutenberg_path, 'data', 'counts', f'{pg_id}_counts.txt'), 'w', encoding='utf-8') as f:
+            for token, count in Counter(tokens).most_common():
+                f.write(f'{token}\t{count}\n')
+
+        author = i % num_authors
+        rows.append({'id': pg_id,
+                     'title': f'Synthetic Book {i}',
+                     'author': f'Author, Synthetic {author}',
+                     'authoryearofbirth': 1800.0 + author,
+                     'authoryearofdeath': 1870.0 + author,
+                     'language': "['en']",
+                     'downloads': int(rng.integers(10, 1000)),
+                     'subjects': "{'Fiction'}"})
+
+    # Split every author's books between train, val and test
+    books = pd.DataFrame(rows)
+    split = np.array(['train'] * len(books), dtype=object)
+    for _, index in books.groupby('author').groups.items():
+        index = rng.permutation(np.asarray(index))
+        num_val = int(round(len(index) * SPLIT_FRACTIONS['val']))
+        num_test = int(round(len(index) * SPLIT_FRACTIONS['test']))
+        split[index[:num_val]] = 'val'
+        split[index[num_val:num_val + num_test]] = 'test'
+
+    for name in SPLIT_FRACTIONS:
+        books[split == name].to_csv(os.path.join(dataset_dir, f'final_{name}.csv'))
+
+    return dataset_dir, gutenberg_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic Gutenberg-shaped corpus')
+    parser.add_argument('out_dir')
+    parser.add_argument('--books', type=int, default=200)
+    parser.add_argument('--authors', type=int, default=20)
+    parser.add_argument('--mean-words', type=int, default=50000)
+    parser.add_argument('--vocabulary-size', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generate_corpus(args.out_dir, num_books=args.books, num_authors=args.authors,
+                    mean_words=args.mean_words, vocabulary_size=args.vocabulary_size, seed=args.seed)
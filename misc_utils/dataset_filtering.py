@@ -5,18 +5,75 @@
 
 import os
 import sys
+import json
 import string
+import numpy as np
 import pandas as pd
 
 
 repos = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir)
 sys.path.append(repos)
 
-import gutenberg.src.metaquery as metaquery
+# Characters ignored when comparing titles or authors
+_STRIP_TABLE = {ord(c): None for c in string.punctuation + string.whitespace}
+
+# Authors that can't be classified
+UNATTRIBUTED_AUTHORS = ('Various', 'Anonymous', 'Unknown')
+
+# Bump when the joined table changes, so older caches are rebuilt
+CATALOG_CACHE_VERSION = 1
+
+
+def _source_signature(paths):
+    """
+    Path, modification time and size of each source file, which a cache built from them must match.
+    """
+    signature = []
+    for path in paths:
+        stat = os.stat(path)
+        signature.append([os.path.abspath(path), stat.st_mtime_ns, stat.st_size])
+    return signature
 
 
 def read_metadata_and_catalog(metadata_filepath: str, pg_catalog_filepath: str, filter_exist: bool=False,
-                              types_to_drop=['Sound', 'Collection', 'Image', 'StillImage', 'MovingImage', 'Dataset']):
+                              types_to_drop=['Sound', 'Collection', 'Image', 'StillImage', 'MovingImage', 'Dataset'],
+                              cache_path: str=None):
+    """
+    Join the SPGC metadata with the PG catalog on PG id, dropping non-text entries.
+
+    With a cache_path, the joined table is saved there as a Parquet file (plus a .json sidecar
+    recording the source files and settings) and read back from it on later calls, until
+    metadata.csv or pg_catalog.csv change.  The cache isn't used with filter_exist, whose result
+    depends on which books have been downloaded.
+    """
+    if cache_path is None or filter_exist:
+        return _join_metadata_and_catalog(metadata_filepath, pg_catalog_filepath, filter_exist, types_to_drop)
+
+    key = {'version': CATALOG_CACHE_VERSION, 'types_to_drop': sorted(types_to_drop),
+           'sources': _source_signature([metadata_filepath, pg_catalog_filepath])}
+    key_path = f'{cache_path}.json'
+    if os.path.exists(cache_path) and os.path.exists(key_path):
+        with open(key_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == key:
+                return pd.read_parquet(cache_path)
+
+    df = _join_metadata_and_catalog(metadata_filepath, pg_catalog_filepath, filter_exist, types_to_drop)
+
+    # Write the table before its key, so a key always describes the table next to it
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    df.to_parquet(tmp_path, compression='zstd')
+    os.replace(tmp_path, cache_path)
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(key, f)
+    os.replace(tmp_path, key_path)
+
+    return df
+
+
+def _join_metadata_and_catalog(metadata_filepath, pg_catalog_filepath, filter_exist, types_to_drop):
+    # Only needed when the cache is out of date
+    import gutenberg.src.metaquery as metaquery
+
     # Read them in
     mq = metaquery.meta_query(path=metadata_filepath, filter_exist=filter_exist)
 
@@ -45,130 +102,151 @@ def read_metadata_and_catalog(metadata_filepath: str, pg_catalog_filepath: str,
     return mq.df.join(pg_df.set_index('PG_ID'), on='PG_ID', rsuffix='_pgc', how='inner')
 
 
-def compare_columns(df, col_a, col_b, verbose=False):
-    def compare(s1, s2):
-        s1 = s1.replace('$b', '')
-        s2 = s2.replace('$b', '')
-        remove = string.punctuation + string.whitespace
-        mapping = {ord(c): None for c in remove}
-        if not isinstance(s1, str) or not isinstance(s2, str):
-            print(f'WARNING: something isnt a string {s1}   {s2}')
-            return False, s1, s2
+def normalize_strings(values):
+    """
+    Normalize a column of titles or authors for comparison: drop MARC '$b' subfield markers,
+    punctuation and whitespace, and casefold.  Non-strings stay as they are.
+    """
+    values = pd.Series(values)
+    is_str = values.map(type) == str
+    normalized = values.copy()
+    normalized[is_str] = (values[is_str].str.replace('$b', '', regex=False)
+                          .str.translate(_STRIP_TABLE).str.casefold())
+    return normalized
 
-        s1_clean = s1.translate(mapping).casefold()
-        s2_clean = s2.translate(mapping).casefold()
 
-        return s1_clean == s2_clean, s1_clean, s2_clean
+def compare_columns(df, col_a, col_b, verbose=False):
+    """
+    Compare two text columns of df, like the metadata and catalog titles.
 
+    Returns the rows whose values differ, and the list of those rows (as Series) that can't be
+    compared because a value isn't a string.  With verbose, the rows that still differ after normalizing
+    both values (normalize_strings), and where neither value is a prefix of the other, are printed.
+    """
     col_a_sanitized = df[col_a].str.replace('\r\n', ': ')
     col_b_sanitized = df[col_b].str.replace('\r\n', ': ')
-    # matches = df[col_a].apply()
     dont_match = df.loc[~(col_a_sanitized == col_b_sanitized)]
 
-    entries_that_dont_match = []
-    attribute_errors = []
-    for _, row in dont_match.iterrows():
-        try:
-            comparison, s1_clean, s2_clean = compare(row[col_a], row[col_b])
-            if comparison is False:
-                # The title in pg_catalog.csv is just the first part of the title, move along, all
-                # is well
-                if s1_clean.startswith(s2_clean) or s2_clean.startswith(s1_clean):
-                    pass
-                    # print('THEY DO MATCH')
-                else:
-                    if verbose:
-                        print(f'Dont Match: id: {row["id"]}   {row[col_a]}   {row[col_b]}')
-                    entries_that_dont_match.append(row)
-
-        except AttributeError as e:
-            attribute_errors.append(row)
-            if verbose:
-                print(f'\nAttribute Error: {e}')
-                print(row[['id', 'title', col_a, col_b]])
-
-            # raise e
+    a = dont_match[col_a]
+    b = dont_match[col_b]
+    comparable = ((a.map(type) == str) & (b.map(type) == str)).to_numpy()
+    not_comparable = dont_match.loc[~comparable]
+    attribute_errors = [row for _, row in not_comparable.iterrows()]
+
+    # The title in pg_catalog.csv is sometimes just the first part of the title, those match
+    a_clean = normalize_strings(a[comparable]).to_numpy(dtype=str)
+    b_clean = normalize_strings(b[comparable]).to_numpy(dtype=str)
+    matches = np.char.startswith(a_clean, b_clean) | np.char.startswith(b_clean, a_clean)
+
+    if verbose:
+        mismatched = dont_match.loc[comparable].loc[~matches]
+        lines = ('Dont Match: id: ' + mismatched['id'].astype(str) + '   ' + mismatched[col_a] + '   '
+                 + mismatched[col_b])
+        if len(lines):
+            print('\n'.join(lines))
+        if len(attribute_errors):
+            print(f'\nAttribute Error: {col_a} or {col_b} is not a string')
+            columns = [name for name in dict.fromkeys(('id', 'title', col_a, col_b)) if name in df.columns]
+            print(not_comparable[columns])
+
     return dont_match, attribute_errors
 
 
-def get_word_count(book_id, raw_text_dir):
+def author_stats(df):
     """
-    Given something like 'PG10007' and a directory containing a file called
-    'PG10007_counts.txt' whose lines each have a word and a count, sum up
-    all those counts and return the total.
+    Total books, lines, words, tokens and unique words of each author, from the per-book
+    line_count, word_count, token_count and unique_word_count columns.
     """
-    filename = f"{book_id}_counts.txt"
-    file_path = os.path.join(raw_text_dir, filename)
-
-    # If the file doesn’t exist, return None
-    if not os.path.exists(file_path):
-        return None
+    return df.groupby('author').agg(total_books=('id', 'size'), total_lines=('line_count', 'sum'),
+                                    total_words=('word_count', 'sum'), total_tokens=('token_count', 'sum'),
+                                    total_unique_words=('unique_word_count', 'sum'))
 
-    total_count = 0
-    with open(file_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            # Each line looks like: word count
-            word, count_str = line.strip().split()
-            total_count += int(count_str)
 
-    return total_count
+def select_authors(df, min_books=30, min_lines=30000, min_words=0, exclude=UNATTRIBUTED_AUTHORS):
+    """
+    Keep the downloaded books (with a line_count) of the authors with at least min_books such
+    books, min_lines lines and min_words words in total, leaving out the exclude authors.
+    The defaults are the 30 books / 30,000 lines authors of the dataset.
+    """
+    df = df[df['line_count'].notna() & ~df['author'].isin(exclude)]
+    stats = author_stats(df)
+    keep = stats.index[(stats['total_books'] >= min_books) & (stats['total_lines'] >= min_lines)
+                       & (stats['total_words'] >= min_words)]
+    return df[df['author'].isin(keep)]
 
 
-def get_unique_word_count(book_id, raw_text_dir):
+def add_book_stats(df, gutenberg_data_path, stats_index_path=None, num_threads=None, refresh=False):
     """
-    Given something like 'PG10007' and a directory containing a file
-    called 'PG10007_counts.txt' whose lines each have 'word count',
-    return how many lines that file has (i.e., how many unique words).
+    Add the word_count, unique_word_count, line_count and token_count of each book of df['id'],
+    scanning the SPGC data files in parallel through a corpus stats index (saved to and reused
+    from stats_index_path if given) instead of opening four files per row.
+    Books already in a saved index are only scanned again if their files changed and refresh is set.
     """
-    filename = f"{book_id}_counts.txt"
-    file_path = os.path.join(raw_text_dir, filename)
+    from src.corpus_stats import CorpusStatsIndex
 
-    if not os.path.exists(file_path):
-        return None
+    if stats_index_path is not None and os.path.exists(stats_index_path):
+        stats_index = CorpusStatsIndex.load(stats_index_path)
+    else:
+        stats_index = CorpusStatsIndex()
+    scanned = stats_index.update(gutenberg_data_path, df['id'], num_threads=num_threads)
+    if refresh:
+        scanned += stats_index.refresh(gutenberg_data_path, df['id'], num_threads=num_threads)
+    if scanned and stats_index_path is not None:
+        stats_index.save(stats_index_path)
 
-    # Count lines to get # of unique words
-    with open(file_path, 'r', encoding='utf-8') as f:
-        num_unique_words = sum(1 for _ in f)
+    return stats_index.enrich(df.copy())
 
-    return num_unique_words
 
-
-def get_line_count(book_id, text_dir):
+def _book_stat(book_id, directory, column):
     """
-    Given something like 'PG10007' and a directory containing
-    'PG10007_text.txt', return how many lines are in the file.
+    One stat of a book from the corpus stats index of the SPGC data directory holding directory,
+    a book missing from it is scanned once for all its stats.  None if the book's file is missing.
     """
-    filename = f"{book_id}_text.txt"
-    file_path = os.path.join(text_dir, filename)
+    from src.corpus_stats import CorpusStatsIndex
+
+    gutenberg_data_path = os.path.dirname(os.path.normpath(directory))
+    stats_index = _STATS_INDEXES.setdefault(gutenberg_data_path, CorpusStatsIndex())
+    if book_id not in stats_index:
+        stats_index.update(gutenberg_data_path, [book_id])
 
-    # If the file doesn’t exist, return None (or 0)
-    if not os.path.exists(file_path):
-        return None
+    return stats_index.get(book_id)[column]
 
-    # Count lines
-    with open(file_path, 'r', encoding='utf-8') as f:
-        line_count = sum(1 for _ in f)
 
-    return line_count
+# Corpus stats index of each SPGC data directory the get_*_count helpers were called with
+_STATS_INDEXES = {}
 
 
-def get_token_count(book_id, text_dir):
+def get_word_count(book_id, raw_text_dir):
     """
-    Given something like 'PG10007' and a directory containing
-    'PG10007_tokens.txt', return how many lines are in the file.
+    Given something like 'PG10007' and the SPGC counts directory, holding 'PG10007_counts.txt'
+    whose lines each have a word and a count, return the sum of the counts.
+    Use add_book_stats to add the stats of a whole dataframe.
     """
-    filename = f"{book_id}_tokens.txt"
-    file_path = os.path.join(text_dir, filename)
+    return _book_stat(book_id, raw_text_dir, 'word_count')
 
-    # If the file doesn’t exist, return None (or 0)
-    if not os.path.exists(file_path):
-        return None
 
-    # Count lines
-    with open(file_path, 'r', encoding='utf-8') as f:
-        token_count = sum(1 for _ in f)
+def get_unique_word_count(book_id, raw_text_dir):
+    """
+    Given something like 'PG10007' and the SPGC counts directory, return how many lines
+    'PG10007_counts.txt' has (i.e., how many unique words).
+    """
+    return _book_stat(book_id, raw_text_dir, 'unique_word_count')
+
+
+def get_line_count(book_id, text_dir):
+    """
+    Given something like 'PG10007' and the SPGC text directory, return how many lines
+    'PG10007_text.txt' has.
+    """
+    return _book_stat(book_id, text_dir, 'line_count')
+
 
-    return token_count
+def get_token_count(book_id, token_dir):
+    """
+    Given something like 'PG10007' and the SPGC tokens directory, return how many lines
+    'PG10007_tokens.txt' has.
+    """
+    return _book_stat(book_id, token_dir, 'token_count')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,292 @@
+"""
+Book stores used by GutenbergDataLoader to fetch the text of a book by its PG id.
+
+DirectoryBookStore reads the SPGC layout directly (one ``<id>_text.txt`` file per book).
+PackedBookStore reads from a single packed data file, written once by ``pack_books``,
+through ``mmap`` so a lookup is a slice of the mapping with no per-book syscalls.
+
+get_text returns the whitespace-normalized text the loader's stages work on.  get_raw_text
+returns the file as read in text mode, newlines included, for subword tokenizers that see them.
+"""
+import io
+import os
+import mmap
+import hashlib
+
+PACKED_DATA_FILE = 'books.dat'
+PACKED_RAW_FILE = 'books.raw'
+PACKED_INDEX_FILE = 'books.idx'
+
+
+def normalize_lines(lines):
+    """
+    Join the lines of a book into a single string, stripping each line.
+    This is the whitespace normalization the loader has always applied to the raw text.
+    """
+    return ' '.join(line.strip() for line in lines)
+
+
+def decode_text(raw):
+    """
+    Normalized text of the raw bytes of a book file, split into lines exactly as reading the
+    file in text mode does.
+    """
+    return normalize_lines(io.TextIOWrapper(io.BytesIO(raw), encoding='utf-8'))
+
+
+def decode_raw_text(raw):
+    """
+    Text of the raw bytes of a book file as reading it in text mode returns it: universal
+    newlines, undecodable bytes replaced.
+    """
+    return io.TextIOWrapper(io.BytesIO(raw), encoding='utf-8', errors='replace').read()
+
+
+class DirectoryBookStore:
+    """
+    Book store backed by the SPGC ``data/text`` directory.
+    """
+
+    def __init__(self, text_dir):
+        self._text_dir = text_dir
+
+    def _path(self, pg_id):
+        return os.path.join(self._text_dir, f'{pg_id}_text.txt')
+
+    def __contains__(self, pg_id):
+        return os.path.exists(self._path(pg_id))
+
+    def ids(self):
+        """
+        Return the PG ids of the text files in the directory, sorted.
+        """
+        suffix = '_text.txt'
+        return sorted(f[:-len(suffix)] for f in os.listdir(self._text_dir) if f.endswith(suffix))
+
+    def get_text(self, pg_id):
+        """
+        Return the normalized text of the book, or None if it does not exist.
+        """
+        filename = self._path(pg_id)
+        if not os.path.exists(filename):
+            return None
+
+        with open(filename, 'r', encoding='utf-8') as f:
+            return normalize_lines(f)
+
+    def get_raw_text(self, pg_id):
+        """
+        Return the text of the book as read in text mode, newlines included, or None if it does
+        not exist.
+        """
+        filename = self._path(pg_id)
+        if not os.path.exists(filename):
+            return None
+
+        with open(filename, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+
+    def content_hash(self, pg_id):
+        """
+        Return the sha1 of the raw text file, or None if it does not exist.
+        """
+        filename = self._path(pg_id)
+        if not os.path.exists(filename):
+            return None
+
+        with open(filename, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def get_text_and_hash(self, pg_id):
+        """
+        Return the normalized text and the sha1 of the raw text file, reading the file once,
+        or (None, None) if it does not exist.
+        """
+        filename = self._path(pg_id)
+        if not os.path.exists(filename):
+            return None, None
+
+        with open(filename, 'rb') as f:
+            raw = f.read()
+        return decode_text(raw), hashlib.sha1(raw).hexdigest()
+
+    def close(self):
+        """
+        Nothing to release, present so both stores can be used interchangeably.
+        """
+
+
+class PackedBookStore:
+    """
+    Book store backed by a packed data file and a PG id -> (offset, length) index.
+    """
+
+    def __init__(self, store_dir):
+        self._store_dir = store_dir
+        self._index = {}
+        self._raw_index = {}
+        self._hashes = {}
+
+        with open(os.path.join(store_dir, PACKED_INDEX_FILE), 'r', encoding='utf-8') as f:
+            for line in f:
+                # Stores packed before the raw bytes were kept have no raw offset and length
+                pg_id, offset, length, sha1, *raw_entry = line.rstrip('\n').split('\t')
+                self._index[pg_id] = (int(offset), int(length))
+                self._hashes[pg_id] = sha1
+                if raw_entry:
+                    raw_offset, raw_length = raw_entry
+                    self._raw_index[pg_id] = (int(raw_offset), int(raw_length))
+
+        self._file, self._mmap = self._map(PACKED_DATA_FILE)
+        self._raw_file, self._raw_mmap = None, b''
+        if os.path.exists(os.path.join(store_dir, PACKED_RAW_FILE)):
+            self._raw_file, self._raw_mmap = self._map(PACKED_RAW_FILE)
+
+    def _map(self, filename):
+        f = open(os.path.join(self._store_dir, filename), 'rb')
+        # mmap refuses to map an empty file
+        if os.fstat(f.fileno()).st_size > 0:
+            return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return f, b''
+
+    def __contains__(self, pg_id):
+        return pg_id in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def ids(self):
+        """
+        Return the PG ids in the store, in the order they were packed.
+        """
+        return list(self._index)
+
+    def get_text(self, pg_id):
+        """
+        Return the normalized text of the book, or None if it is not in the store.
+        """
+        entry = self._index.get(pg_id)
+        if entry is None:
+            return None
+
+        offset, length = entry
+        return self._mmap[offset:offset + length].decode('utf-8')
+
+    def get_raw_text(self, pg_id):
+        """
+        Return the text of the file the book was packed from as read in text mode, newlines
+        included, or None if it is not in the store.
+        """
+        if pg_id not in self._index:
+            return None
+
+        entry = self._raw_index.get(pg_id)
+        if entry is None:
+            raise ValueError(f'{self._store_dir} was packed without the raw text of the books, pack it again')
+
+        offset, length = entry
+        return decode_raw_text(self._raw_mmap[offset:offset + length])
+
+    def content_hash(self, pg_id):
+        """
+        Return the sha1 of the raw text file the book was packed from.
+        """
+        return self._hashes.get(pg_id)
+
+    def get_text_and_hash(self, pg_id):
+        """
+        Return the normalized text and the sha1 of the raw text file, or (None, None) if the book
+        is not in the store.
+        """
+        return self.get_text(pg_id), self._hashes.get(pg_id)
+
+    def close(self):
+        """
+        Release the memory maps and the underlying files.
+        """
+        for mapping, f in ((self._mmap, self._file), (self._raw_mmap, self._raw_file)):
+            if isinstance(mapping, mmap.mmap):
+                mapping.close()
+            if f is not None:
+                f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getstate__(self):
+        # The mapping cannot be pickled, worker processes reopen the store instead
+        return {'store_dir': self._store_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state['store_dir'])
+
+
+def pack_books(text_dir, store_dir, pg_ids=None):
+    """
+    Pack the normalized text of every book in ``text_dir`` into ``store_dir``, along with the raw
+    bytes of its file for get_raw_text.
+
+    If pg_ids is None every ``<id>_text.txt`` file in text_dir is packed.  The data, raw and index
+    files are written under temporary names and renamed at the end (the index last), so an
+    interrupted pack never leaves a half-written store behind.
+    Returns the number of books packed.
+    """
+    if pg_ids is None:
+        suffix = '_text.txt'
+        pg_ids = sorted(f[:-len(suffix)] for f in os.listdir(text_dir) if f.endswith(suffix))
+
+    os.makedirs(store_dir, exist_ok=True)
+    data_path = os.path.join(store_dir, PACKED_DATA_FILE)
+    raw_path = os.path.join(store_dir, PACKED_RAW_FILE)
+    index_path = os.path.join(store_dir, PACKED_INDEX_FILE)
+
+    num_packed = 0
+    offset = 0
+    raw_offset = 0
+    with open(data_path + '.tmp', 'wb') as data_f, open(raw_path + '.tmp', 'wb') as raw_f, \
+            open(index_path + '.tmp', 'w', encoding='utf-8') as index_f:
+        for pg_id in pg_ids:
+            filename = os.path.join(text_dir, f'{pg_id}_text.txt')
+            if not os.path.exists(filename):
+                continue
+
+            with open(filename, 'rb') as f:
+                raw = f.read()
+
+            data = decode_text(raw).encode('utf-8')
+            data_f.write(data)
+            raw_f.write(raw)
+            index_f.write(f'{pg_id}\t{offset}\t{len(data)}\t{hashlib.sha1(raw).hexdigest()}'
+                          f'\t{raw_offset}\t{len(raw)}\n')
+            offset += len(data)
+            raw_offset += len(raw)
+            num_packed += 1
+
+    os.replace(data_path + '.tmp', data_path)
+    os.replace(raw_path + '.tmp', raw_path)
+    os.replace(index_path + '.tmp', index_path)
+
+    return num_packed
+
+
+def open_book_store(path):
+    """
+    Open a book store from a path: a packed store directory if it contains a packed index,
+    otherwise a directory of ``<id>_text.txt`` files.
+    """
+    if os.path.exists(os.path.join(path, PACKED_INDEX_FILE)):
+        return PackedBookStore(path)
+    return DirectoryBookStore(path)
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) != 3:
+        print('Usage: python -m src.book_store <gutenberg/data/text> <store_dir>')
+        sys.exit(1)
+
+    print(f'Packed {pack_books(sys.argv[1], sys.argv[2])} books into {sys.argv[2]}')
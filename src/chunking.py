@@ -0,0 +1,107 @@
+"""
+Reproducible random chunk sampling over word offsets.
+
+Chunks are drawn as (start, end) word offset windows in one vectorized call per book, from a
+generator seeded by the sampler's seed and the book's PG id, so the same book always gets the same
+chunks for a given seed whatever split or order it is processed in.  Offsets are materialized into
+text (or token) chunks separately, so many chunk configurations can be drawn from one loaded corpus.
+"""
+import zlib
+
+import numpy as np
+
+
+def count_words(text):
+    """
+    Number of space separated words in text, the same as len(text.split(' ')).
+    """
+    return text.count(' ') + 1
+
+
+class ChunkSampler:
+    """
+    Draw num_chunks windows of chunk_size words from a book.
+
+    Without overlap the windows never share a word, with overlap each window is placed
+    independently.  Books too short to hold the windows get a single window over the whole book.
+    Windows are returned in the order they appear in the book.
+    """
+
+    def __init__(self, num_chunks=10, chunk_size=1000, overlap=False, seed=None):
+        self.num_chunks = num_chunks
+        self.chunk_size = chunk_size
+        self.overlap = bool(overlap)
+        self.seed = seed
+
+    def book_rng(self, pg_id=None):
+        """
+        Random generator for one book.  Unseeded samplers draw fresh entropy every time.
+        """
+        if self.seed is None:
+            return np.random.default_rng()
+
+        key = 0 if pg_id is None else zlib.crc32(str(pg_id).encode('utf-8'))
+        return np.random.default_rng([self.seed, key])
+
+    def sample(self, num_words, pg_id=None):
+        """
+        Return a (num_chunks, 2) int64 array of [start, end) word offsets into a book of num_words.
+        """
+        num_chunks = self.num_chunks
+        chunk_size = self.chunk_size
+
+        if num_chunks <= 0 or chunk_size <= 0:
+            return np.zeros((0, 2), dtype=np.int64)
+
+        needed = chunk_size if self.overlap else num_chunks * chunk_size
+        if needed > num_words:
+            return np.array([[0, num_words]], dtype=np.int64)
+
+        rng = self.book_rng(pg_id)
+        if self.overlap:
+            starts = np.sort(rng.integers(0, num_words - chunk_size + 1, size=num_chunks))
+        else:
+            # Choosing num_chunks distinct slots among the free words plus one per chunk, then
+            # spacing them out by chunk_size - 1, places uniformly random non-overlapping windows
+            free = num_words - needed
+            slots = np.sort(rng.choice(free + num_chunks, size=num_chunks, replace=False))
+            starts = slots + np.arange(num_chunks) * (chunk_size - 1)
+
+        starts = starts.astype(np.int64)
+        return np.stack([starts, starts + chunk_size], axis=1)
+
+
+def word_starts(text):
+    """
+    Character offset of the start of each space separated word of text, plus len(text) + 1 as a
+    sentinel, so word i spans text[starts[i]:starts[i + 1] - 1].
+    """
+    # Find the spaces in one vectorized pass over the code points instead of splitting the text
+    code_points = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+    spaces = np.flatnonzero(code_points == ord(' '))
+    return np.concatenate([[0], spaces + 1, [len(text) + 1]])
+
+
+def materialize_chunks(book, offsets):
+    """
+    Build the chunked version of a book from word offsets.
+
+    book is either a text, whose chunks are joined back together with spaces, or a sequence of
+    tokens (a list or an array), whose chunks are concatenated.
+    """
+    if book is None or offsets is None:
+        return book
+
+    if isinstance(book, str):
+        starts = word_starts(book)
+        return ' '.join(book[starts[start]:starts[end] - 1] for start, end in offsets)
+
+    if isinstance(book, np.ndarray):
+        if len(offsets) == 0:
+            return book[:0]
+        return np.concatenate([book[start:end] for start, end in offsets])
+
+    chunked = []
+    for start, end in offsets:
+        chunked.extend(book[start:end])
+    return chunked
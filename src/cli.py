@@ -0,0 +1,159 @@
+"""
+Command-line preprocessing of the splits of a dataset directory, reporting the time of each stage.
+
+    python -m src.cli sample_dataset --gutenberg-repo ../gutenberg --stages load tokenize lemmatize save
+    python -m src.cli sample_dataset --stages enrich --stats-index-path stats.npz
+
+Stages always run in the order of STAGES, whatever order they are given in:
+
+    load       read the split CSVs and the text of their books
+    enrich     add the word and token counts of the books (from the metadata alone if not loading)
+    chunk      replace each book's text with random chunks
+    tokenize   tokenize the text, while it is being read unless it is chunked first
+    lemmatize  lemmatize the tokens (tokenizes and loads first)
+    save       save the dataframes as pickle, Arrow or Parquet files
+
+Only argparse and the standard library are imported up front.  The loader, pandas and NLTK are
+imported once the arguments are parsed, and only by the stages that need them, so short jobs
+such as enriching from a stats index start in a fraction of a second.  Worker processes are
+started from a forkserver that has already imported the loader and the NLTK modules of the
+stages to run, so each worker starts without importing them again.
+"""
+import os
+import time
+import argparse
+import multiprocessing
+
+STAGES = ('load', 'enrich', 'chunk', 'tokenize', 'lemmatize', 'save')
+
+SAVE_FORMATS = ('pickle', 'arrow', 'parquet')
+
+# Modules imported by the forkserver before forking workers, for the worker stages that need them
+FORKSERVER_PRELOAD = {
+    'tokenize': ['nltk.tokenize'],
+    'lemmatize': ['src.lemmatizer', 'nltk.stem', 'nltk.corpus', 'nltk.tag.perceptron'],
+}
+
+
+def resolve_stages(stages):
+    """
+    The stages to run in order, with the stages lemmatize and tokenize depend on added.
+    """
+    stages = set(stages)
+    if 'lemmatize' in stages:
+        stages.add('tokenize')
+    if 'tokenize' in stages or 'chunk' in stages:
+        stages.add('load')
+    return [stage for stage in STAGES if stage in stages]
+
+
+def get_mp_context(start_method, stages):
+    """
+    Multiprocessing context the loader's workers are started with.  A forkserver context
+    preloads the loader and the NLTK modules of the worker stages to run.
+    """
+    if start_method is None:
+        return None
+
+    context = multiprocessing.get_context(start_method)
+    if start_method == 'forkserver':
+        preload = ['src.data_loader']
+        for stage in stages:
+            preload.extend(FORKSERVER_PRELOAD.get(stage, []))
+        context.set_forkserver_preload(preload)
+    return context
+
+
+def run(args):
+    """
+    Run the stages of args, printing the wall time of each.  Returns {stage: seconds}.
+    """
+    stages = resolve_stages(args.stages)
+    timings = {}
+
+    start = time.perf_counter()
+    from src.data_loader import GutenbergDataLoader
+    timings['import'] = time.perf_counter() - start
+
+    # Workers only warm up the NLTK resources of the stages being run
+    warm_up_stages = [name for stage, name in (('tokenize', 'tokenized'), ('lemmatize', 'lemmatized'))
+                      if stage in stages]
+    loader = GutenbergDataLoader(args.data_dir, gutenberg_repo_path=args.gutenberg_repo,
+                                 num_threads=args.num_threads, cache_dir=args.cache_dir,
+                                 stats_index_path=args.stats_index_path, telemetry=args.telemetry,
+                                 tokenizer=args.tokenizer, tag_mode=args.tag_mode,
+                                 mp_context=get_mp_context(args.start_method, stages),
+                                 warm_up_stages=warm_up_stages)
+
+    # Books are tokenized as they are read, unless they are chunked first
+    tokenize_on_load = 'tokenize' in stages and 'chunk' not in stages
+    with loader:
+        for stage in stages:
+            start = time.perf_counter()
+            if stage == 'load':
+                loader.load_splits(skip_first_and_last_words=args.skip_first_and_last_words,
+                                   tokenize=tokenize_on_load)
+            elif stage == 'enrich':
+                if 'load' not in stages:
+                    loader.load_splits(read_text=False)
+                loader.enrich_all_data()
+            elif stage == 'chunk':
+                loader.random_chunk_all_text(num_chunks=args.num_chunks, chunk_size=args.chunk_size,
+                                             seed=args.seed)
+            elif stage == 'tokenize':
+                if tokenize_on_load:
+                    loader.check_tokenized()
+                else:
+                    loader.tokenize_all_text()
+            elif stage == 'lemmatize':
+                loader.lemmatize_all_text()
+            elif stage == 'save':
+                if args.save_path is not None:
+                    os.makedirs(args.save_path, exist_ok=True)
+                if args.save_format == 'pickle':
+                    loader.save_pickle(args.save_path, args.description)
+                else:
+                    loader.save_columnar(args.save_path, args.description, file_format=args.save_format)
+            timings[stage] = time.perf_counter() - start
+            print(f'{stage}: {timings[stage]:.2f}s', flush=True)
+
+    if loader.telemetry is not None:
+        print(loader.telemetry.report().summary())
+
+    return timings
+
+
+def main(argv=None):
+    start = time.perf_counter()
+    default_start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else None
+
+    parser = argparse.ArgumentParser(description='Preprocess the splits of a dataset directory')
+    parser.add_argument('data_dir', help='directory holding the split CSVs')
+    parser.add_argument('--gutenberg-repo', default=None)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=['load', 'tokenize'])
+    parser.add_argument('--num-threads', type=int, default=None)
+    parser.add_argument('--skip-first-and-last-words', type=int, default=100)
+    parser.add_argument('--num-chunks', type=int, default=10)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--save-format', choices=SAVE_FORMATS, default='pickle')
+    parser.add_argument('--save-path', default=None)
+    parser.add_argument('--description', default=None)
+    parser.add_argument('--stats-index-path', default=None)
+    parser.add_argument('--cache-dir', default=None)
+    parser.add_argument('--tokenizer', default='nltk')
+    parser.add_argument('--tag-mode', choices=('book', 'sentence', 'lexicon'), default='book')
+    parser.add_argument('--telemetry', action='store_true')
+    parser.add_argument('--start-method', choices=multiprocessing.get_all_start_methods(),
+                        default=default_start_method)
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.data_dir):
+        parser.error(f'data directory not found: {args.data_dir}')
+
+    timings = run(args)
+    print(f"import: {timings['import']:.2f}s, total: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
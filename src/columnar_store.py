@@ -0,0 +1,235 @@
+"""
+Columnar storage of the loader's split DataFrames, as Arrow IPC or Parquet files.
+
+Text is stored as a string column and token lists as Arrow list arrays (of strings, or of int32
+ids for encoded columns), so no column needs to be unpickled or eval'd back.  Reads can be limited
+to some columns and to the rows of some authors or ids, and Arrow IPC files are memory-mapped, so
+only the parts of the file actually used are read from disk.
+
+Requires pyarrow.
+"""
+import os
+import ast
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+# Columns stored batch by batch rather than converted all at once, since they hold most of the data
+TEXT_COLUMNS = ('text',)
+TOKEN_COLUMNS = ('tokenized', 'lemmatized')
+
+# File extension of each format
+FORMATS = {'arrow': '.arrow', 'parquet': '.parquet'}
+
+# Rows per record batch (Arrow) or row group (Parquet)
+BATCH_ROWS = 256
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError('Columnar storage requires pyarrow: pip install pyarrow') from e
+    return pyarrow
+
+
+def parse_token_list(value):
+    """
+    A token column value as a list of tokens or an array of ids.  Lists stored as their string
+    representation (as older pickles did) are parsed back, missing values are None.
+    """
+    if value is None or isinstance(value, float):
+        return None
+    if isinstance(value, str):
+        return ast.literal_eval(value)
+    return value
+
+
+def _list_type(values):
+    pa = _pyarrow()
+    if any(isinstance(value, np.ndarray) for value in values):
+        return pa.large_list(pa.int32())
+    return pa.large_list(pa.large_string())
+
+
+def _list_array(values, list_type):
+    """
+    Build a list array from token lists or id arrays, None for missing rows.
+    """
+    pa = _pyarrow()
+    values = [parse_token_list(value) for value in values]
+    mask = np.array([value is None for value in values])
+    lengths = np.array([0 if value is None else len(value) for value in values], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+    present = [value for value in values if value is not None]
+    if pa.types.is_int32(list_type.value_type):
+        flat = pa.array(np.concatenate(present) if present else np.empty(0), type=pa.int32())
+    else:
+        flat = pa.array(chain.from_iterable(present), type=pa.large_string(), size=int(offsets[-1]))
+
+    return pa.LargeListArray.from_arrays(pa.array(offsets), flat, type=list_type,
+                                         mask=pa.array(mask) if mask.any() else None)
+
+
+def _batches(df):
+    """
+    Yield the record batches of df, along with their shared schema.
+    """
+    pa = _pyarrow()
+    bulk = [column for column in df.columns if column in TEXT_COLUMNS or column in TOKEN_COLUMNS]
+
+    # The metadata is small, convert it at once so its types are consistent across batches
+    metadata = pa.Table.from_pandas(df.drop(columns=bulk), preserve_index=True)
+    bulk_fields = {}
+    for column in bulk:
+        if column in TOKEN_COLUMNS:
+            bulk_fields[column] = pa.field(column, _list_type(df[column].tolist()))
+        else:
+            bulk_fields[column] = pa.field(column, pa.large_string())
+
+    # Keep the DataFrame's column order, with the index columns last as from_pandas stores them
+    names = list(df.columns) + [name for name in metadata.column_names if name not in df.columns]
+    fields = [bulk_fields[name] if name in bulk_fields else metadata.schema.field(name) for name in names]
+    schema = pa.schema(fields, metadata=metadata.schema.metadata)
+
+    def batches():
+        for start in range(0, max(len(df), 1), BATCH_ROWS):
+            stop = start + BATCH_ROWS
+            arrays = []
+            for field in fields:
+                if field.name not in bulk_fields:
+                    arrays.append(metadata[field.name].slice(start, BATCH_ROWS).combine_chunks())
+                    continue
+
+                values = df[field.name].iloc[start:stop].tolist()
+                if field.name in TOKEN_COLUMNS:
+                    arrays.append(_list_array(values, field.type))
+                else:
+                    arrays.append(pa.array([value if isinstance(value, str) else None for value in values],
+                                           type=field.type))
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    return schema, batches()
+
+
+def save_frame(df, path, file_format='arrow', compression=None):
+    """
+    Save a split DataFrame to path as an Arrow IPC ('arrow') or Parquet ('parquet') file, replacing
+    any previous file atomically.  Arrow files are uncompressed by default so they can be read
+    back by memory-mapping them, Parquet files are zstd compressed.
+    """
+    pa = _pyarrow()
+    if file_format not in FORMATS:
+        raise ValueError(f'file_format must be one of {sorted(FORMATS)}, not {file_format!r}')
+
+    schema, batches = _batches(df)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    if file_format == 'arrow':
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, schema, options=options) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+    else:
+        import pyarrow.parquet as pq
+        with pq.ParquetWriter(tmp_path, schema, compression=compression or 'zstd') as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+    os.replace(tmp_path, path)
+
+
+def read_table(path, columns=None, authors=None, ids=None, memory_map=True):
+    """
+    Read a file written by save_frame as a pyarrow Table.
+
+    columns: only read these columns (the index is always included).
+    authors, ids: only keep the rows whose 'author' / 'id' is one of these.
+    memory_map: memory-map the file instead of reading it.  For Arrow files the table's
+    buffers then point into the mapping, so nothing is copied until a column is used.
+    """
+    pa = _pyarrow()
+    import pyarrow.compute as pc
+
+    filters = {name: values for name, values in (('author', authors), ('id', ids)) if values is not None}
+
+    if str(path).endswith(FORMATS['parquet']):
+        import pyarrow.parquet as pq
+        schema = pq.read_schema(path)
+    else:
+        source = pa.memory_map(str(path)) if memory_map else pa.OSFile(str(path))
+        table = pa.ipc.open_file(source).read_all()
+        schema = table.schema
+
+    if columns is not None:
+        pandas_metadata = schema.pandas_metadata or {}
+        index_columns = [name for name in pandas_metadata.get('index_columns', []) if isinstance(name, str)]
+        columns = list(dict.fromkeys(index_columns + list(columns)))
+        missing = set(columns) - set(schema.names)
+        if missing:
+            raise KeyError(f'{path} has no columns {sorted(missing)}')
+
+    if str(path).endswith(FORMATS['parquet']):
+        read_columns = None if columns is None else list(dict.fromkeys(columns + list(filters)))
+        table = pq.read_table(path, columns=read_columns, memory_map=memory_map,
+                              filters=[(name, 'in', list(values)) for name, values in filters.items()] or None)
+    elif filters:
+        # Drop the unused columns first so filtering only copies the rows of the columns we keep
+        if columns is not None:
+            table = table.select(list(dict.fromkeys(columns + list(filters))))
+        for name, values in filters.items():
+            table = table.filter(pc.is_in(table[name], value_set=pa.array(list(values), type=table[name].type)))
+
+    if columns is not None:
+        table = table.select(columns)
+    return table
+
+
+def _token_column(column):
+    """
+    Convert a list column to a list of token lists, or of int32 id arrays (views into the table).
+    """
+    pa = _pyarrow()
+    books = []
+    for chunk in column.chunks:
+        offsets = chunk.offsets.to_numpy()
+        valid = chunk.is_valid().to_numpy(zero_copy_only=False)
+        if pa.types.is_int32(chunk.type.value_type):
+            values = chunk.values.to_numpy()
+        else:
+            values = chunk.values.slice(offsets[0], offsets[-1] - offsets[0]).to_pylist()
+            offsets = offsets - offsets[0]
+        books.extend(values[offsets[i]:offsets[i + 1]] if valid[i] else None for i in range(len(chunk)))
+
+    return books
+
+
+def read_frame(path, columns=None, authors=None, ids=None, memory_map=True):
+    """
+    Read a file written by save_frame as a DataFrame, with the same arguments as read_table.
+    Token columns come back as lists of tokens, or as int32 arrays of ids for encoded columns.
+    """
+    table = read_table(path, columns=columns, authors=authors, ids=ids, memory_map=memory_map)
+
+    token_columns = [name for name in table.column_names if name in TOKEN_COLUMNS]
+    df = table.drop_columns(token_columns).to_pandas()
+    for name in token_columns:
+        # Fill an object array so equal-length id arrays aren't stacked into a 2D array
+        books = np.empty(len(df), dtype=object)
+        books[:] = _token_column(table[name])
+        df[name] = books
+
+    # Keep the stored column order
+    return df[[name for name in table.column_names if name in df.columns]]
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) != 3:
+        print('Usage: python -m src.columnar_store <split_df.pkl> <split_df.arrow|.parquet>')
+        sys.exit(1)
+
+    out_format = 'parquet' if sys.argv[2].endswith(FORMATS['parquet']) else 'arrow'
+    save_frame(pd.read_pickle(sys.argv[1]), sys.argv[2], file_format=out_format)
+    print(f'Converted {sys.argv[1]} to {sys.argv[2]}')
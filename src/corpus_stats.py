@@ -0,0 +1,244 @@
+"""
+Corpus-wide table of per-book statistics, keyed by PG id.
+
+Each book's counts, text and token files are scanned once, in parallel, and the word count,
+unique word count, line count and token count are stored together as columns of a table that can
+be saved and reloaded.  Enriching a split is then a lookup in the table instead of several file
+opens per book.
+
+Along with its stats, each book keeps the size and modification time of the files they were
+scanned from.  Looking books up never touches their files: refresh is the explicit, parallel
+check that scans the books whose files have changed again.
+"""
+import os
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from tqdm.contrib.concurrent import process_map
+
+STATS_COLUMNS = ('word_count', 'unique_word_count', 'line_count', 'token_count')
+
+# Files of a book whose (size, mtime_ns) make up its signature
+SIGNATURE_FILES = (('counts', '_counts.txt'), ('text', '_text.txt'), ('tokens', '_tokens.txt'))
+
+# Signature entry of a missing file, and of books loaded from an index saved without signatures
+MISSING_FILE = -1
+UNKNOWN = -2
+
+# Fewer books than this are scanned in this process, starting worker processes would cost more
+MIN_PARALLEL_BOOKS = 16
+
+
+def _count_lines(file_path):
+    """
+    Count the lines of a file as iterating over it in text mode does: '\r\n', '\r' and '\n' all end
+    a line, and a last line without a line ending counts too.
+    """
+    with open(file_path, 'rb') as f:
+        data = f.read()
+
+    if not data:
+        return 0
+    data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    return data.count(b'\n') + (0 if data.endswith(b'\n') else 1)
+
+
+def book_signature(gutenberg_data_path, pg_id):
+    """
+    (size, mtime_ns) of each of the book's SIGNATURE_FILES, flattened, MISSING_FILE for both
+    if a file doesn't exist.
+    """
+    signature = []
+    for directory, suffix in SIGNATURE_FILES:
+        try:
+            stat = os.stat(os.path.join(gutenberg_data_path, directory, f'{pg_id}{suffix}'))
+        except FileNotFoundError:
+            signature.extend((MISSING_FILE, MISSING_FILE))
+        else:
+            signature.extend((stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+def scan_book(gutenberg_data_path, pg_id):
+    """
+    Scan the counts, text and token files of one book, returning its
+    (word_count, unique_word_count, line_count, token_count).  Stats of missing files are None.
+    """
+    word_count = None
+    unique_word_count = None
+    counts_path = os.path.join(gutenberg_data_path, 'counts', f'{pg_id}_counts.txt')
+    if os.path.exists(counts_path):
+        # Each line looks like: word count
+        word_count = 0
+        unique_word_count = 0
+        with open(counts_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                word_count += int(line.split()[1])
+                unique_word_count += 1
+
+    line_count = None
+    text_path = os.path.join(gutenberg_data_path, 'text', f'{pg_id}_text.txt')
+    if os.path.exists(text_path):
+        line_count = _count_lines(text_path)
+
+    token_count = None
+    token_path = os.path.join(gutenberg_data_path, 'tokens', f'{pg_id}_tokens.txt')
+    if os.path.exists(token_path):
+        token_count = _count_lines(token_path)
+
+    return word_count, unique_word_count, line_count, token_count
+
+
+def scan_book_and_signature(gutenberg_data_path, pg_id):
+    """
+    (book_signature, scan_book) of one book, the signature taken first so a file changing
+    during the scan is seen as changed by the next refresh.
+    """
+    return book_signature(gutenberg_data_path, pg_id), scan_book(gutenberg_data_path, pg_id)
+
+
+def _map(func, items, num_threads, pool, desc):
+    if pool is not None:
+        return pool.map(func, items, desc=desc)
+    if len(items) < MIN_PARALLEL_BOOKS:
+        return [func(item) for item in items]
+    return process_map(func, items, max_workers=num_threads, chunksize=64)
+
+
+class CorpusStatsIndex:
+    """
+    Columnar table of STATS_COLUMNS keyed by PG id.  Missing stats are stored as NaN.
+    signatures holds the book_signature each book was scanned with, books without one (UNKNOWN)
+    are scanned again by the next refresh.
+    """
+
+    def __init__(self, ids=(), columns=None, signatures=None):
+        self._ids = np.asarray(ids, dtype=str)
+        if columns is None:
+            columns = {name: np.empty(0) for name in STATS_COLUMNS}
+        # Copies, update writes changed books' rows in place
+        self._columns = {name: np.array(columns[name], dtype=np.float64) for name in STATS_COLUMNS}
+        if signatures is None:
+            signatures = np.full((len(self._ids), 2 * len(SIGNATURE_FILES)), UNKNOWN)
+        self._signatures = np.array(signatures, dtype=np.int64).reshape(len(self._ids), 2 * len(SIGNATURE_FILES))
+        self._positions = {pg_id: i for i, pg_id in enumerate(self._ids)}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, pg_id):
+        return pg_id in self._positions
+
+    def missing(self, pg_ids):
+        """
+        Return the PG ids that are not in the index yet, without duplicates.
+        """
+        return list(dict.fromkeys(pg_id for pg_id in pg_ids if pg_id not in self._positions))
+
+    def update(self, gutenberg_data_path, pg_ids, num_threads=None, pool=None):
+        """
+        Scan the books of pg_ids that aren't in the index yet and add them, on pool (a WorkerPool)
+        if one is given.  Books already in the index are left as they are, see refresh.
+        Returns the number of books scanned.
+        """
+        return self._scan(gutenberg_data_path, self.missing(pg_ids), num_threads, pool)
+
+    def refresh(self, gutenberg_data_path, pg_ids=None, num_threads=None, pool=None):
+        """
+        Scan again the books of pg_ids (by default every book in the index) whose files have
+        changed since they were scanned, or that were loaded from an index saved without
+        signatures, checking the files in parallel.  Books none of whose files can be found are
+        left alone, so an index can be used without the corpus.  Returns the number of books scanned.
+        """
+        pg_ids = list(self._positions) if pg_ids is None else list(dict.fromkeys(pg_ids))
+        indexed = [pg_id for pg_id in pg_ids if pg_id in self._positions]
+        signatures = _map(partial(book_signature, gutenberg_data_path), indexed, num_threads, pool,
+                          'stats signatures')
+
+        changed = [pg_id for pg_id, signature in zip(indexed, signatures)
+                   if any(value != MISSING_FILE for value in signature)
+                   and tuple(self._signatures[self._positions[pg_id]].tolist()) != signature]
+        return self._scan(gutenberg_data_path, changed, num_threads, pool)
+
+    def _scan(self, gutenberg_data_path, scan_ids, num_threads, pool):
+        """
+        Scan the books of scan_ids, replacing their stats if they are in the index and adding
+        them otherwise.  Returns the number of books scanned.
+        """
+        if not scan_ids:
+            return 0
+
+        results = _map(partial(scan_book_and_signature, gutenberg_data_path), scan_ids, num_threads, pool,
+                       'stats')
+        signatures = np.array([signature for signature, _ in results], dtype=np.int64).reshape(len(scan_ids), -1)
+        stats = np.array([[np.nan if value is None else value for value in row] for _, row in results],
+                         dtype=np.float64).reshape(len(scan_ids), len(STATS_COLUMNS))
+
+        # Changed books are replaced in place, new ones appended
+        positions = np.array([self._positions.get(pg_id, -1) for pg_id in scan_ids], dtype=np.int64)
+        changed = positions >= 0
+        new = ~changed
+        new_ids = [pg_id for pg_id, is_new in zip(scan_ids, new) if is_new]
+
+        for i, name in enumerate(STATS_COLUMNS):
+            self._columns[name][positions[changed]] = stats[changed, i]
+            self._columns[name] = np.concatenate([self._columns[name], stats[new, i]])
+        self._signatures[positions[changed]] = signatures[changed]
+        self._signatures = np.concatenate([self._signatures, signatures[new]])
+        self._ids = np.concatenate([self._ids, np.asarray(new_ids, dtype=str)])
+        for pg_id in new_ids:
+            self._positions[pg_id] = len(self._positions)
+
+        return len(scan_ids)
+
+    def get(self, pg_id):
+        """
+        The stats of one book as {column: value}, None for missing stats, or None if the book
+        isn't in the index.
+        """
+        position = self._positions.get(pg_id)
+        if position is None:
+            return None
+        values = (self._columns[name][position] for name in STATS_COLUMNS)
+        return {name: None if np.isnan(value) else int(value) for name, value in zip(STATS_COLUMNS, values)}
+
+    def to_frame(self):
+        """
+        Return the table as a DataFrame indexed by PG id.
+        """
+        return pd.DataFrame(self._columns, index=pd.Index(self._ids, name='id'))
+
+    def enrich(self, df):
+        """
+        Add the STATS_COLUMNS of the books in df['id'] to df.  Columns with no missing values are
+        integers, otherwise floats with NaN, the same as computing them row by row.
+        """
+        positions = np.array([self._positions.get(pg_id, -1) for pg_id in df['id']], dtype=np.int64)
+        found = positions >= 0
+        for name in STATS_COLUMNS:
+            values = np.full(len(df), np.nan)
+            values[found] = self._columns[name][positions[found]]
+            if not np.isnan(values).any():
+                values = values.astype(np.int64)
+            df[name] = values
+
+        return df
+
+    def save(self, path):
+        """
+        Save the table to a .npz file, replacing any previous file atomically.
+        """
+        tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp_path, id=self._ids, signature=self._signatures, **self._columns)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a table saved with save.  The books of tables saved before signatures were stored
+        are scanned again by the next refresh.
+        """
+        with np.load(path) as data:
+            signatures = data['signature'] if 'signature' in data.files else None
+            return cls(data['id'], {name: data[name] for name in STATS_COLUMNS}, signatures)
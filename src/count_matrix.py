@@ -0,0 +1,230 @@
+"""
+Sparse book x term count matrix built from the SPGC counts files.
+
+Each data/counts/<id>_counts.txt already holds a book's word counts, one "word count" line per
+distinct word.  The files are parsed in parallel into word and count arrays, the parent merges the
+words of each batch of files with one np.unique and interns only the distinct ones into a
+Vocabulary (whose ids are the matrix columns), then appends the books as CSR rows, so vocabulary
+statistics, bag-of-words baselines and feature filtering never touch the raw text.  Rows can be
+summed into author x term (or any other grouping) counts with one sparse product.
+
+Saved as a directory of .npy arrays plus the vocabulary, which load memory-maps:
+
+    data.npy, indices.npy, indptr.npy   the CSR arrays
+    ids.npy                             PG id of each row
+    vocabulary.json                     token of each column
+"""
+import os
+from functools import partial
+
+import numpy as np
+import scipy.sparse as sp
+from tqdm.contrib.concurrent import process_map
+
+from src.vocabulary import Vocabulary
+
+# Books parsed per round, bounds the parsed files held in the parent at once
+BATCH_BOOKS = 2048
+
+CSR_ARRAYS = ('data', 'indices', 'indptr')
+IDS_FILE = 'ids.npy'
+VOCABULARY_FILE = 'vocabulary.json'
+
+
+def counts_path(gutenberg_data_path, pg_id):
+    """
+    Path of a book's counts file.
+    """
+    return os.path.join(gutenberg_data_path, 'counts', f'{pg_id}_counts.txt')
+
+
+def read_counts(gutenberg_data_path, pg_id):
+    """
+    Parse a book's counts file into (str array of words, int32 counts), or None if it is missing.
+    """
+    path = counts_path(gutenberg_data_path, pg_id)
+    if not os.path.exists(path):
+        return None
+
+    words = []
+    counts = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            # Each line looks like: word count
+            fields = line.split()
+            if len(fields) < 2:
+                continue
+            words.append(fields[0])
+            counts.append(int(fields[1]))
+
+    return np.array(words, dtype=str), np.array(counts, dtype=np.int32)
+
+
+def _save_npy(path, array):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class CountMatrix:
+    """
+    CSR matrix of word counts, one row per book (ids) and one column per vocabulary token.
+    """
+
+    def __init__(self, ids, vocabulary, matrix):
+        self.ids = np.asarray(ids, dtype=str)
+        self.vocabulary = vocabulary
+        self.matrix = matrix
+        self._positions = None
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @classmethod
+    def build(cls, gutenberg_data_path, pg_ids, num_threads=None, pool=None, vocabulary=None):
+        """
+        Parse the counts files of pg_ids on pool (a WorkerPool) if one is given, else in a
+        process_map.  Books without a counts file are left out of the matrix.  New words are added
+        to vocabulary if one is given, so matrices built over the same vocabulary share columns.
+        The new words of each batch of books get ids in sorted order.
+        """
+        vocabulary = Vocabulary() if vocabulary is None else vocabulary
+        func = partial(read_counts, gutenberg_data_path)
+
+        ids = []
+        row_lengths = []
+        batch_columns = []
+        batch_counts = []
+        for start in range(0, len(pg_ids), BATCH_BOOKS):
+            batch = list(pg_ids[start:start + BATCH_BOOKS])
+            if pool is not None:
+                # File sizes drive the scheduling, missing files weigh nothing
+                weights = [os.path.getsize(path) if os.path.exists(path) else 0
+                           for path in (counts_path(gutenberg_data_path, pg_id) for pg_id in batch)]
+                rows = pool.map(func, batch, weights=weights, desc='counts', labels=batch)
+            else:
+                rows = process_map(func, batch, max_workers=num_threads, chunksize=16, desc='counts')
+
+            found = [(pg_id, row) for pg_id, row in zip(batch, rows) if row is not None]
+            if not found:
+                continue
+            ids.extend(pg_id for pg_id, _ in found)
+            row_lengths.extend(len(words) for _, (words, _) in found)
+
+            # Only the distinct words of the batch go through the vocabulary
+            unique_words, inverse = np.unique(np.concatenate([words for _, (words, _) in found]),
+                                              return_inverse=True)
+            batch_columns.append(vocabulary.encode(unique_words.tolist())[inverse.ravel()])
+            batch_counts.append(np.concatenate([counts for _, (_, counts) in found]))
+
+        indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(row_lengths, out=indptr[1:])
+        indices = np.concatenate(batch_columns) if batch_columns else np.empty(0, dtype=np.int32)
+        data = np.concatenate(batch_counts) if batch_counts else np.empty(0, dtype=np.int32)
+
+        matrix = sp.csr_matrix((data, indices, indptr), shape=(len(ids), len(vocabulary)))
+        # Sorts each row's columns, and a word listed twice in a counts file is counted once with both counts
+        matrix.sum_duplicates()
+        return cls(ids, vocabulary, matrix)
+
+    def rows(self, pg_ids):
+        """
+        Row positions of pg_ids, -1 for ids not in the matrix.
+        """
+        if self._positions is None:
+            self._positions = {pg_id: i for i, pg_id in enumerate(self.ids.tolist())}
+        return np.array([self._positions.get(pg_id, -1) for pg_id in pg_ids], dtype=np.int64)
+
+    def aggregate(self, labels):
+        """
+        Sum the rows by label (one label per row, e.g. the author of each book).
+        Returns (unique labels, CSR matrix with one int64 row per label).
+        """
+        labels = np.asarray(labels)
+        if len(labels) != self.matrix.shape[0]:
+            raise ValueError(f'Expected one label per row ({self.matrix.shape[0]}), got {len(labels)}')
+
+        unique_labels, groups = np.unique(labels, return_inverse=True)
+        indicator = sp.csr_matrix((np.ones(len(groups), dtype=np.int64), (groups, np.arange(len(groups)))),
+                                  shape=(len(unique_labels), len(groups)))
+        return unique_labels, (indicator @ self.matrix).tocsr()
+
+    def aggregate_by(self, df, column='author'):
+        """
+        Sum the rows of the books in df (with 'id' and column) by df[column], e.g. into author x
+        term counts.  Books of df that aren't in the matrix are ignored, books listed more than
+        once are counted once.
+        """
+        df = df.drop_duplicates('id')
+        positions = self.rows(df['id'])
+        found = positions >= 0
+        selected = positions[found]
+        subset = CountMatrix(self.ids[selected], self.vocabulary, self.matrix[selected])
+        return subset.aggregate(df[column].to_numpy()[found].astype(str))
+
+    def term_totals(self):
+        """
+        Total count of each term over all books.
+        """
+        return np.asarray(self.matrix.sum(axis=0, dtype=np.int64)).ravel()
+
+    def doc_freq(self):
+        """
+        Number of books each term appears in.
+        """
+        return np.bincount(self.matrix.indices, minlength=self.matrix.shape[1])
+
+    def select_terms(self, min_df=1, max_df=1.0, min_count=1, max_features=None):
+        """
+        Column positions of the terms in at least min_df books and at most max_df books (a
+        fraction of the books if a float), with a total count of at least min_count, keeping the
+        max_features most frequent if given.  Same conventions as CountVectorizer.
+        """
+        num_books = self.matrix.shape[0]
+        doc_freq = self.doc_freq()
+        totals = self.term_totals()
+        if isinstance(min_df, float):
+            min_df = min_df * num_books
+        if isinstance(max_df, float):
+            max_df = max_df * num_books
+
+        columns = np.flatnonzero((doc_freq >= min_df) & (doc_freq <= max_df) & (totals >= min_count))
+        if max_features is not None and len(columns) > max_features:
+            # Most frequent first, ties broken by column as CountVectorizer does
+            order = np.lexsort((columns, -totals[columns]))
+            columns = np.sort(columns[order[:max_features]])
+        return columns
+
+    def select(self, columns):
+        """
+        A CountMatrix over only the given term columns, with its own vocabulary.
+        """
+        columns = np.asarray(columns)
+        vocabulary = Vocabulary(self.vocabulary.decode(columns))
+        return CountMatrix(self.ids, vocabulary, self.matrix[:, columns].tocsr())
+
+    def save(self, directory):
+        """
+        Save the matrix to directory, replacing any previous files atomically one by one.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in CSR_ARRAYS:
+            _save_npy(os.path.join(directory, f'{name}.npy'), getattr(self.matrix, name))
+        _save_npy(os.path.join(directory, IDS_FILE), self.ids)
+        self.vocabulary.save(os.path.join(directory, VOCABULARY_FILE))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Load a matrix saved with save.  With mmap, the CSR arrays are memory-mapped read-only
+        rather than read, so loading is instant and only the rows used are paged in.
+        """
+        mmap_mode = 'r' if mmap else None
+        data, indices, indptr = (np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+                                 for name in CSR_ARRAYS)
+        ids = np.load(os.path.join(directory, IDS_FILE))
+        vocabulary = Vocabulary.load(os.path.join(directory, VOCABULARY_FILE))
+        matrix = sp.csr_matrix((data, indices, indptr), shape=(len(ids), len(vocabulary)), copy=False)
+        return cls(ids, vocabulary, matrix)
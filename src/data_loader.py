@@ -1,32 +1,144 @@
 import os
-import random
+import time
 from pathlib import Path
+from contextlib import nullcontext
 
-import pandas as pd
 import numpy as np
-from tqdm.contrib.concurrent import process_map
-from nltk.tokenize import word_tokenize
-from nltk import pos_tag
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-from nltk.corpus import wordnet as wn
-from collections import defaultdict
+from functools import partial
 
+from src.book_store import DirectoryBookStore, open_book_store
+from src.stage_cache import StageCache, make_cache_key
+from src.chunking import ChunkSampler, count_words, materialize_chunks
+from src.lemmatizer import LemmatizerEngine, lemmatize_tokens, lemmatize_tokens_with_memo
+from src.vocabulary import Vocabulary, decode_local, encode_local
+from src.prefetch import MissingBooksError, prefetch_books
+from src.tokenizers import NLTK_VERSION, NLTKTokenizer, get_tokenizer
+from src.pos_tagging import TAG_MODES
+from src.worker_pool import WorkerPool, warm_up_worker
 
+# pandas and the modules of the optional stages (stats index, telemetry, columnar files, shards,
+# stylometry, subword cache, duplicates) are imported by the methods that use them, so importing
+# the loader, in the CLI and in every worker process, stays cheap.
+
+# Default split CSVs, in the order they are loaded
+DEFAULT_SPLIT_CSVS = {'train': 'final_train.csv', 'val': 'final_val.csv', 'test': 'final_test.csv'}
+
+# Pipeline stages that iter_books can produce, in order
+STAGES = ('text', 'tokenized', 'lemmatized')
+
+# Rough number of bytes of Python objects held per character of raw text once a stage has run.
+# Used by iter_books to size batches against its memory budget.
+_STAGE_MEMORY_FACTOR = {'text': 2, 'tokenized': 16, 'lemmatized': 24}
+
+# Versions of the code producing each stage, part of the stage cache keys.
+# Bump these whenever a change to the pipeline changes a stage's output.  The tokenizer backend's
+# own version is added to both, since lemmas are computed from its tokens.
+TOKENIZER_VERSION = NLTKTokenizer.version
+LEMMATIZER_VERSION = f'nltk-{NLTK_VERSION}-wordnet-2'
+
+
+def _stage_versions(tokenizer, tag_mode='book'):
+    """
+    Version of each stage's output when books are tokenized with tokenizer and POS tagged in
+    tag_mode for lemmatization.
+    """
+    lemmatizer_version = LEMMATIZER_VERSION if tag_mode == 'book' else f'{LEMMATIZER_VERSION}-tags-{tag_mode}'
+    return {'tokenized': tokenizer.version, 'lemmatized': f'{lemmatizer_version}|{tokenizer.version}'}
+
+
+def trim_words(text, num_words):
+    """
+    Drop the first and last num_words space separated words of text.
+
+    Gives the same result as ' '.join(text.split(' ')[num_words:-num_words]), but scans for the
+    boundary spaces instead of building the full word list, so only the kept slice is copied.
+    """
+    if num_words <= 0:
+        return text
+
+    start = -1
+    for _ in range(num_words):
+        start = text.find(' ', start + 1)
+        if start == -1:
+            return ''
+
+    end = len(text)
+    for _ in range(num_words):
+        end = text.rfind(' ', 0, end)
+        if end == -1:
+            return ''
+
+    if start >= end:
+        return ''
+    return text[start + 1:end]
+
+
+def _tokenize_book(text, encode=False, tokenizer=None):
+    """
+    Tokenize one book in a worker process (with nltk.word_tokenize unless another tokenizer
+    backend is given), as a (types, codes) pair if encode is set.
+    """
+    tokens = (tokenizer or NLTKTokenizer())(text)
+    return encode_local(tokens) if encode else tokens
+
+
+def _lemmatize_book(tokens, memo_path=None, encode=False, tag_mode='book'):
+    """
+    Lemmatize one book in a worker process, taking and returning (types, codes) pairs if encode
+    is set.  Also returns the memo entries the worker added when the memo table is persisted.
+    """
+    if encode:
+        tokens = decode_local(*tokens)
+
+    new_entries = None
+    if memo_path is None:
+        lemmas = lemmatize_tokens(tokens, tag_mode=tag_mode)
+    else:
+        lemmas, new_entries = lemmatize_tokens_with_memo(tokens, memo_path, tag_mode=tag_mode)
+
+    return (encode_local(lemmas) if encode else lemmas), new_entries
+
+
+def _stylometry_book(book, tokenizer=None, encode=False):
+    """
+    Stylometric features of one (text, tokens or None, chunk offsets or None) book in a worker
+    process, tokens being a (types, codes) pair if encode is set.
+    """
+    from src.stylometry import book_features
+
+    text, tokens, offsets = book
+    if encode and tokens is not None:
+        tokens = decode_local(*tokens)
+    return book_features(text, tokenizer or NLTKTokenizer(), tokens=tokens, offsets=offsets)
+
+
+def _book_weights(books):
+    """
+    Scheduling weight of each book, its length (characters of text or number of tokens).
+    """
+    return [len(book) if hasattr(book, '__len__') else 1 for book in books]
 
 
 class GutenbergDataLoader:
     """
     GutenbergDataLoader class to handle loading and preprocessing of datasets.
+
+    The worker processes are started from a forkserver (or with spawn) rather than forked, so
+    they import the main module again: scripts using the loader's processing stages must create
+    and use it under ``if __name__ == '__main__':``, notebooks need nothing special.
     """
 
     def __init__(self, data_dir='sample_dataset',
-                 gutenberg_repo_path=None, num_threads=None):
+                 gutenberg_repo_path=None, num_threads=None, book_store=None,
+                 cache_dir=None, cache_max_bytes=8 * 2**30, lemma_memo_path=None,
+                 stats_index_path=None, encode_tokens=False, prefetch_depth=32, io_threads=8,
+                 on_missing='warn', telemetry=None, tokenizer='nltk', tag_mode='book', mp_context=None,
+                 warm_up_stages=None):
 
         self._data_dir = data_dir
         self._num_threads = num_threads
         if num_threads is None:
-            self._num_threads = os.cpu_count() - 1
+            self._num_threads = max(os.cpu_count() - 1, 1)
 
         # If a custom Gutenberg repository path is provided, use it
         if gutenberg_repo_path is not None:
@@ -40,188 +152,569 @@ class GutenbergDataLoader:
 
         self._gutenberg_data_path = os.path.join(gutenberg_repo_path, 'data')
 
+        # Books are read through a book store, either the SPGC text directory (default), a
+        # packed store written by src.book_store.pack_books, or a store object passed in directly
+        if book_store is None:
+            book_store = DirectoryBookStore(os.path.join(self._gutenberg_data_path, 'text'))
+        elif isinstance(book_store, (str, os.PathLike)):
+            book_store = open_book_store(book_store)
+        self._book_store = book_store
+
+        # Books are read with up to prefetch_depth reads in flight on io_threads threads (0 reads
+        # them one at a time).  Books that can't be found are reported per split in missing_ids,
+        # and either warned about or raised as a MissingBooksError, depending on on_missing.
+        if on_missing not in ('warn', 'raise'):
+            raise ValueError(f"on_missing must be 'warn' or 'raise', not {on_missing!r}")
+        self._prefetch_depth = prefetch_depth
+        self._io_threads = io_threads
+        self._on_missing = on_missing
+        self.missing_ids = {}
+
+        # Optional on-disk cache of tokenized and lemmatized books, so reruns only process
+        # books whose output isn't cached yet
+        self._cache = None
+        if cache_dir is not None:
+            self._cache = StageCache(cache_dir, max_bytes=cache_max_bytes)
+        self._content_hashes = {}
+        # Number of words trimmed from the books of the splits, part of their cache keys.  None when
+        # it isn't known (splits loaded from saved files), their stages are then not cached.
+        self._skip_first_and_last_words = None
+        # Whether a column of the splits has been chunked, chunked splits aren't cached either
+        self._splits_chunked = False
+
+        # Optional file the lemmatizer's (word, POS) -> lemma memo table is persisted to between runs
+        self._lemma_memo_path = lemma_memo_path
+
+        # Corpus-wide per-book stats used by _enrich_dataframe, optionally persisted as a .npz file
+        self._stats_index_path = stats_index_path
+        self._stats_index = None
+
+        # Optionally store tokenized and lemmatized books as int32 arrays of ids into a
+        # corpus-wide vocabulary instead of lists of strings
+        self._encode_tokens = encode_tokens
+        self.vocabulary = Vocabulary() if encode_tokens else None
+
+        # Tokenizer backend, 'nltk' (nltk.word_tokenize), 'fast' (see src.tokenizers) or a backend
+        # object.  Its version is part of the cache keys of the tokenized and lemmatized stages.
+        self._tokenizer = get_tokenizer(tokenizer)
+
+        # How tokens are POS tagged for lemmatization: 'book' (exactly nltk.pos_tag over the whole
+        # book), or the faster 'sentence' or 'lexicon', which change some tags and so some lemmas
+        # (see src.pos_tagging)
+        if tag_mode not in TAG_MODES:
+            raise ValueError(f'tag_mode must be one of {TAG_MODES}, not {tag_mode!r}')
+        self._tag_mode = tag_mode
+        self._stage_versions = _stage_versions(self._tokenizer, tag_mode)
+
+        # Optional per-stage timings, book latencies and profiling (a LoaderTelemetry, or True
+        # for one with the default settings).  Its report is available from telemetry.report().
+        if telemetry is True:
+            from src.telemetry import LoaderTelemetry
+            telemetry = LoaderTelemetry()
+        self.telemetry = telemetry if telemetry else None
+
+        # Worker pool shared by every processing stage, started on first use.  Its workers are
+        # started with mp_context (by default forkserver, or spawn without one, never fork: see
+        # src.worker_pool.default_mp_context) and load the NLTK resources of warm_up_stages (by
+        # default every processing stage) when they start.
+        self._pool = None
+        self._mp_context = mp_context
+        self._warm_up_stages = STAGES[1:] if warm_up_stages is None else tuple(warm_up_stages)
+
+        # Shared n-gram counts of the splits, set by build_ngram_counts
+        self.ngram_counts = None
+        self._ngram_matrices = None
+
     def load_and_process_data(self, train_csv='final_train.csv', val_csv='final_val.csv', test_csv='final_test.csv',
                             skip_first_and_last_words=100, enrich_df=False):
         """
         Load and process the train, validation, and test datasets.
         """
-        # Load the train, validation, and test datasets
-        self.train_df = self._load_data_set(train_csv, skip_first_and_last_words)
-        self.val_df = self._load_data_set(val_csv, skip_first_and_last_words)
-        self.test_df = self._load_data_set(test_csv, skip_first_and_last_words)
+        self._skip_first_and_last_words = skip_first_and_last_words
+        self._splits_chunked = False
 
+        # Load the train, validation, and test datasets, tokenizing the books as they are read
+        self.train_df, self.val_df, self.test_df = (
+            self.process_split(csv_file, skip_first_and_last_words, enrich_df=enrich_df)
+            for csv_file in (train_csv, val_csv, test_csv))
+
+        self.check_tokenized()
+
+    def process_split(self, csv_file, skip_first_and_last_words=100, *, pg_ids=None, enrich_df=False,
+                      lemmatize=False, name=None):
+        """
+        Load one split (only the rows of pg_ids if given), tokenizing the books as they are read,
+        then optionally enrich and lemmatize it.  Returns the dataframe, the loader's own splits
+        are left alone.  name labels the split in the telemetry, csv_file by default.
+        """
+        df = self._load_data_set(csv_file, skip_first_and_last_words, tokenize=True, pg_ids=pg_ids)
         if enrich_df:
-            self.train_df = self._enrich_dataframe(self.train_df)
-            self.val_df = self._enrich_dataframe(self.val_df)
-            self.test_df = self._enrich_dataframe(self.test_df)
+            df = self._enrich_dataframe(df)
+        if lemmatize:
+            self._lemmatize_frames({name or csv_file: df}, skip_first_and_last_words)
+        return df
 
-        self._tokenize_all_text()
+    def load_splits(self, train_csv='final_train.csv', val_csv='final_val.csv', test_csv='final_test.csv',
+                    skip_first_and_last_words=100, read_text=True, tokenize=False):
+        """
+        Load the train, validation, and test datasets without any further processing.
+        Without read_text only the metadata of the splits is read, which is enough to enrich them.
+        """
+        self._skip_first_and_last_words = skip_first_and_last_words
+        self._splits_chunked = False
 
-    def _load_data_set(self, csv_file, skip_first_and_last_words=100):
+        if not read_text:
+            self.train_df = self.read_split_csv(train_csv)
+            self.val_df = self.read_split_csv(val_csv)
+            self.test_df = self.read_split_csv(test_csv)
+            return
+
+        self.train_df = self._load_data_set(train_csv, skip_first_and_last_words, tokenize=tokenize)
+        self.val_df = self._load_data_set(val_csv, skip_first_and_last_words, tokenize=tokenize)
+        self.test_df = self._load_data_set(test_csv, skip_first_and_last_words, tokenize=tokenize)
+
+    def enrich_all_data(self):
+        """
+        Enrich the train, validation, and test dataframes with word and token counts.
+        """
+        self.train_df = self._enrich_dataframe(self.train_df)
+        self.val_df = self._enrich_dataframe(self.val_df)
+        self.test_df = self._enrich_dataframe(self.test_df)
+
+    def _load_data_set(self, csv_file, skip_first_and_last_words=100, tokenize=False, pg_ids=None):
         """
         Load a dataframe from a CSV file and enrich it with token and word information.
+        With tokenize set, each book is sent to the tokenizer workers as soon as it has been read.
+        With pg_ids, only the rows of those books are loaded.
         """
-        csv_path = os.path.join(self._data_dir, csv_file)
-        df = pd.read_csv(csv_path, index_col='Unnamed: 0')
-        df['text'] = df['id'].apply(lambda x: self._get_book(x, skip_first_and_last_words=skip_first_and_last_words))
+        with self._stage('load', csv_file):
+            return self._read_data_set(csv_file, skip_first_and_last_words, tokenize, pg_ids)
+
+    def _read_data_set(self, csv_file, skip_first_and_last_words, tokenize, pg_ids=None):
+        df = self.read_split_csv(csv_file)
+        if pg_ids is not None:
+            df = df[df['id'].isin(pg_ids)].copy()
+        pg_ids = df['id'].tolist()
+        # Cache keys need the books' content hashes, taken from the bytes read for the text
+        hash_books = tokenize and self._cache is not None
+        read_book = partial(self._get_book_and_hash if hash_books else self._get_book,
+                            skip_first_and_last_words=skip_first_and_last_words)
+
+        texts = [None] * len(pg_ids)
+        tokenized = [None] * len(pg_ids)
+        keys = [None] * len(pg_ids)
+        stream = None
+        if tokenize:
+            func = partial(_tokenize_book, encode=self._encode_tokens, tokenizer=self._tokenizer)
+            # Profiled as the tokenized stage, which it stands in for
+            func = self._worker_func(func, 'tokenized', csv_file)
+            stream = self._get_pool().stream(func, desc='tokenized')
+
+        missing = []
+        for i, pg_id, text in prefetch_books(read_book, pg_ids, self._prefetch_depth, self._io_threads):
+            if hash_books:
+                text, self._content_hashes[pg_id] = text
+            texts[i] = text
+            if text is None:
+                missing.append(pg_id)
+                continue
+
+            if stream is not None:
+                if self._cache is not None:
+                    keys[i] = self._cache_key(pg_id, 'tokenized', skip_first_and_last_words, self._encode_tokens)
+                    tokenized[i] = self._cache.get(keys[i]) if keys[i] is not None else None
+                if tokenized[i] is None:
+                    stream.add(i, text, weight=len(text), label=pg_id)
+
+        self._report_missing(csv_file, missing)
+
+        import pandas as pd
+        # An object column keeps missing books as None, pandas would infer a string column holding NaN
+        df['text'] = pd.Series(texts, index=df.index, dtype=object)
+        if stream is not None:
+            for i, output in stream.results().items():
+                tokenized[i] = output
+                if keys[i] is not None:
+                    self._cache.put(keys[i], output)
+            df['tokenized'] = self._from_workers(tokenized)
 
         return df
 
+    def process_shards(self, out_dir, train_csv='final_train.csv', val_csv='final_val.csv',
+                       test_csv='final_test.csv', *, skip_first_and_last_words=100, enrich_df=False,
+                       lemmatize=True, shard_size=500, file_format='arrow', max_shards=None):
+        """
+        Process the splits as shards of shard_size books, checkpointing each shard in out_dir.
+        Several processes or hosts sharing out_dir can run this at once, and rerunning it after a
+        crash resumes with the shards that aren't done.  Returns the number of shards processed.
+        """
+        from src.sharding import process_shards
+        return process_shards(self, out_dir, train_csv, val_csv, test_csv,
+                              skip_first_and_last_words=skip_first_and_last_words, enrich_df=enrich_df,
+                              lemmatize=lemmatize, shard_size=shard_size, file_format=file_format,
+                              max_shards=max_shards)
+
+    def merge_shards(self, out_dir):
+        """
+        Load the train, validation, and test dataframes from the shards of a finished sharded run.
+        """
+        from src.sharding import ShardManifest, merge_shards
+        self.train_df, self.val_df, self.test_df = merge_shards(out_dir, self.vocabulary).values()
+        self._skip_first_and_last_words = ShardManifest.load(out_dir).settings['skip_first_and_last_words']
+        self._splits_chunked = False
+        self.check_tokenized()
+
+    def _report_missing(self, source, missing):
+        """
+        Record the books of a split that couldn't be found, and warn or raise about all of them at once.
+        """
+        self.missing_ids[source] = missing
+        if not missing:
+            return
+
+        error = MissingBooksError(missing, source)
+        if self._on_missing == 'raise':
+            raise error
+        print(f'Warning: {error}')
+
+    def read_split_csv(self, csv_file):
+        """
+        Read the metadata of a split from a CSV file in the data directory.
+        csv_file can also be one of the split names in DEFAULT_SPLIT_CSVS.
+        """
+        csv_file = DEFAULT_SPLIT_CSVS.get(csv_file, csv_file)
+        csv_path = os.path.join(self._data_dir, csv_file)
+        import pandas as pd
+        return pd.read_csv(csv_path, index_col='Unnamed: 0')
+
+    def iter_books(self, split, stages=('text',), skip_first_and_last_words=100,
+                   memory_budget=256 * 2**20):
+        """
+        Lazily iterate over the books of a split, yielding (pg_id, book) one book at a time.
+
+        split is a split name ('train', 'val', 'test') or a CSV file in the data directory.
+        book is a dict holding the requested stages ('text', 'tokenized', 'lemmatized').
+        Books are read and processed in batches whose estimated size stays under memory_budget
+        bytes, so the full corpus never has to live in memory at once.  Books that cannot be
+        found are skipped.
+        """
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            raise ValueError(f'Unknown stages {sorted(unknown)}, expected a subset of {STAGES}')
+
+        last_stage = max(STAGES.index(stage) for stage in stages)
+        memory_factor = _STAGE_MEMORY_FACTOR[STAGES[last_stage]]
+        pg_ids = self.read_split_csv(split)['id']
+
+        missing = []
+        batch = []
+        batch_size = 0
+        pool = self._get_pool() if last_stage > 0 else None
+        # Cache keys need the books' content hashes, taken from the bytes read for the text
+        hash_books = last_stage > 0 and self._cache is not None
+        read_book = partial(self._get_book_and_hash if hash_books else self._get_book,
+                            skip_first_and_last_words=skip_first_and_last_words)
+        engine = None
+        if 'lemmatized' in stages and self._lemma_memo_path is not None:
+            engine = LemmatizerEngine(self._lemma_memo_path)
+
+        try:
+            for _, pg_id, text in prefetch_books(read_book, pg_ids, self._prefetch_depth, self._io_threads):
+                if hash_books:
+                    text, self._content_hashes[pg_id] = text
+                if text is None:
+                    missing.append(pg_id)
+                    continue
+
+                batch.append((pg_id, text))
+                batch_size += len(text) * memory_factor
+                if batch_size >= memory_budget:
+                    yield from self._process_batch(batch, stages, pool, skip_first_and_last_words, engine)
+                    batch = []
+                    batch_size = 0
+
+            if batch:
+                yield from self._process_batch(batch, stages, pool, skip_first_and_last_words, engine)
+        finally:
+            # Also when the caller stops iterating early
+            if engine is not None:
+                engine.save_memo(self._lemma_memo_path)
+
+        self._report_missing(split, missing)
+
+    def _process_batch(self, batch, stages, pool, skip_first_and_last_words, engine=None):
+        """
+        Run the stages needed by iter_books over a batch of (pg_id, text) pairs, merging the
+        lemma memo entries the workers add into engine.
+        """
+        def mapper(func, inputs, labels):
+            return pool.map(func, inputs, weights=_book_weights(inputs), progress=False, labels=labels)
+
+        # The books are read whole from the book store, so their outputs are cached even when
+        # the split dataframes are chunked
+        pg_ids = [pg_id for pg_id, _ in batch]
+        texts = [text for _, text in batch]
+        tokenized = None
+        lemmatized = None
+        if 'tokenized' in stages or 'lemmatized' in stages:
+            tokenized = self._cached_map(pg_ids, texts, 'tokenized',
+                                         partial(_tokenize_book, tokenizer=self._tokenizer), mapper,
+                                         skip_first_and_last_words, whole_books=True)
+        if 'lemmatized' in stages:
+            lemmatized = self._cached_map(pg_ids, tokenized, 'lemmatized', self._lemmatize_func(encode=False),
+                                          self._lemma_mapper(engine, progress=False),
+                                          skip_first_and_last_words, whole_books=True)
+
+        for i, (pg_id, text) in enumerate(batch):
+            book = {}
+            if 'text' in stages:
+                book['text'] = text
+            if 'tokenized' in stages:
+                book['tokenized'] = tokenized[i]
+            if 'lemmatized' in stages:
+                book['lemmatized'] = lemmatized[i]
+
+            # Drop our references as we go so books are freed once the caller is done with them
+            batch[i] = texts[i] = None
+            if tokenized is not None:
+                tokenized[i] = None
+            if lemmatized is not None:
+                lemmatized[i] = None
+            yield pg_id, book
+
     # TODO: add the ability to use the gutenberg.data_io.get_book function in order to fetch the book text
     #       This will allow getting the pre-calculated count and token information, if using the original
     #       gutenberg repo (Standardized Project Gutenberg Corpus)
     def _get_book(self, pg_id, skip_first_and_last_words=100):
         """
         Fetch the book text using the pg_id."""
-        ## location of the gutenberg data
-        path_read = os.path.join(self._gutenberg_data_path,'text')
-        fname_read = '%s_text.txt'%(pg_id)
-        filename = os.path.join(path_read,fname_read)
-
-        if not os.path.exists(filename):
+        start = time.perf_counter()
+        text = self._book_store.get_text(pg_id)
+        if text is None:
             return None
-
-        with open(filename,'r') as f:
-            x = f.readlines()
-
-        text =  ' '.join([h.strip() for h in x])
+        if self.telemetry is not None:
+            self.telemetry.record_read(pg_id, time.perf_counter() - start, len(text.encode('utf-8')))
 
         # Skip the first and last N words (technically there might be a few spaces in there)
-        if skip_first_and_last_words > 0:
-            text = text.split(' ')
-            text = text[skip_first_and_last_words:-skip_first_and_last_words]
-            text = ' '.join(text)
+        return trim_words(text, skip_first_and_last_words)
 
-        return text
+    def _get_book_and_hash(self, pg_id, skip_first_and_last_words=100):
+        """
+        Fetch the book text like _get_book, along with the content hash of the book, reading the
+        file once.  Returns (None, None) if the book can't be found.
+        """
+        start = time.perf_counter()
+        if hasattr(self._book_store, 'get_text_and_hash'):
+            text, content_hash = self._book_store.get_text_and_hash(pg_id)
+        else:
+            text, content_hash = self._book_store.get_text(pg_id), self._book_store.content_hash(pg_id)
+        if text is None:
+            return None, None
+        if self.telemetry is not None:
+            self.telemetry.record_read(pg_id, time.perf_counter() - start, len(text.encode('utf-8')))
+
+        return trim_words(text, skip_first_and_last_words), content_hash
 
     def _enrich_dataframe(self, df):
         """
         Enrich the dataframe with word and token counts.
         """
-        count_path = os.path.join(self._gutenberg_data_path, 'counts')
-        text_path = os.path.join(self._gutenberg_data_path, 'text')
-        token_path = os.path.join(self._gutenberg_data_path, 'tokens')
+        # Books not in the stats index yet are scanned (in parallel) and added to it, the rest
+        # is a lookup in the index that doesn't touch their files (see build_stats_index)
+        with self._stage('enrich'):
+            stats_index = self.get_stats_index()
+            if stats_index.update(self._gutenberg_data_path, df['id'], pool=self._get_pool()):
+                if self._stats_index_path is not None:
+                    stats_index.save(self._stats_index_path)
 
-        df['word_count'] = df['id'].apply(lambda pid: self._get_word_count(pid, count_path))
-        df['unique_word_count'] = df['id'].apply(lambda pid: self._get_unique_word_count(pid, count_path))
-        df['line_count'] = df['id'].apply(lambda pid: self._get_line_count(pid, text_path))
-        df['token_count'] = df['id'].apply(lambda pid: self._get_token_count(pid, token_path))
+            return stats_index.enrich(df)
 
-        return df
+    def get_stats_index(self):
+        """
+        Return the corpus stats index, loading it from stats_index_path on first use if it exists.
+        """
+        if self._stats_index is None:
+            from src.corpus_stats import CorpusStatsIndex
+            if self._stats_index_path is not None and os.path.exists(self._stats_index_path):
+                self._stats_index = CorpusStatsIndex.load(self._stats_index_path)
+            else:
+                self._stats_index = CorpusStatsIndex()
 
-    def _get_word_count(self, book_id, raw_text_dir):
+        return self._stats_index
+
+    def build_stats_index(self, pg_ids=None, refresh=False):
         """
-        Given something like 'PG10007' and a directory containing a file called
-        'PG10007_counts.txt' whose lines each have a word and a count, sum up
-        all those counts and return the total.
+        Add the stats of pg_ids (by default every book in the text directory) to the stats
+        index, saving it to stats_index_path if one was given.  With refresh, the books already
+        in the index whose files have changed since are scanned again.
         """
-        filename = f"{book_id}_counts.txt"
-        file_path = os.path.join(raw_text_dir, filename)
+        if pg_ids is None:
+            suffix = '_text.txt'
+            text_path = os.path.join(self._gutenberg_data_path, 'text')
+            pg_ids = sorted(f[:-len(suffix)] for f in os.listdir(text_path) if f.endswith(suffix))
 
-        # If the file doesn’t exist, return None
-        if not os.path.exists(file_path):
-            return None
+        stats_index = self.get_stats_index()
+        stats_index.update(self._gutenberg_data_path, pg_ids, pool=self._get_pool())
+        if refresh:
+            stats_index.refresh(self._gutenberg_data_path, pg_ids, pool=self._get_pool())
+        if self._stats_index_path is not None:
+            stats_index.save(self._stats_index_path)
+
+        return stats_index
+
+    def build_count_matrix(self, pg_ids=None, path=None):
+        """
+        Build the book x term CountMatrix of pg_ids (by default every book in the counts
+        directory) from their SPGC counts files, saving it to path if given.
+        """
+        if pg_ids is None:
+            suffix = '_counts.txt'
+            counts_dir = os.path.join(self._gutenberg_data_path, 'counts')
+            pg_ids = sorted(f[:-len(suffix)] for f in os.listdir(counts_dir) if f.endswith(suffix))
 
-        total_count = 0
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                # Each line looks like: word count
-                word, count_str = line.strip().split()
-                total_count += int(count_str)
+        with self._stage('counts'):
+            from src.count_matrix import CountMatrix
+            count_matrix = CountMatrix.build(self._gutenberg_data_path, pg_ids, pool=self._get_pool())
+        if path is not None:
+            count_matrix.save(path)
 
-        return total_count
+        return count_matrix
 
-    def _get_unique_word_count(self, book_id, raw_text_dir):
+    def build_subword_cache(self, cache_dir, tokenizer, splits=('train', 'val', 'test'), batch_size=64):
         """
-        Given something like 'PG10007' and a directory containing a file
-        called 'PG10007_counts.txt' whose lines each have 'word count',
-        return how many lines that file has (i.e., how many unique words).
+        Run a subword tokenizer (e.g. a HuggingFace AutoTokenizer) once over the full text of every
+        book of splits, in batches, storing the ids in a memory-mapped SubwordCache in cache_dir.
+        Books are not trimmed, windows drawn from the cache strip their first tokens instead.
+        The raw text is tokenized, newlines included, as PreTrained_Transformer.ipynb reads it.
         """
-        filename = f"{book_id}_counts.txt"
-        file_path = os.path.join(raw_text_dir, filename)
+        pg_ids = list(dict.fromkeys(pg_id for split in splits for pg_id in self.read_split_csv(split)['id']))
+        books = prefetch_books(self._book_store.get_raw_text, pg_ids, self._prefetch_depth, self._io_threads)
+        with self._stage('subwords'):
+            from src.subword_cache import build_subword_cache
+            return build_subword_cache(cache_dir, ((pg_id, text) for _, pg_id, text in books), tokenizer,
+                                       batch_size=batch_size)
 
-        if not os.path.exists(file_path):
-            return None
+    def sample_chunk_offsets(self, num_chunks=10, chunk_size=1000, overlap=False, seed=None, column='text'):
+        """
+        Draw random chunk offsets for every book in the train, validation, and test dataframes,
+        without changing them.  Returns {'train': [...], 'val': [...], 'test': [...]} holding a
+        (num_chunks, 2) array of [start, end) word offsets per row, or None for missing books.
+        With a seed the same book always gets the same chunks.
+        """
+        sampler = ChunkSampler(num_chunks, chunk_size, overlap=overlap, seed=seed)
 
-        # Count lines to get # of unique words
-        with open(file_path, 'r', encoding='utf-8') as f:
-            num_unique_words = sum(1 for _ in f)
+        def sample_one(pg_id, book):
+            # Missing books show up as None or NaN depending on the column's dtype
+            if book is None or isinstance(book, float):
+                return None
+            num_words = count_words(book) if isinstance(book, str) else len(book)
+            return sampler.sample(num_words, pg_id)
 
-        return num_unique_words
+        return {split: [sample_one(pg_id, book) for pg_id, book in zip(df['id'], df[column])]
+                for split, df in self._split_dfs().items()}
 
-    def _get_line_count(self, book_id, text_dir):
+    def materialize_chunks(self, offsets, column='text', out_column=None):
         """
-        Given something like 'PG10007' and a directory containing
-        'PG10007_text.txt', return how many lines are in the file.
+        Build the chunked version of df[column] for each split from offsets returned by
+        sample_chunk_offsets, storing it in df[out_column] (df[column] by default).
         """
-        filename = f"{book_id}_text.txt"
-        file_path = os.path.join(text_dir, filename)
+        if out_column is None:
+            out_column = column
 
-        # If the file doesn’t exist, return None (or 0)
-        if not os.path.exists(file_path):
-            return None
+        # A chunked column (text, or tokens or lemmas stages read from) no longer matches the books
+        # on disk, and neither does anything computed from it, so the splits can't use the cache
+        self._splits_chunked = True
 
-        # Count lines
-        with open(file_path, 'r', encoding='utf-8') as f:
-            line_count = sum(1 for _ in f)
+        import pandas as pd
+        for split, df in self._split_dfs().items():
+            df[out_column] = pd.Series([materialize_chunks(book, book_offsets)
+                                        for book, book_offsets in zip(df[column], offsets[split])],
+                                       index=df.index, dtype=object)
 
-        return line_count
+    def random_chunk_all_text(self, num_chunks=10, chunk_size=1000, overlap=False, seed=None, out_column='text'):
+        """
+        Randomly chunk the text in the train, validation, and test dataframes.
+        The chunked text replaces df['text'] unless another out_column is given.
+        """
+        with self._stage('chunk'):
+            offsets = self.sample_chunk_offsets(num_chunks, chunk_size, overlap=overlap, seed=seed)
+            self.materialize_chunks(offsets, column='text', out_column=out_column)
 
-    def _get_token_count(self, book_id, text_dir):
+    def stylometry_features(self, offsets=None):
         """
-        Given something like 'PG10007' and a directory containing
-        'PG10007_tokens.txt', return how many lines are in the file.
+        Stylometric features (src.stylometry.FEATURE_NAMES) of every book, computed in parallel.
+        Returns {'train': ..., 'val': ..., 'test': ...} float32 arrays aligned with the split
+        dataframes: (len(df), NUM_FEATURES) per book, or (len(df), num_chunks, NUM_FEATURES) per
+        chunk given offsets from sample_chunk_offsets.  Missing books, and the chunks books too
+        short for num_chunks don't have, are NaN.
         """
-        filename = f"{book_id}_tokens.txt"
-        file_path = os.path.join(text_dir, filename)
+        from src.stylometry import NUM_FEATURES
 
-        # If the file doesn’t exist, return None (or 0)
-        if not os.path.exists(file_path):
-            return None
+        func = partial(_stylometry_book, tokenizer=self._tokenizer, encode=self._encode_tokens)
+        features = {}
+        for split, df in self._split_dfs().items():
+            with self._stage('stylometry', split):
+                texts = df['text'].tolist()
+                # Reuse the books' tokens when they were made from the current, unchunked text
+                tokens = [None] * len(df)
+                if offsets is None and 'tokenized' in df and not self._splits_chunked:
+                    tokens = self._to_workers(df['tokenized'].tolist())
+                split_offsets = [None] * len(df) if offsets is None else offsets[split]
 
-        # Count lines
-        with open(file_path, 'r', encoding='utf-8') as f:
-            token_count = sum(1 for _ in f)
-
-        return token_count
-
-    def _random_chunk_one_text(self, text, num_chunks=10, chunk_size=1000, overlap=False):
-        chunk = []
-        words = text.split(' ')
-
-        # If the total number of words is less than the chunk size * number of chunks, return the text
-        if num_chunks * chunk_size > len(words):
-            return text
-
-        for i in range(num_chunks):
-            num_words = len(words)
-            # If the chunk is larger than the number of words, return the rest of the text
-            if chunk_size > num_words:
-                chunk = chunk + words
-                words = []
-                return ' '.join(chunk)
-
-            start = random.randint(0, num_words)
-            chunk = [*chunk,  *words[start:start+chunk_size]]
-            if start == 0:
-                words = words[chunk_size:]
-            elif start == num_words - chunk_size:
-                words = words[0:start]
-            else:
-                words = words[0:start] + words[start+chunk_size:]
-        return ' '.join(chunk)
+                todo = [i for i, text in enumerate(texts) if isinstance(text, str)]
+                outputs = self._get_pool().map(self._worker_func(func, 'stylometry', split),
+                                               [(texts[i], tokens[i], split_offsets[i]) for i in todo],
+                                               weights=[len(texts[i]) for i in todo], desc='stylometry',
+                                               labels=[df['id'].iloc[i] for i in todo])
+
+                num_chunks = max((len(output) for output in outputs), default=1) if offsets is not None else 1
+                split_features = np.full((len(df), num_chunks, NUM_FEATURES), np.nan, dtype=np.float32)
+                for i, output in zip(todo, outputs):
+                    split_features[i, :len(output)] = output
+                features[split] = split_features[:, 0] if offsets is None else split_features
+
+        return features
 
-    def random_chunk_all_text(self, num_chunks=10, chunk_size=1000, overlap=False):
+    def find_duplicates(self, threshold=0.5, num_perm=128, shingle_size=5, bands=None, max_bucket_size=1000,
+                        seed=1):
         """
-        Randomly chunk the text in the train, validation, and test dataframes.
+        Find near-duplicate books within and across the train, validation, and test splits, from
+        MinHash signatures of their word shingles computed in parallel and matched with LSH bands
+        (see src.dedup).  Returns a DataFrame of pairs with id, split and author of both books,
+        their estimated Jaccard similarity and whether they cross splits, most similar first.
+        Bands shared by more than max_bucket_size books (src.dedup.MAX_BUCKET_SIZE by default) are
+        skipped, None keeps them all.  Authors are NaN if the splits have no author column, e.g.
+        after load_columnar(columns=...).
         """
-        # Randomly chunk the text in the train, validation, and test dataframes
-        self.train_df['text'] = self.train_df['text'].apply(
-            lambda x: self._random_chunk_one_text(x, num_chunks, chunk_size, overlap))
-        self.test_df['text'] = self.test_df['text'].apply(
-            lambda x: self._random_chunk_one_text(x, num_chunks, chunk_size, overlap))
-        self.val_df['text'] = self.val_df['text'].apply(
-            lambda x: self._random_chunk_one_text(x, num_chunks, chunk_size, overlap))
+        import pandas as pd
+        from src.dedup import duplicate_report, minhash_signature
+
+        func = partial(minhash_signature, num_perm=num_perm, shingle_size=shingle_size, seed=seed)
+        books = []
+        signatures = []
+        for split, df in self._split_dfs().items():
+            with self._stage('dedup', split):
+                present = [i for i, text in enumerate(df['text']) if isinstance(text, str)]
+                texts = [df['text'].iloc[i] for i in present]
+                split_signatures = self._get_pool().map(self._worker_func(func, 'dedup', split), texts,
+                                                        weights=_book_weights(texts), desc='dedup',
+                                                        labels=[df['id'].iloc[i] for i in present])
+            authors = df['author'] if 'author' in df else pd.Series(np.nan, index=df.index)
+            for i, signature in zip(present, split_signatures):
+                if signature is not None:
+                    books.append((df['id'].iloc[i], split, authors.iloc[i]))
+                    signatures.append(signature)
+
+        books = pd.DataFrame(books, columns=['id', 'split', 'author'])
+        signatures = np.array(signatures, dtype=np.uint32).reshape(len(books), num_perm)
+        with self._stage('dedup'):
+            return duplicate_report(books, signatures, threshold, bands=bands, max_bucket_size=max_bucket_size)
+
+    def _split_dfs(self):
+        """
+        The train, validation, and test dataframes by split name.
+        """
+        return {'train': self.train_df, 'val': self.val_df, 'test': self.test_df}
 
     def parse_subjects(df):
         subj = df['subjects'].replace('set()', np.nan)
@@ -242,18 +735,24 @@ class GutenbergDataLoader:
         df['subj_str']=subj_docs
         return df
 
-    def _tokenize_all_text(self):
+    def tokenize_all_text(self):
         """
         Tokenize all text in the train, validation, and test dataframes.
         """
         # Tokenize the text in the train, validation, and test dataframes
-        tokenized = process_map(word_tokenize, self.train_df['text'], max_workers=self._num_threads, chunksize=5)
-        self.train_df['tokenized'] = tokenized
-        tokenized = process_map(word_tokenize, self.val_df['text'], max_workers=self._num_threads, chunksize=5)
-        self.val_df['tokenized'] = tokenized
-        tokenized = process_map(word_tokenize, self.test_df['text'], max_workers=self._num_threads, chunksize=5)
-        self.test_df['tokenized'] = tokenized
+        func = partial(_tokenize_book, encode=self._encode_tokens, tokenizer=self._tokenizer)
+        for split, df in self._split_dfs().items():
+            with self._stage('tokenized', split):
+                df['tokenized'] = self._from_workers(self._map_stage(
+                    df, 'tokenized', self._worker_func(func, 'tokenized', split), 'text',
+                    self._skip_first_and_last_words))
+
+        self.check_tokenized()
 
+    def check_tokenized(self):
+        """
+        Warn about null values in the tokenized columns.
+        """
         # Check for null values in the tokenized columns
         if self.train_df['tokenized'].isnull().any():
             print('Warning: There are null elements in train_df')
@@ -264,40 +763,225 @@ class GutenbergDataLoader:
         if self.test_df['tokenized'].isnull().any():
             print('Warning: There are null elements in test_df')
 
-    def _lemmatize_text(self, tokenized_text):
-        tag_map = defaultdict(lambda : wn.NOUN)
-        tag_map['J'] = wn.ADJ
-        tag_map['V'] = wn.VERB
-        tag_map['R'] = wn.ADV
-        # Do I need to add noun?
-
-        # Declaring Empty List to store the words that follow the rules for this step
-        final_words = []
-        # Initializing WordNetLemmatizer()
-        word_lemmatized = WordNetLemmatizer()
-        # pos_tag function below will provide the 'tag' i.e if the word is Noun(N) or Verb(V) or something else.
-        for word, tag in pos_tag(tokenized_text):
-            # Below condition is to check for Stop words and consider only alphabets
-            if word not in stopwords.words('english') and word.isalpha():
-                word_final = word_lemmatized.lemmatize(word,tag_map[tag[0]])
-                final_words.append(word_final)
-        return str(final_words)
-        # The final processed set of words for each iteration will be stored in 'text_final'
-
     def lemmatize_all_text(self):
         """
         Lemmatize all text in the train, validation, and test dataframes.
         """
-        # Lemmatize the text in the train, validation, and test dataframes
-        # This function uses the process_map function from tqdm to parallelize the lemmatization process
-        # across multiple threads for faster processing.
-        # Do I want to do this using Pool.starmap instead?
-        lemmatized = process_map(self._lemmatize_text, self.train_df['tokenized'], max_workers=self._num_threads, chunksize=5)
-        self.train_df['lemmatized'] = lemmatized
-        lemmatized = process_map(self._lemmatize_text, self.val_df['tokenized'], max_workers=self._num_threads, chunksize=5)
-        self.val_df['lemmatized'] = lemmatized
-        lemmatized = process_map(self._lemmatize_text, self.test_df['tokenized'], max_workers=self._num_threads, chunksize=5)
-        self.test_df['lemmatized'] = lemmatized
+        self._lemmatize_frames(self._split_dfs(), self._skip_first_and_last_words)
+
+    def _lemmatize_frames(self, frames, skip_first_and_last_words):
+        """
+        Lemmatize df['tokenized'] into df['lemmatized'] for each dataframe of {name: df}, whose
+        books were trimmed by skip_first_and_last_words words (None if unknown, then uncached).
+        """
+        # Lemmatize the text in the train, validation, and test dataframes.  Each worker process
+        # keeps one memoized engine, so stopwords are loaded and each distinct (word, POS) pair is
+        # lemmatized once per worker rather than once per token.
+        # If the memo table is persisted, the workers start from it and we collect what they add.
+        engine = None
+        if self._lemma_memo_path is not None:
+            engine = LemmatizerEngine(self._lemma_memo_path)
+        func = self._lemmatize_func(encode=self._encode_tokens)
+        mapper = self._lemma_mapper(engine, desc='lemmatized')
+
+        for split, df in frames.items():
+            with self._stage('lemmatized', split):
+                df['lemmatized'] = self._from_workers(self._cached_map(
+                    df['id'].tolist(), df['tokenized'].tolist(), 'lemmatized',
+                    self._worker_func(func, 'lemmatized', split), mapper,
+                    skip_first_and_last_words, encoded=self._encode_tokens))
+
+        if engine is not None:
+            engine.save_memo(self._lemma_memo_path)
+
+    def _lemmatize_func(self, encode):
+        """
+        The worker function of the lemmatize stage, _lemmatize_book with the loader's memo file
+        and tag mode.
+        """
+        return partial(_lemmatize_book, memo_path=self._lemma_memo_path, encode=encode, tag_mode=self._tag_mode)
+
+    def _lemma_mapper(self, engine, **map_kwargs):
+        """
+        mapper running _lemmatize_func on the pool, merging the memo entries the workers add into
+        engine (None if the memo table isn't persisted) and returning the lemmas.
+        """
+        def mapper(func, inputs, labels):
+            lemmatized = []
+            for lemmas, new_entries in self._get_pool().map(func, self._to_workers(inputs),
+                                                            weights=_book_weights(inputs), labels=labels,
+                                                            **map_kwargs):
+                if engine is not None:
+                    engine.update_memo(new_entries)
+                lemmatized.append(lemmas)
+            return lemmatized
+
+        return mapper
+
+    def start_workers(self):
+        """
+        Start the worker processes now instead of on first use, e.g. so their startup isn't
+        charged to the first stage that needs them.
+        """
+        self._get_pool().start()
+
+    def _get_pool(self):
+        """
+        Return the loader's worker pool, starting it on first use.
+        """
+        if self._pool is None:
+            self._pool = WorkerPool(self._num_threads, initializer=warm_up_worker,
+                                    initargs=(self._warm_up_stages, self._lemma_memo_path, self._tag_mode,
+                                              self._tokenizer),
+                                    mp_context=self._mp_context, telemetry=self.telemetry)
+        return self._pool
+
+    def _stage(self, name, split=None):
+        """
+        Context timing a stage in the loader's telemetry, if it has one.
+        """
+        if self.telemetry is None:
+            return nullcontext()
+        return self.telemetry.stage(name, split, num_workers=self._num_threads)
+
+    def _worker_func(self, func, stage, split=None):
+        """
+        Wrap a stage's worker function to run under cProfile if the telemetry profiles that stage.
+        """
+        if self.telemetry is None or not self.telemetry.profiles(stage):
+            return func
+        from src.telemetry import ProfiledFunction
+        return ProfiledFunction(func, self.telemetry.profile_name(stage, split))
+
+    def close(self):
+        """
+        Shut down the loader's worker pool.  It is started again if another stage needs it.
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _to_workers(self, books):
+        """
+        Convert encoded books to the (types, codes) form they are sent to worker processes in.
+        """
+        if not self._encode_tokens:
+            return books
+        return [self.vocabulary.to_local(book) if isinstance(book, np.ndarray) else book for book in books]
+
+    def _from_workers(self, outputs):
+        """
+        Convert the (types, codes) outputs of worker processes to arrays of vocabulary ids.
+        """
+        if not self._encode_tokens:
+            return outputs
+        return [None if output is None else self.vocabulary.intern_local(*output) for output in outputs]
+
+    def decode_tokens(self, ids):
+        """
+        Turn an array of token ids from an encoded column back into a list of tokens.
+        """
+        return self.vocabulary.decode(ids)
+
+    def decode_frame(self, df):
+        """
+        Turn the encoded token columns of df back into lists of tokens, e.g. before handing df to
+        a process with another vocabulary.  Does nothing unless the loader encodes tokens.
+        """
+        if self._encode_tokens:
+            for column in ('tokenized', 'lemmatized'):
+                if column in df:
+                    df[column] = [None if ids is None else self.decode_tokens(ids) for ids in df[column]]
+        return df
+
+    def _map_stage(self, df, stage, func, column, skip_first_and_last_words):
+        """
+        Apply a processing stage to every row of df[column] in parallel, returning the outputs.
+        """
+        def mapper(func, inputs, labels):
+            return self._get_pool().map(func, inputs, weights=_book_weights(inputs), desc=stage, labels=labels)
+
+        return self._cached_map(df['id'].tolist(), df[column].tolist(), stage, func, mapper,
+                                skip_first_and_last_words, encoded=self._encode_tokens)
+
+    def _cached_map(self, pg_ids, inputs, stage, func, mapper, skip_first_and_last_words, encoded=False,
+                    whole_books=None):
+        """
+        Map func over the inputs of a stage with mapper(func, inputs, pg_ids).
+        If the loader has a cache, only books without a cached output are processed.  Outputs are
+        cached under the skip_first_and_last_words the books were trimmed by, None disables caching.
+        Only the outputs of whole_books (by default, unless the splits are chunked) are cached.
+        Missing books (None inputs) are skipped and stay None.
+        """
+        if whole_books is None:
+            whole_books = not self._splits_chunked
+        if self._cache is None or not whole_books or skip_first_and_last_words is None:
+            keys = [None] * len(pg_ids)
+            outputs = [None] * len(pg_ids)
+        else:
+            keys = [self._cache_key(pg_id, stage, skip_first_and_last_words, encoded) for pg_id in pg_ids]
+            outputs = [None if key is None else self._cache.get(key) for key in keys]
+        todo = [i for i, output in enumerate(outputs) if output is None and inputs[i] is not None]
+
+        if todo:
+            computed = mapper(func, [inputs[i] for i in todo], [pg_ids[i] for i in todo])
+            for i, output in zip(todo, computed):
+                outputs[i] = output
+                if keys[i] is not None:
+                    self._cache.put(keys[i], output)
+
+        return outputs
+
+    def _cache_key(self, pg_id, stage, skip_first_and_last_words, encoded=False):
+        """
+        Cache key of a book's output for a stage, or None if the book's text can't be found.
+        Encoded outputs are cached as (types, codes) pairs, so they get their own keys.
+        """
+        if pg_id not in self._content_hashes:
+            self._content_hashes[pg_id] = self._book_store.content_hash(pg_id)
+        content_hash = self._content_hashes[pg_id]
+        if content_hash is None:
+            return None
+
+        version = self._stage_versions[stage]
+        if encoded:
+            version += '|local-int32'
+        return make_cache_key(pg_id, content_hash, skip_first_and_last_words, stage, version)
+
+    def build_ngram_counts(self, column='lemmatized', max_n=3, lowercase=True, stop_words=None):
+        """
+        Count all 1..max_n grams of df[column] once, fitting on the train split.
+        ngram_tfidf can then produce any TF-IDF variant from these counts without recounting.
+        """
+        def documents(df):
+            if self._encode_tokens and column in ('tokenized', 'lemmatized'):
+                return [self.decode_tokens(ids) for ids in df[column]]
+            return df[column].tolist()
+
+        # Imported here, scipy is only needed by the stages building sparse matrices
+        from src.ngram_features import NgramCounts
+
+        with self._stage('ngrams'):
+            self.ngram_counts = NgramCounts(max_n=max_n, lowercase=lowercase, stop_words=stop_words)
+            self._ngram_matrices = {'train': self.ngram_counts.fit(documents(self.train_df)),
+                                    'val': self.ngram_counts.transform(documents(self.val_df)),
+                                    'test': self.ngram_counts.transform(documents(self.test_df))}
+        return self.ngram_counts
+
+    def ngram_tfidf(self, max_features=None, ngram_range=(1, 1), sublinear_tf=False):
+        """
+        TF-IDF matrices (train, val, test) for one vectorizer configuration, built from the counts
+        of build_ngram_counts.  Weighting matches TfidfVectorizer's defaults.
+        """
+        columns = self.ngram_counts.select(max_features=max_features, ngram_range=ngram_range)
+        return tuple(self.ngram_counts.tfidf(self._ngram_matrices[split], columns, sublinear_tf=sublinear_tf)
+                     for split in ('train', 'val', 'test'))
 
     def save_pickle(self, path=None, description=None):
         """
@@ -311,9 +995,14 @@ class GutenbergDataLoader:
         else:
             description = '_' + description
 
-        self.train_df.to_pickle(os.path.join(path, f'train_df{description}.pkl'))
-        self.val_df.to_pickle(os.path.join(path, f'val_df{description}.pkl'))
-        self.test_df.to_pickle(os.path.join(path, f'test_df{description}.pkl'))
+        with self._stage('save_pickle'):
+            self.train_df.to_pickle(os.path.join(path, f'train_df{description}.pkl'))
+            self.val_df.to_pickle(os.path.join(path, f'val_df{description}.pkl'))
+            self.test_df.to_pickle(os.path.join(path, f'test_df{description}.pkl'))
+
+            # Encoded columns are meaningless without the vocabulary they index into
+            if self.vocabulary is not None:
+                self.vocabulary.save(os.path.join(path, f'vocabulary{description}.json'))
 
     def load_pickle(self, path=None, description=None):
         """
@@ -327,6 +1016,73 @@ class GutenbergDataLoader:
         else:
             description = '_' + description
 
-        self.train_df = pd.read_pickle(os.path.join(path, f'train_df_{description}.pkl'))
-        self.val_df = pd.read_pickle(os.path.join(path, f'val_df_{description}.pkl'))
-        self.test_df = pd.read_pickle(os.path.join(path, f'test_df_{description}.pkl'))
\ No newline at end of file
+        # How the saved books were trimmed isn't known, so their stages aren't cached
+        self._skip_first_and_last_words = None
+        self._splits_chunked = False
+        import pandas as pd
+        with self._stage('load_pickle'):
+            self.train_df = pd.read_pickle(os.path.join(path, f'train_df{description}.pkl'))
+            self.val_df = pd.read_pickle(os.path.join(path, f'val_df{description}.pkl'))
+            self.test_df = pd.read_pickle(os.path.join(path, f'test_df{description}.pkl'))
+
+            vocabulary_path = os.path.join(path, f'vocabulary{description}.json')
+            if os.path.exists(vocabulary_path):
+                self.vocabulary = Vocabulary.load(vocabulary_path)
+                self._encode_tokens = True
+
+    def save_columnar(self, path=None, description=None, file_format='arrow'):
+        """
+        Save the train, validation, and test dataframes to Arrow IPC ('arrow') or Parquet
+        ('parquet') files, with token lists stored as Arrow list columns.
+        """
+        if path is None:
+            path = self._data_dir
+
+        if description is None:
+            description = ''
+        else:
+            description = '_' + description
+
+        from src.columnar_store import FORMATS, save_frame
+
+        extension = FORMATS.get(file_format, '')
+        with self._stage('save_columnar'):
+            for split, df in self._split_dfs().items():
+                save_frame(df, os.path.join(path, f'{split}_df{description}{extension}'), file_format=file_format)
+
+            # Encoded columns are meaningless without the vocabulary they index into
+            if self.vocabulary is not None:
+                self.vocabulary.save(os.path.join(path, f'vocabulary{description}.json'))
+
+    def load_columnar(self, path=None, description=None, file_format='arrow', columns=None, authors=None,
+                      ids=None, memory_map=True):
+        """
+        Load the train, validation, and test dataframes saved with save_columnar.
+        Only the given columns (e.g. ['lemmatized', 'author']) and the rows of the given authors
+        or ids are loaded.  Arrow files are memory-mapped, and encoded token columns come back as
+        int32 arrays pointing into the mapping.
+        """
+        if path is None:
+            path = self._data_dir
+
+        if description is None:
+            description = ''
+        else:
+            description = '_' + description
+
+        from src.columnar_store import FORMATS, read_frame
+
+        extension = FORMATS.get(file_format, '')
+        # How the saved books were trimmed isn't known, so their stages aren't cached
+        self._skip_first_and_last_words = None
+        self._splits_chunked = False
+        with self._stage('load_columnar'):
+            self.train_df, self.val_df, self.test_df = (
+                read_frame(os.path.join(path, f'{split}_df{description}{extension}'), columns=columns,
+                           authors=authors, ids=ids, memory_map=memory_map)
+                for split in ('train', 'val', 'test'))
+
+            vocabulary_path = os.path.join(path, f'vocabulary{description}.json')
+            if os.path.exists(vocabulary_path):
+                self.vocabulary = Vocabulary.load(vocabulary_path)
+                self._encode_tokens = True
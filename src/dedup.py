@@ -0,0 +1,176 @@
+"""
+Near-duplicate detection with MinHash signatures and LSH banding.
+
+Each book is reduced to the set of its word shingles (shingle_size consecutive lowercased words,
+hashed to 32 bits), and that set to a MinHash signature of num_perm minimums, one per random
+multiply-shift hash function.  The fraction of equal signature entries of two books estimates
+the Jaccard similarity of their shingle sets.  Signatures are split into bands of rows; books
+with an identical band land in the same bucket and become candidate pairs, so only books likely
+to be similar are ever compared, and the work grows about linearly with the number of books.
+
+With b bands of r rows, a pair with Jaccard similarity s becomes a candidate with probability
+1 - (1 - s^r)^b, an S-curve whose steepest point is near (1 / b)^(1 / r).
+"""
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from src.vocabulary import encode_local
+
+# Shingles hashed per block when computing a signature, bounds the (block, num_perm) temporaries
+SIGNATURE_BLOCK = 4096
+
+# Pairs compared per block when estimating similarities
+PAIR_BLOCK = 65536
+
+# Default bound on the books of one bucket: a band shared by more books (boilerplate, or empty
+# texts) would make a quadratic number of pairs, so such buckets are skipped
+MAX_BUCKET_SIZE = 1000
+
+# Base of the polynomial combining the word hashes of a shingle into one hash
+_SHINGLE_SEED = 0x9E3779B97F4A7C15
+
+# Hash functions of each (num_perm, seed) made in this process
+_HASH_FUNCTIONS = {}
+
+
+def _hash_functions(num_perm, seed):
+    """
+    The (a, b) uint64 parameters of num_perm multiply-shift hash functions, h(x) = (a x + b) >> 32.
+    """
+    key = (num_perm, seed)
+    if key not in _HASH_FUNCTIONS:
+        rng = np.random.default_rng(seed)
+        a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+        _HASH_FUNCTIONS[key] = (a, b)
+    return _HASH_FUNCTIONS[key]
+
+
+def shingle_hashes(text, shingle_size=5):
+    """
+    The distinct 32-bit hashes of the shingle_size word shingles of text, as a uint64 array.
+    Texts shorter than a shingle are one shingle.
+    """
+    types, codes = encode_local(text.lower().split())
+    if not len(codes):
+        return np.empty(0, dtype=np.uint64)
+
+    type_hashes = np.array([zlib.crc32(word.encode('utf-8')) for word in types], dtype=np.uint64)
+    word_hashes = type_hashes[codes]
+    num_shingles = max(len(word_hashes) - shingle_size + 1, 1)
+
+    # Polynomial hash of each window of words, wrapping around 2^64
+    hashes = np.zeros(num_shingles, dtype=np.uint64)
+    for j in range(min(shingle_size, len(word_hashes))):
+        hashes += word_hashes[j:j + num_shingles] * np.uint64(pow(_SHINGLE_SEED, j, 2**64))
+
+    return np.unique((hashes >> np.uint64(32)) ^ (hashes & np.uint64(0xFFFFFFFF)))
+
+
+def minhash_signature(text, num_perm=128, shingle_size=5, seed=1):
+    """
+    The uint32 MinHash signature of the word shingles of text, or None for texts without words.
+    """
+    shingles = shingle_hashes(text, shingle_size)
+    if not len(shingles):
+        return None
+
+    a, b = _hash_functions(num_perm, seed)
+    signature = np.full(num_perm, np.iinfo(np.uint32).max, dtype=np.uint64)
+    for start in range(0, len(shingles), SIGNATURE_BLOCK):
+        block = shingles[start:start + SIGNATURE_BLOCK, None]
+        np.minimum(signature, ((a * block + b) >> np.uint64(32)).min(axis=0), out=signature)
+
+    return signature.astype(np.uint32)
+
+
+def choose_bands(num_perm, threshold):
+    """
+    Number of bands (dividing num_perm) whose S-curve is steepest closest to threshold.
+    """
+    bands = [b for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(bands, key=lambda b: abs((1 / b) ** (b / num_perm) - threshold))
+
+
+def candidate_pairs(signatures, bands, max_bucket_size=MAX_BUCKET_SIZE):
+    """
+    The (i, j) row pairs (i < j) of signatures that share at least one band, as an (n, 2) int64
+    array.  Buckets larger than max_bucket_size (e.g. boilerplate every book shares) are skipped,
+    None keeps them all.
+    """
+    num_books, num_perm = signatures.shape
+    if num_perm % bands:
+        raise ValueError(f'bands ({bands}) must divide the signature length ({num_perm})')
+    rows = num_perm // bands
+
+    keys = []
+    for band in range(bands):
+        # Each band's rows as one opaque value, so identical bands compare equal
+        band_values = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        _, buckets = np.unique(band_values.view(np.dtype((np.void, 4 * rows))).ravel(), return_inverse=True)
+
+        # Only the few buckets holding several books make pairs
+        sizes = np.bincount(buckets)[buckets]
+        shared = sizes >= 2
+        if max_bucket_size is not None:
+            shared &= sizes <= max_bucket_size
+        members = np.flatnonzero(shared)
+        order = members[np.argsort(buckets[members], kind='stable')]
+        bounds = np.flatnonzero(np.diff(buckets[order])) + 1
+        for members in np.split(order, bounds) if len(order) else ():
+            first, second = np.triu_indices(len(members), 1)
+            pair_i = members[first]
+            pair_j = members[second]
+            keys.append(np.minimum(pair_i, pair_j).astype(np.int64) * num_books + np.maximum(pair_i, pair_j))
+
+    if not keys:
+        return np.empty((0, 2), dtype=np.int64)
+    keys = np.unique(np.concatenate(keys))
+    return np.stack([keys // num_books, keys % num_books], axis=1)
+
+
+def estimate_jaccard(signatures, pairs):
+    """
+    Estimated Jaccard similarity of each pair of rows, the fraction of equal signature entries.
+    """
+    similarities = np.empty(len(pairs), dtype=np.float64)
+    for start in range(0, len(pairs), PAIR_BLOCK):
+        block = pairs[start:start + PAIR_BLOCK]
+        similarities[start:start + PAIR_BLOCK] = (signatures[block[:, 0]] == signatures[block[:, 1]]).mean(axis=1)
+    return similarities
+
+
+def find_duplicates(signatures, threshold=0.5, bands=None, max_bucket_size=MAX_BUCKET_SIZE):
+    """
+    Pairs of rows of signatures with an estimated Jaccard similarity of at least threshold.
+    Returns (pairs, similarities), most similar first.  bands defaults to choose_bands.
+    """
+    if bands is None:
+        bands = choose_bands(signatures.shape[1], threshold)
+    pairs = candidate_pairs(signatures, bands, max_bucket_size=max_bucket_size)
+    similarities = estimate_jaccard(signatures, pairs)
+
+    keep = similarities >= threshold
+    pairs = pairs[keep]
+    similarities = similarities[keep]
+    order = np.argsort(-similarities, kind='stable')
+    return pairs[order], similarities[order]
+
+
+def duplicate_report(books, signatures, threshold=0.5, bands=None, max_bucket_size=MAX_BUCKET_SIZE):
+    """
+    Report the near-duplicate pairs of books, a DataFrame with one row per book (e.g. 'id',
+    'split' and 'author') aligned with signatures.  Returns one row per pair, with the columns
+    of both books suffixed _a and _b, the estimated jaccard similarity and, when books has a
+    'split' column, whether the pair crosses splits.
+    """
+    pairs, similarities = find_duplicates(signatures, threshold, bands=bands, max_bucket_size=max_bucket_size)
+    books = books.reset_index(drop=True)
+    report = pd.concat([books.iloc[pairs[:, 0]].add_suffix('_a').reset_index(drop=True),
+                        books.iloc[pairs[:, 1]].add_suffix('_b').reset_index(drop=True)], axis=1)
+    report['jaccard'] = similarities
+    if 'split' in books:
+        report['cross_split'] = report['split_a'] != report['split_b']
+    return report
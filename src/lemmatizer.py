@@ -0,0 +1,129 @@
+"""
+Memoized WordNet lemmatization of tokenized books.
+
+A book only has a few thousand distinct (word, POS) pairs, so the engine lemmatizes each distinct
+pair once and remembers the result in a bounded memo table shared by every book a worker process
+handles.  The memo table can be saved and reloaded so later runs start warm.
+"""
+import os
+import pickle
+
+from src.pos_tagging import pos_tag_tokens
+
+# WordNet POS, the values of nltk.corpus.reader.wordnet's ADJ, ADV, NOUN and VERB
+ADJ, ADV, NOUN, VERB = 'a', 'r', 'n', 'v'
+
+# First letter of the Penn Treebank tag -> WordNet POS, anything else is lemmatized as a noun
+TAG_MAP = {'J': ADJ, 'V': VERB, 'R': ADV}
+
+# One engine per worker process, memo file and tag mode, so stopwords, the lemmatizer and the
+# memo table are only loaded once per process
+_ENGINES = {}
+
+
+class LemmatizerEngine:
+    """
+    Lemmatize tokenized text, skipping stopwords and non alphabetic tokens.
+
+    Gives exactly the same lemmas as lemmatizing every token with WordNetLemmatizer, but as a
+    list, and with each distinct (word, POS) pair only lemmatized once.
+    Tokens are POS tagged according to tag_mode, see src.pos_tagging.
+    """
+
+    def __init__(self, memo_path=None, max_memo_size=500000, tag_mode='book'):
+        from nltk.corpus import stopwords
+        from nltk.stem import WordNetLemmatizer
+
+        self._tag_mode = tag_mode
+        self._stop_words = frozenset(stopwords.words('english'))
+        self._lemmatizer = WordNetLemmatizer()
+        self._max_memo_size = max_memo_size
+        self._memo = {}
+        self._new_entries = {}
+
+        if memo_path is not None and os.path.exists(memo_path):
+            self.load_memo(memo_path)
+
+    def __len__(self):
+        return len(self._memo)
+
+    def lemmatize(self, tokenized_text):
+        """
+        Return the list of lemmas of the non stopword, alphabetic tokens of tokenized_text.
+        """
+        stop_words = self._stop_words
+        memo = self._memo
+        final_words = []
+        for word, tag in pos_tag_tokens(tokenized_text, self._tag_mode):
+            if word in stop_words or not word.isalpha():
+                continue
+
+            key = (word, TAG_MAP.get(tag[0], NOUN))
+            lemma = memo.get(key)
+            if lemma is None:
+                lemma = self._lemmatizer.lemmatize(*key)
+                # The table is bounded, once full the most common pairs are already in it
+                if len(memo) < self._max_memo_size:
+                    memo[key] = lemma
+                    self._new_entries[key] = lemma
+            final_words.append(lemma)
+
+        return final_words
+
+    def pop_new_entries(self):
+        """
+        Return the memo entries added since the last call, so they can be merged elsewhere.
+        """
+        new_entries, self._new_entries = self._new_entries, {}
+        return new_entries
+
+    def update_memo(self, entries):
+        """
+        Merge memo entries computed by another engine, up to the size bound.
+        """
+        for key, lemma in entries.items():
+            if len(self._memo) >= self._max_memo_size:
+                break
+            self._memo.setdefault(key, lemma)
+
+    def load_memo(self, memo_path):
+        """
+        Merge a memo table saved by save_memo.
+        """
+        with open(memo_path, 'rb') as f:
+            self.update_memo(pickle.load(f))
+
+    def save_memo(self, memo_path):
+        """
+        Save the memo table, writing to a temporary file first so it is replaced atomically.
+        """
+        tmp_path = f'{memo_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self._memo, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, memo_path)
+
+
+def get_engine(memo_path=None, tag_mode='book'):
+    """
+    Return this process's engine for memo_path and tag_mode, creating it on first use.
+    """
+    engine = _ENGINES.get((memo_path, tag_mode))
+    if engine is None:
+        engine = _ENGINES[memo_path, tag_mode] = LemmatizerEngine(memo_path, tag_mode=tag_mode)
+    return engine
+
+
+def lemmatize_tokens(tokenized_text, memo_path=None, tag_mode='book'):
+    """
+    Lemmatize one book with this process's engine.
+    """
+    return get_engine(memo_path, tag_mode).lemmatize(tokenized_text)
+
+
+def lemmatize_tokens_with_memo(tokenized_text, memo_path=None, tag_mode='book'):
+    """
+    Lemmatize one book with this process's engine, also returning the memo entries it added
+    so the parent process can collect and persist them.
+    """
+    engine = get_engine(memo_path, tag_mode)
+    return engine.lemmatize(tokenized_text), engine.pop_new_entries()
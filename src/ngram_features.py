@@ -0,0 +1,216 @@
+"""
+Shared n-gram count matrix for TF-IDF sweeps.
+
+All 1..max_n grams of the documents are counted once into a sparse document-term matrix.  Any
+TF-IDF variant with ngram_range inside 1..max_n, any max_features and either tf weighting is then
+a column selection and reweighting of that matrix, instead of a new TfidfVectorizer pass over the
+corpus per combination.  Weighting follows TfidfVectorizer's defaults (smooth idf, l2 norm).
+
+N-grams are counted on integer token ids: an n-gram of ids is packed into one int64 key, so
+counting and matching are NumPy unique/searchsorted calls rather than Python dicts of strings.
+"""
+import re
+
+import numpy as np
+import scipy.sparse as sp
+
+# Same default token pattern as sklearn's vectorizers, applied to raw text and token lists alike
+TOKEN_PATTERN = re.compile(r'(?u)\b\w\w+\b')
+
+
+def _english_stop_words():
+    from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+    return ENGLISH_STOP_WORDS
+
+
+class NgramCounts:
+    """
+    Count 1..max_n grams of a training corpus, and of other corpora over the same n-grams.
+
+    Documents are either raw text or sequences of tokens, which are joined with spaces.  Either way
+    they are split with sklearn's default token pattern, so single characters and punctuation are
+    dropped and the n-grams match TfidfVectorizer's over the same text.  stop_words ('english' or a
+    collection of words) are removed before n-grams are formed, as TfidfVectorizer does.
+    """
+
+    def __init__(self, max_n=3, lowercase=True, stop_words=None):
+        if stop_words == 'english':
+            stop_words = _english_stop_words()
+
+        self.max_n = max_n
+        self.lowercase = lowercase
+        self.stop_words = frozenset(stop_words) if stop_words is not None else frozenset()
+
+        self._token_ids = {}
+        self._tokens = []
+        self._ngram_keys = []
+        self._ngram_offsets = []
+        self.ngram_order = None
+        self.term_freq = None
+        self.doc_freq = None
+        self.num_docs = 0
+
+    @property
+    def num_features(self):
+        """
+        Number of distinct n-grams (columns) counted in the training corpus.
+        """
+        return 0 if self.ngram_order is None else len(self.ngram_order)
+
+    def _analyze(self, doc):
+        if not isinstance(doc, str):
+            doc = ' '.join(doc)
+        tokens = TOKEN_PATTERN.findall(doc.lower() if self.lowercase else doc)
+
+        if self.stop_words:
+            tokens = [token for token in tokens if token not in self.stop_words]
+        return tokens
+
+    def _ids(self, doc, grow):
+        tokens = self._analyze(doc)
+        if grow:
+            token_ids = self._token_ids
+            for token in tokens:
+                if token not in token_ids:
+                    token_ids[token] = len(self._tokens)
+                    self._tokens.append(token)
+            return np.fromiter((token_ids[token] for token in tokens), dtype=np.int64, count=len(tokens))
+
+        return np.fromiter((self._token_ids.get(token, -1) for token in tokens), dtype=np.int64,
+                           count=len(tokens))
+
+    def _keys(self, ids, n):
+        """
+        Pack the n-grams of a document's ids into int64 keys, dropping n-grams with unknown tokens.
+        """
+        if len(ids) < n:
+            return np.empty(0, dtype=np.int64)
+
+        base = len(self._tokens)
+        length = len(ids) - n + 1
+        keys = np.zeros(length, dtype=np.int64)
+        known = np.ones(length, dtype=bool)
+        for i in range(n):
+            window = ids[i:i + length]
+            keys = keys * base + window
+            known &= window >= 0
+        return keys[known]
+
+    def fit(self, docs):
+        """
+        Count the n-grams of the training documents, returning their count matrix.
+        """
+        docs_ids = [self._ids(doc, grow=True) for doc in docs]
+        if len(self._tokens) ** self.max_n >= 2**63:
+            raise ValueError(f'Vocabulary of {len(self._tokens)} tokens is too large to pack '
+                             f'{self.max_n}-grams into int64 keys, use a smaller max_n')
+
+        self._ngram_keys = []
+        self._ngram_offsets = []
+        rows, cols, counts, orders = [], [], [], []
+        offset = 0
+        for n in range(1, self.max_n + 1):
+            doc_keys = []
+            doc_counts = []
+            for ids in docs_ids:
+                keys, key_counts = np.unique(self._keys(ids, n), return_counts=True)
+                doc_keys.append(keys)
+                doc_counts.append(key_counts)
+
+            all_keys = np.concatenate(doc_keys) if doc_keys else np.empty(0, dtype=np.int64)
+            ngram_keys, columns = np.unique(all_keys, return_inverse=True)
+
+            rows.append(np.repeat(np.arange(len(docs_ids)), [len(keys) for keys in doc_keys]))
+            cols.append(columns.ravel() + offset)
+            counts.extend(doc_counts)
+            orders.append(np.full(len(ngram_keys), n, dtype=np.int8))
+
+            self._ngram_keys.append(ngram_keys)
+            self._ngram_offsets.append(offset)
+            offset += len(ngram_keys)
+
+        self.ngram_order = np.concatenate(orders)
+        matrix = self._to_csr(rows, cols, counts, len(docs_ids))
+
+        self.num_docs = matrix.shape[0]
+        self.term_freq = np.asarray(matrix.sum(axis=0)).ravel()
+        self.doc_freq = np.bincount(matrix.indices, minlength=self.num_features)
+        return matrix
+
+    def transform(self, docs):
+        """
+        Count the n-grams of documents that were seen in the training documents.
+        """
+        docs_ids = [self._ids(doc, grow=False) for doc in docs]
+
+        rows, cols, counts = [], [], []
+        for n in range(1, self.max_n + 1):
+            ngram_keys = self._ngram_keys[n - 1]
+            for row, ids in enumerate(docs_ids):
+                keys, key_counts = np.unique(self._keys(ids, n), return_counts=True)
+                positions = np.searchsorted(ngram_keys, keys)
+                positions[positions == len(ngram_keys)] = 0
+                found = ngram_keys[positions] == keys if len(ngram_keys) else np.zeros(len(keys), dtype=bool)
+
+                rows.append(np.full(found.sum(), row))
+                cols.append(positions[found] + self._ngram_offsets[n - 1])
+                counts.append(key_counts[found])
+
+        return self._to_csr(rows, cols, counts, len(docs_ids))
+
+    def _to_csr(self, rows, cols, counts, num_docs):
+        def join(parts, dtype):
+            return np.concatenate(parts).astype(dtype) if parts else np.empty(0, dtype=dtype)
+
+        return sp.csr_matrix((join(counts, np.float64), (join(rows, np.int64), join(cols, np.int64))),
+                             shape=(num_docs, self.num_features))
+
+    def select(self, max_features=None, ngram_range=(1, 1)):
+        """
+        Columns of the n-grams with order in ngram_range, keeping the max_features most frequent
+        in the training documents (ties go to the lower column).
+        """
+        low, high = ngram_range
+        if low < 1 or high > self.max_n:
+            raise ValueError(f'ngram_range {ngram_range} is outside the counted range (1, {self.max_n})')
+
+        columns = np.flatnonzero((self.ngram_order >= low) & (self.ngram_order <= high))
+        if max_features is not None and max_features < len(columns):
+            order = np.argsort(-self.term_freq[columns], kind='stable')[:max_features]
+            columns = np.sort(columns[order])
+        return columns
+
+    def idf(self, columns):
+        """
+        Smoothed inverse document frequency of columns over the training documents.
+        """
+        return np.log((1 + self.num_docs) / (1 + self.doc_freq[columns])) + 1
+
+    def tfidf(self, counts, columns, sublinear_tf=False):
+        """
+        TF-IDF weight a count matrix restricted to columns, with l2 normalized rows.
+        """
+        matrix = counts[:, columns].tocsr()
+        if sublinear_tf:
+            matrix.data = 1 + np.log(matrix.data)
+        matrix = matrix @ sp.diags(self.idf(columns))
+
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sp.csr_matrix(sp.diags(1 / norms) @ matrix)
+
+    def feature_names(self, columns):
+        """
+        The n-grams of columns, tokens joined by spaces.
+        """
+        names = []
+        base = len(self._tokens)
+        for column in np.asarray(columns).tolist():
+            n = int(self.ngram_order[column])
+            key = int(self._ngram_keys[n - 1][column - self._ngram_offsets[n - 1]])
+            ids = []
+            for _ in range(n):
+                key, token_id = divmod(key, base)
+                ids.append(token_id)
+            names.append(' '.join(self._tokens[token_id] for token_id in reversed(ids)))
+        return names
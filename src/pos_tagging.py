@@ -0,0 +1,134 @@
+"""
+POS tagging for the lemmatize stage, with the averaged perceptron model loaded once per process.
+
+The perceptron tags a word from a fixed window: the word's first letter and suffix, the
+normalized words two either side, and the two previous tags.  CachedTagger remembers the tag of
+each window it has predicted, so repeated windows skip the model while giving exactly the tags of
+nltk.pos_tag.  Tag modes:
+
+    'book'      tag the whole book as one sequence, exactly like nltk.pos_tag(tokens)
+    'sentence'  tag each sentence separately, as the tagger was trained, caching whole sentences
+    'lexicon'   no context: the tagger's dictionary of unambiguous words, else a guess from the
+                suffix.  Much cheaper, and good enough to pick the WordNet POS of most words.
+
+Only 'book' reproduces nltk.pos_tag.  'sentence' and 'lexicon' change some tags, and so some
+lemmas, so lemmas cached under one mode aren't reused under another.
+"""
+TAG_MODES = ('book', 'sentence', 'lexicon')
+
+# Tokens that end a sentence in Treebank tokenized text
+SENTENCE_END = frozenset(('.', '!', '?'))
+
+# Suffix -> Penn Treebank tag, used by the lexicon mode for words the tagger has no entry for
+SUFFIX_TAGS = (('ly', 'RB'), ('ing', 'VBG'), ('ed', 'VBD'), ('ous', 'JJ'), ('ful', 'JJ'),
+               ('able', 'JJ'), ('ible', 'JJ'), ('ive', 'JJ'), ('less', 'JJ'), ('ic', 'JJ'),
+               ('al', 'JJ'), ('ish', 'JJ'), ('est', 'JJS'), ('ize', 'VB'), ('ise', 'VB'),
+               ('ify', 'VB'))
+
+# This process's tagger, loaded on first use
+_TAGGERS = {}
+
+
+def get_tagger():
+    """
+    Return this process's CachedTagger, loading the perceptron model on first use.
+    """
+    tagger = _TAGGERS.get('perceptron')
+    if tagger is None:
+        from nltk.tag.perceptron import PerceptronTagger
+        tagger = _TAGGERS['perceptron'] = CachedTagger(PerceptronTagger())
+    return tagger
+
+
+def pos_tag_tokens(tokens, mode='book'):
+    """
+    Tag a tokenized book with this process's tagger, returning (word, tag) pairs.
+    """
+    return get_tagger().tag(tokens, mode)
+
+
+class CachedTagger:
+    """
+    Wrap a PerceptronTagger, caching its predictions by feature window and by sentence.
+    """
+
+    def __init__(self, tagger, max_window_cache=2000000, max_sentence_cache=200000):
+        self._tagger = tagger
+        self._max_window_cache = max_window_cache
+        self._max_sentence_cache = max_sentence_cache
+        self._windows = {}
+        self._sentences = {}
+        self._lexicon = {}
+
+    def tag(self, tokens, mode='book'):
+        """
+        Return the (word, tag) pairs of tokens, tagged according to mode.
+        """
+        if mode == 'book':
+            tags = self.tag_sequence(tokens)
+        elif mode == 'sentence':
+            tags = []
+            start = 0
+            for i, token in enumerate(tokens):
+                if token in SENTENCE_END:
+                    tags.extend(self._tag_sentence(tokens[start:i + 1]))
+                    start = i + 1
+            if start < len(tokens):
+                tags.extend(self._tag_sentence(tokens[start:]))
+        elif mode == 'lexicon':
+            tags = [self._lexicon_tag(word) for word in tokens]
+        else:
+            raise ValueError(f'Unknown tag mode {mode!r}, expected one of {TAG_MODES}')
+
+        return list(zip(tokens, tags))
+
+    def tag_sequence(self, tokens):
+        """
+        Tag tokens as one sequence, returning the same tags as PerceptronTagger.tag.
+        """
+        tagger = self._tagger
+        tagdict = tagger.tagdict
+        windows = self._windows
+        prev, prev2 = tagger.START
+        context = tagger.START + [tagger.normalize(word) for word in tokens] + tagger.END
+
+        tags = []
+        for i, word in enumerate(tokens):
+            tag = tagdict.get(word)
+            if not tag:
+                # Everything the model's features are computed from
+                j = i + len(tagger.START)
+                window = (word[-3:], word[:1], prev, prev2, context[j - 2], context[j - 1], context[j],
+                          context[j + 1], context[j + 2])
+                tag = windows.get(window)
+                if tag is None:
+                    # PerceptronTagger.tag computes the features the same way, it has no public method for it
+                    features = tagger._get_features(i, word, context, prev, prev2)  # pylint: disable=protected-access
+                    tag, _ = tagger.model.predict(features)
+                    if len(windows) < self._max_window_cache:
+                        windows[window] = tag
+            tags.append(tag)
+            prev2 = prev
+            prev = tag
+
+        return tags
+
+    def _tag_sentence(self, sentence):
+        key = tuple(sentence)
+        tags = self._sentences.get(key)
+        if tags is None:
+            tags = self.tag_sequence(sentence)
+            if len(self._sentences) < self._max_sentence_cache:
+                self._sentences[key] = tags
+        return tags
+
+    def _lexicon_tag(self, word):
+        tag = self._lexicon.get(word)
+        if tag is None:
+            tag = self._tagger.tagdict.get(word)
+            if not tag:
+                lower = word.lower()
+                tag = next((suffix_tag for suffix, suffix_tag in SUFFIX_TAGS if lower.endswith(suffix)), 'NN')
+            if len(self._lexicon) < self._max_window_cache:
+                self._lexicon[word] = tag
+        return tag
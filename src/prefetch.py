@@ -0,0 +1,48 @@
+"""
+Prefetching book reader.
+
+Keeps up to queue_depth book reads in flight on a thread pool, so that on network filesystems and
+a cold page cache the loader waits on many reads at once instead of one after another, and the
+books can be handed to the tokenizer as they arrive.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+
+class MissingBooksError(FileNotFoundError):
+    """
+    Raised when books of a split can't be found, listing all of them at once.
+    """
+
+    def __init__(self, pg_ids, source=''):
+        self.pg_ids = list(pg_ids)
+        shown = ', '.join(self.pg_ids[:10]) + (', ...' if len(self.pg_ids) > 10 else '')
+        super().__init__(f'{len(self.pg_ids)} books {"in " + source + " " if source else ""}'
+                         f'could not be found: {shown}')
+
+
+def prefetch_books(read_book, pg_ids, queue_depth=32, num_threads=8):
+    """
+    Yield (index, pg_id, text) for each of pg_ids in order, where text = read_book(pg_id), while
+    keeping up to queue_depth reads in flight on num_threads threads.
+    A queue_depth of 0 reads the books one at a time on the calling thread.
+    """
+    if queue_depth <= 0:
+        for i, pg_id in enumerate(pg_ids):
+            yield i, pg_id, read_book(pg_id)
+        return
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        todo = enumerate(pg_ids)
+        in_flight = deque((i, pg_id, executor.submit(read_book, pg_id))
+                          for i, pg_id in islice(todo, queue_depth))
+
+        while in_flight:
+            i, pg_id, future = in_flight.popleft()
+
+            # Top the queue back up before waiting on the oldest read
+            for j, next_id in islice(todo, 1):
+                in_flight.append((j, next_id, executor.submit(read_book, next_id)))
+
+            yield i, pg_id, future.result()
@@ -0,0 +1,367 @@
+"""
+Sharded, resumable preprocessing.
+
+The books of each split are divided into shards of shard_size books, listed in a manifest in the
+output directory.  Any number of processes, on one host or on several hosts sharing the output
+directory, can then work through the shards: each claims a shard with a lock file, loads,
+tokenizes (and optionally enriches and lemmatizes) its books, and writes the shard's output
+atomically followed by a done marker.  A crash only loses the shards in progress, and rerunning
+picks up the shards that aren't done yet.  Once every shard is done, merge_shards puts the splits
+back together in their original order.
+
+    python -m src.sharding run <out_dir> --data-dir sample_dataset --gutenberg-repo ../gutenberg
+    python -m src.sharding status <out_dir>
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import argparse
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from src.columnar_store import FORMATS, read_frame, save_frame
+
+MANIFEST_FILE = 'manifest.json'
+SHARDS_DIR = 'shards'
+
+# Version of the manifest layout
+MANIFEST_VERSION = 1
+
+# Extension of each shard output format
+SHARD_FORMATS = dict(FORMATS, pickle='.pkl')
+
+# Seconds after which the lock of a shard that isn't refreshed is stale.  Owners touch their lock
+# every lock_timeout / HEARTBEATS_PER_TIMEOUT seconds while they process the shard.
+LOCK_TIMEOUT = 600
+HEARTBEATS_PER_TIMEOUT = 10
+
+
+def _write_atomic(path, data):
+    tmp_path = f'{path}.{socket.gethostname()}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ShardManifest:
+    """
+    The shards of a sharded run and the settings every shard is processed with.
+    """
+
+    def __init__(self, out_dir, splits, shards, settings):
+        self.out_dir = out_dir
+        self.splits = splits
+        self.shards = shards
+        self.settings = settings
+
+    @classmethod
+    def create(cls, out_dir, split_ids, shard_size, settings):
+        """
+        Plan the shards of split_ids ({split csv: [pg_id, ...]}) in out_dir, or load the existing
+        manifest if there is one, checking it was created with the same books and settings.
+        """
+        shards = []
+        for split, pg_ids in split_ids.items():
+            for i, start in enumerate(range(0, len(pg_ids), shard_size)):
+                name = os.path.splitext(split)[0]
+                shards.append({'shard_id': f'{name}-{i:05d}', 'split': split,
+                               'pg_ids': list(pg_ids[start:start + shard_size])})
+        manifest = cls(out_dir, list(split_ids), shards, dict(settings, shard_size=shard_size))
+
+        path = os.path.join(out_dir, MANIFEST_FILE)
+        if os.path.exists(path):
+            existing = cls.load(out_dir)
+            if (existing.splits, existing.shards, existing.settings) != (manifest.splits, manifest.shards,
+                                                                         manifest.settings):
+                raise ValueError(f'{path} was created with different books or settings, '
+                                 f'use another output directory or remove it to start over')
+            return existing
+
+        os.makedirs(os.path.join(out_dir, SHARDS_DIR), exist_ok=True)
+        # Several hosts may plan the same run at once, they all write the same manifest
+        _write_atomic(path, json.dumps({'version': MANIFEST_VERSION, 'splits': manifest.splits,
+                                        'settings': manifest.settings, 'shards': shards}))
+        return manifest
+
+    @classmethod
+    def load(cls, out_dir):
+        """
+        Load the manifest of out_dir.
+        """
+        with open(os.path.join(out_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data['version'] != MANIFEST_VERSION:
+            raise ValueError(f'Unsupported shard manifest version {data["version"]}')
+        return cls(out_dir, data['splits'], data['shards'], data['settings'])
+
+    def _path(self, shard_id, suffix):
+        return os.path.join(self.out_dir, SHARDS_DIR, shard_id + suffix)
+
+    def output_path(self, shard_id):
+        """
+        Path of a shard's output.
+        """
+        return self._path(shard_id, SHARD_FORMATS[self.settings['format']])
+
+    def is_done(self, shard_id):
+        """
+        Whether a shard's output has been written.
+        """
+        return os.path.exists(self._path(shard_id, '.done'))
+
+    def pending(self):
+        """
+        The shards that aren't done yet.
+        """
+        return [shard for shard in self.shards if not self.is_done(shard['shard_id'])]
+
+    def claim(self, shard_id, lock_timeout=LOCK_TIMEOUT):
+        """
+        Try to take a shard's lock, returning whether this process now owns the shard.
+        Locks not refreshed for lock_timeout seconds, or held by a dead process on this host, are
+        stale and get taken over.  Of several processes taking over the same lock, one wins.
+        """
+        lock_path = self._path(shard_id, '.lock')
+        if self._create_lock(lock_path):
+            return True
+
+        stale_owner = self._stale_owner(lock_path, lock_timeout)
+        if stale_owner is None:
+            return False
+
+        # Move the stale lock out of the way under a name of our own: only one of the processes
+        # taking it over can rename it, the others find it gone
+        moved_path = f'{lock_path}.{uuid.uuid4().hex}.stale'
+        try:
+            os.rename(lock_path, moved_path)
+        except FileNotFoundError:
+            return False
+
+        # Unless the lock we moved is still the stale one (not taken over or refreshed in between),
+        # it is live and goes back
+        moved_owner = self._stale_owner(moved_path, lock_timeout)
+        if moved_owner is None or moved_owner.get('token') != stale_owner.get('token'):
+            try:
+                os.link(moved_path, lock_path)
+            except FileExistsError:
+                pass
+            os.remove(moved_path)
+            return False
+
+        os.remove(moved_path)
+        return self._create_lock(lock_path)
+
+    def _create_lock(self, lock_path):
+        """
+        Create a lock owned by this process if there is none, returning whether it was created.
+        """
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+
+        owner = {'host': socket.gethostname(), 'pid': os.getpid(), 'time': time.time(),
+                 'token': uuid.uuid4().hex}
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(owner, f)
+        return True
+
+    @staticmethod
+    def _read_owner(lock_path):
+        try:
+            with open(lock_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Being written (or removed) right now
+            return None
+
+    def _stale_owner(self, lock_path, lock_timeout):
+        """
+        The owner of a stale lock, or None if the lock is live (or gone).
+        """
+        owner = self._read_owner(lock_path)
+        if owner is None:
+            return None
+
+        # Owners refresh the lock's modification time while they work on the shard
+        try:
+            age = time.time() - os.path.getmtime(lock_path)
+        except FileNotFoundError:
+            return None
+        if age > lock_timeout:
+            return owner
+        if owner['host'] == socket.gethostname():
+            try:
+                os.kill(owner['pid'], 0)
+            except ProcessLookupError:
+                return owner
+            except PermissionError:
+                pass
+        return None
+
+    @contextmanager
+    def holding(self, shard_id, lock_timeout=LOCK_TIMEOUT):
+        """
+        Refresh the lock of a claimed shard on a background thread while the enclosed code runs,
+        so a shard taking longer than lock_timeout isn't taken over while it is being processed.
+        """
+        lock_path = self._path(shard_id, '.lock')
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(lock_timeout / HEARTBEATS_PER_TIMEOUT):
+                try:
+                    os.utime(lock_path)
+                except FileNotFoundError:
+                    # Moved aside for a moment by a process checking whether it is stale
+                    pass
+
+        thread = threading.Thread(target=heartbeat, name=f'heartbeat-{shard_id}', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def write_output(self, shard, df):
+        """
+        Write a shard's output atomically, then mark it done and release its lock.
+        """
+        path = self.output_path(shard['shard_id'])
+        if self.settings['format'] == 'pickle':
+            tmp_path = f'{path}.{socket.gethostname()}.{os.getpid()}.tmp'
+            df.to_pickle(tmp_path, compression=None)
+            os.replace(tmp_path, path)
+        else:
+            save_frame(df, path, file_format=self.settings['format'])
+
+        _write_atomic(self._path(shard['shard_id'], '.done'),
+                      json.dumps({'host': socket.gethostname(), 'pid': os.getpid(), 'time': time.time(),
+                                  'num_books': len(df)}))
+        try:
+            os.remove(self._path(shard['shard_id'], '.lock'))
+        except FileNotFoundError:
+            pass
+
+    def read_output(self, shard_id):
+        """
+        Read a shard's output.
+        """
+        path = self.output_path(shard_id)
+        if self.settings['format'] == 'pickle':
+            return pd.read_pickle(path, compression=None)
+        return read_frame(path)
+
+
+def process_shards(loader, out_dir, train_csv='final_train.csv', val_csv='final_val.csv',
+                   test_csv='final_test.csv', *, skip_first_and_last_words=100, enrich_df=False,
+                   lemmatize=True, shard_size=500, file_format='arrow', max_shards=None,
+                   lock_timeout=LOCK_TIMEOUT):
+    """
+    Process the pending shards of a sharded run in out_dir with loader, planning the run first
+    if needed.  Safe to run from several processes or hosts at once.
+    Stops after max_shards shards if given.  Returns the number of shards processed.
+    """
+    if file_format not in SHARD_FORMATS:
+        raise ValueError(f'file_format must be one of {sorted(SHARD_FORMATS)}, not {file_format!r}')
+
+    split_ids = {csv_file: loader.read_split_csv(csv_file)['id'].tolist()
+                 for csv_file in (train_csv, val_csv, test_csv)}
+    settings = {'skip_first_and_last_words': skip_first_and_last_words, 'enrich_df': enrich_df,
+                'lemmatize': lemmatize, 'format': file_format}
+    manifest = ShardManifest.create(out_dir, split_ids, shard_size, settings)
+
+    num_processed = 0
+    for shard in manifest.pending():
+        if max_shards is not None and num_processed >= max_shards:
+            break
+        if not manifest.claim(shard['shard_id'], lock_timeout):
+            continue
+        # Another process may have finished it between listing and claiming
+        if manifest.is_done(shard['shard_id']):
+            continue
+
+        with manifest.holding(shard['shard_id'], lock_timeout):
+            df = loader.process_split(shard['split'], skip_first_and_last_words, pg_ids=shard['pg_ids'],
+                                      enrich_df=enrich_df, lemmatize=lemmatize, name=shard['shard_id'])
+            # Ids from the loader's vocabulary mean nothing to other processes, store the tokens
+            manifest.write_output(shard, loader.decode_frame(df))
+        num_processed += 1
+
+    return num_processed
+
+
+def merge_shards(out_dir, vocabulary=None):
+    """
+    Put the splits of a finished sharded run back together, returning {split csv: df} in the
+    order of the manifest.  With a vocabulary, token columns are encoded as int32 id arrays.
+    """
+    manifest = ShardManifest.load(out_dir)
+    pending = manifest.pending()
+    if pending:
+        shown = ', '.join(shard['shard_id'] for shard in pending[:10])
+        raise RuntimeError(f'{len(pending)} shards of {out_dir} are not done yet: {shown}'
+                           f'{", ..." if len(pending) > 10 else ""}')
+
+    frames = {split: [] for split in manifest.splits}
+    for shard in manifest.shards:
+        frames[shard['split']].append(manifest.read_output(shard['shard_id']))
+
+    merged = {}
+    for split, dfs in frames.items():
+        df = pd.concat(dfs) if dfs else pd.DataFrame()
+        if vocabulary is not None:
+            for column in ('tokenized', 'lemmatized'):
+                if column in df:
+                    df[column] = [None if tokens is None else vocabulary.encode(tokens) for tokens in df[column]]
+        merged[split] = df
+
+    return merged
+
+
+def shard_status(out_dir):
+    """
+    Return (number of shards done, total number of shards) of a sharded run.
+    """
+    manifest = ShardManifest.load(out_dir)
+    return len(manifest.shards) - len(manifest.pending()), len(manifest.shards)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sharded, resumable preprocessing of the splits')
+    parser.add_argument('command', choices=('run', 'status'))
+    parser.add_argument('out_dir')
+    parser.add_argument('--data-dir', default='sample_dataset')
+    parser.add_argument('--gutenberg-repo', default=None)
+    parser.add_argument('--num-threads', type=int, default=None)
+    parser.add_argument('--skip-first-and-last-words', type=int, default=100)
+    parser.add_argument('--enrich', action='store_true')
+    parser.add_argument('--no-lemmatize', action='store_true')
+    parser.add_argument('--shard-size', type=int, default=500)
+    parser.add_argument('--format', choices=sorted(SHARD_FORMATS), default='arrow')
+    parser.add_argument('--max-shards', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        from src.data_loader import GutenbergDataLoader
+
+        with GutenbergDataLoader(args.data_dir, gutenberg_repo_path=args.gutenberg_repo,
+                                 num_threads=args.num_threads) as loader:
+            num_processed = process_shards(loader, args.out_dir,
+                                           skip_first_and_last_words=args.skip_first_and_last_words,
+                                           enrich_df=args.enrich, lemmatize=not args.no_lemmatize,
+                                           shard_size=args.shard_size, file_format=args.format,
+                                           max_shards=args.max_shards)
+        print(f'Processed {num_processed} shards')
+
+    done, total = shard_status(args.out_dir)
+    print(f'{done}/{total} shards done')
+
+
+if __name__ == '__main__':
+    main()
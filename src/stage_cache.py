@@ -0,0 +1,132 @@
+"""
+Content-addressed on-disk cache for the per-book output of the loader's processing stages.
+
+Entries are keyed on everything that determines a stage's output for one book: the PG id, the
+hash of its raw text file, the number of words trimmed from either end, the stage name and the
+version of the tokenizer/lemmatizer that produced it.  The cache is bounded in size and evicts
+least recently used entries first.
+"""
+import os
+import pickle
+import hashlib
+from collections import OrderedDict
+
+CACHE_SUFFIX = '.pkl'
+
+
+def make_cache_key(pg_id, content_hash, skip_first_and_last_words, stage, version):
+    """
+    Build the cache key of one book's output for a stage.
+    """
+    key = '\0'.join(str(part) for part in (pg_id, content_hash, skip_first_and_last_words, stage, version))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class StageCache:
+    """
+    Size-bounded LRU cache of pickled stage outputs, one file per entry under cache_dir.
+
+    Recency is kept in the file modification times, so it survives between runs.
+    """
+
+    def __init__(self, cache_dir, max_bytes=8 * 2**30):
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self._total_bytes = 0
+        self._entries = OrderedDict()
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Rebuild the LRU order from what is already on disk, oldest first
+        found = []
+        for sub_dir in os.scandir(cache_dir):
+            if not sub_dir.is_dir():
+                continue
+            for entry in os.scandir(sub_dir.path):
+                if entry.name.endswith(CACHE_SUFFIX):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.name[:-len(CACHE_SUFFIX)], stat.st_size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def total_bytes(self):
+        """
+        Total size of the cached entries on disk.
+        """
+        return self._total_bytes
+
+    def _path(self, key):
+        return os.path.join(self._cache_dir, key[:2], key + CACHE_SUFFIX)
+
+    def get(self, key):
+        """
+        Return the cached value for key, or None if it is not cached.
+        """
+        if key not in self._entries:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # Removed or corrupted behind our back, treat it as a miss
+            self._forget(key)
+            return None
+
+        self._entries.move_to_end(key)
+        os.utime(path)
+        return value
+
+    def put(self, key, value):
+        """
+        Cache value under key, evicting the least recently used entries if over the size limit.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file and rename, so readers never see a partial entry
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        if key in self._entries:
+            self._total_bytes -= self._entries[key]
+        self._entries[key] = os.path.getsize(path)
+        self._entries.move_to_end(key)
+        self._total_bytes += self._entries[key]
+
+        self._evict()
+
+    def _forget(self, key):
+        self._total_bytes -= self._entries.pop(key)
+
+    def _evict(self):
+        while self._total_bytes > self._max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            self._forget(key)
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """
+        Remove every entry from the cache.
+        """
+        for key in list(self._entries):
+            self._forget(key)
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
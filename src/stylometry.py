@@ -0,0 +1,148 @@
+"""
+Stylometric features of books or chunks, as fixed-length float32 vectors.
+
+Character features come from one pass over the text's code points (np.bincount over the ASCII
+range, the few non-ASCII characters are checked one distinct character at a time), and word
+features from the Treebank tokens: word-length and sentence-length distributions, type-token and
+hapax ratios, function-word frequencies and two readability indices that only need character,
+word and sentence counts.  FEATURE_NAMES lists the columns in order.
+"""
+from collections import Counter
+
+import numpy as np
+
+from src.chunking import word_starts
+from src.pos_tagging import SENTENCE_END
+
+# Frequent English function words, counted per word
+FUNCTION_WORDS = (
+    'a', 'about', 'after', 'all', 'an', 'and', 'any', 'as', 'at', 'be', 'but', 'by', 'can', 'could',
+    'do', 'for', 'from', 'had', 'has', 'have', 'he', 'her', 'his', 'i', 'if', 'in', 'into', 'is', 'it',
+    'its', 'may', 'me', 'might', 'more', 'must', 'my', 'no', 'not', 'now', 'of', 'on', 'one', 'only',
+    'or', 'our', 'shall', 'she', 'should', 'so', 'some', 'such', 'than', 'that', 'the', 'their',
+    'them', 'then', 'there', 'these', 'they', 'this', 'those', 'thus', 'to', 'upon', 'us', 'very',
+    'was', 'we', 'were', 'what', 'when', 'which', 'who', 'will', 'with', 'would', 'you', 'your')
+
+# Punctuation characters, counted per character
+PUNCTUATION = '.,!?;:-\'"()'
+
+# Word lengths 1..MAX_WORD_LENGTH, the last bin holding the longer words too
+MAX_WORD_LENGTH = 15
+
+# Sentence length bins in tokens, [edge, next edge)
+SENTENCE_LENGTH_EDGES = (1, 6, 11, 16, 21, 31, 41, 61)
+
+FEATURE_NAMES = (
+    ('avg_word_length', 'std_word_length')
+    + tuple(f'word_length_{n}' for n in range(1, MAX_WORD_LENGTH)) + (f'word_length_{MAX_WORD_LENGTH}+',)
+    + ('avg_sentence_length', 'std_sentence_length', 'median_sentence_length')
+    + tuple(f'sentence_length_{start}-{end - 1}'
+            for start, end in zip(SENTENCE_LENGTH_EDGES, SENTENCE_LENGTH_EDGES[1:]))
+    + (f'sentence_length_{SENTENCE_LENGTH_EDGES[-1]}+',)
+    + ('type_token_ratio', 'hapax_ratio')
+    + tuple(f'punct_{char}' for char in PUNCTUATION)
+    + ('uppercase_ratio', 'digit_ratio', 'whitespace_ratio')
+    + ('automated_readability_index', 'coleman_liau_index')
+    + tuple(f'fw_{word}' for word in FUNCTION_WORDS))
+
+NUM_FEATURES = len(FEATURE_NAMES)
+
+# Per ASCII code point: whether it is uppercase, a digit, whitespace
+_ASCII = [chr(i) for i in range(128)]
+_ASCII_UPPER = np.array([c.isupper() for c in _ASCII])
+_ASCII_DIGIT = np.array([c.isdigit() for c in _ASCII])
+_ASCII_SPACE = np.array([c.isspace() for c in _ASCII])
+_PUNCTUATION_CODES = np.array([ord(c) for c in PUNCTUATION])
+
+
+def _safe_ratio(numerator, denominator):
+    return numerator / denominator if denominator else 0.0
+
+
+def _character_features(text):
+    """
+    Punctuation rates, then uppercase, digit and whitespace ratios, all per character.
+    """
+    code_points = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+    num_chars = len(code_points)
+    ascii_counts = np.bincount(code_points[code_points < 128], minlength=128)
+
+    upper = int(ascii_counts[_ASCII_UPPER].sum())
+    digit = int(ascii_counts[_ASCII_DIGIT].sum())
+    space = int(ascii_counts[_ASCII_SPACE].sum())
+    other, other_counts = np.unique(code_points[code_points >= 128], return_counts=True)
+    for code, count in zip(other.tolist(), other_counts.tolist()):
+        char = chr(code)
+        upper += count * char.isupper()
+        digit += count * char.isdigit()
+        space += count * char.isspace()
+
+    punctuation = ascii_counts[_PUNCTUATION_CODES] / num_chars if num_chars else np.zeros(len(PUNCTUATION))
+    return list(punctuation) + [_safe_ratio(upper, num_chars), _safe_ratio(digit, num_chars),
+                                _safe_ratio(space, num_chars)]
+
+
+def _sentence_lengths(tokens):
+    """
+    Number of tokens of each sentence, sentences ending at SENTENCE_END tokens.
+    """
+    is_end = np.fromiter(map(SENTENCE_END.__contains__, tokens), dtype=bool, count=len(tokens))
+    ends = np.flatnonzero(is_end) + 1
+    if not len(ends) or ends[-1] != len(tokens):
+        ends = np.append(ends, len(tokens))
+    return np.diff(ends, prepend=0)[ends > 0]
+
+
+def document_features(text, tokens):
+    """
+    The FEATURE_NAMES vector of one document, from its text and its tokens.
+    """
+    words = list(filter(str.isalpha, tokens))
+    num_words = len(words)
+    word_lengths = np.fromiter(map(len, words), dtype=np.int64, count=num_words)
+    length_bins = np.bincount(np.minimum(word_lengths, MAX_WORD_LENGTH), minlength=MAX_WORD_LENGTH + 1)[1:]
+
+    sentence_lengths = _sentence_lengths(tokens)
+    num_sentences = len(sentence_lengths)
+    sentence_bins = np.bincount(np.searchsorted(SENTENCE_LENGTH_EDGES, sentence_lengths, side='right') - 1,
+                                minlength=len(SENTENCE_LENGTH_EDGES))
+
+    word_counts = Counter(map(str.lower, words))
+    type_counts = np.fromiter(word_counts.values(), dtype=np.int64, count=len(word_counts))
+    num_letters = int(word_lengths.sum())
+
+    features = [word_lengths.mean() if num_words else 0.0, word_lengths.std() if num_words else 0.0]
+    features.extend(length_bins / num_words if num_words else np.zeros(MAX_WORD_LENGTH))
+    features.extend([sentence_lengths.mean() if num_sentences else 0.0,
+                     sentence_lengths.std() if num_sentences else 0.0,
+                     np.median(sentence_lengths) if num_sentences else 0.0])
+    features.extend(sentence_bins / num_sentences if num_sentences else sentence_bins)
+    features.extend([_safe_ratio(len(word_counts), num_words), _safe_ratio(int((type_counts == 1).sum()), num_words)])
+    features.extend(_character_features(text))
+
+    # Readability from letters, words and sentences only
+    if num_words and num_sentences:
+        features.append(4.71 * num_letters / num_words + 0.5 * num_words / num_sentences - 21.43)
+        features.append(5.88 * num_letters / num_words - 29.6 * num_sentences / num_words - 15.8)
+    else:
+        features.extend([0.0, 0.0])
+
+    features.extend(_safe_ratio(word_counts.get(word, 0), num_words) for word in FUNCTION_WORDS)
+    return np.array(features, dtype=np.float32)
+
+
+def book_features(text, tokenizer, tokens=None, offsets=None):
+    """
+    Features of a book as a (1, NUM_FEATURES) array, or of each of its chunks as a
+    (len(offsets), NUM_FEATURES) array given [start, end) word offsets into the text.
+    Tokens are made with tokenizer unless the book's tokens are given (whole books only).
+    """
+    if offsets is None:
+        return document_features(text, tokenizer(text) if tokens is None else tokens)[None]
+
+    starts = word_starts(text)
+    features = np.empty((len(offsets), NUM_FEATURES), dtype=np.float32)
+    for i, (start, end) in enumerate(offsets):
+        chunk = text[starts[start]:starts[end] - 1]
+        features[i] = document_features(chunk, tokenizer(chunk))
+    return features
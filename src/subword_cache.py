@@ -0,0 +1,229 @@
+"""
+Pre-tokenized subword ids of whole books, for sampling transformer training windows.
+
+Each book is run through a subword tokenizer (e.g. a HuggingFace AutoTokenizer) once, in batches,
+and its ids are appended to one int32 file with a PG id -> [start, end) offset index, the same
+layout as the packed book store.  The file is memory-mapped, so fixed-length windows are drawn
+by offset arithmetic and a fancy index into the mapping, without any string work:
+
+    tail_windows    the last windows of each book, as PreTrained_Transformer.ipynb samples them
+    random_windows  windows at random offsets
+
+Both skip the first strip_tokens ids of each book (author name and title) and wrap around books
+too short for the windows asked for, which is what repeating the book until it is long enough
+amounts to.
+"""
+import os
+import json
+from collections.abc import Mapping
+
+import numpy as np
+
+TOKENS_FILE = 'tokens.i32'
+INDEX_FILE = 'index.npz'
+META_FILE = 'meta.json'
+
+
+def _encode_batch(tokenizer, texts):
+    """
+    Subword ids of each of texts, from a HuggingFace tokenizer or any callable returning lists of ids.
+    """
+    output = tokenizer(texts)
+    return output['input_ids'] if isinstance(output, Mapping) else output
+
+
+def build_subword_cache(cache_dir, books, tokenizer, batch_size=64):
+    """
+    Tokenize books, an iterable of (pg_id, text) with None for missing texts, batch_size books at a
+    time and write their ids to cache_dir, replacing any previous cache.  Returns the SubwordCache.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    tokens_path = os.path.join(cache_dir, TOKENS_FILE)
+    tmp_path = f'{tokens_path}.{os.getpid()}.tmp'
+
+    ids = []
+    offsets = [0]
+    batch_ids = []
+    batch_texts = []
+
+    def flush(f):
+        for pg_id, book_ids in zip(batch_ids, _encode_batch(tokenizer, batch_texts)):
+            book_ids = np.asarray(book_ids, dtype=np.int32)
+            f.write(book_ids.tobytes())
+            ids.append(pg_id)
+            offsets.append(offsets[-1] + len(book_ids))
+        batch_ids.clear()
+        batch_texts.clear()
+
+    with open(tmp_path, 'wb') as f:
+        for pg_id, text in books:
+            if text is None:
+                continue
+            batch_ids.append(pg_id)
+            batch_texts.append(text)
+            if len(batch_texts) >= batch_size:
+                flush(f)
+        if batch_texts:
+            flush(f)
+    os.replace(tmp_path, tokens_path)
+
+    # The index is written last, a cache is only complete once it matches the tokens
+    index_path = os.path.join(cache_dir, INDEX_FILE)
+    tmp_path = f'{index_path}.{os.getpid()}.tmp.npz'
+    np.savez(tmp_path, id=np.asarray(ids, dtype=str), offsets=np.asarray(offsets, dtype=np.int64))
+    os.replace(tmp_path, index_path)
+
+    name = getattr(tokenizer, 'name_or_path', None) or type(tokenizer).__name__
+    with open(os.path.join(cache_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'tokenizer': name, 'num_books': len(ids), 'num_tokens': offsets[-1]}, f)
+
+    return SubwordCache(cache_dir)
+
+
+class SubwordCache:
+    """
+    Memory-mapped int32 subword ids of books, indexed by PG id.
+    """
+
+    def __init__(self, cache_dir):
+        self._cache_dir = cache_dir
+        with np.load(os.path.join(cache_dir, INDEX_FILE)) as index:
+            self._ids = index['id']
+            self._offsets = index['offsets']
+        self._positions = {pg_id: i for i, pg_id in enumerate(self._ids.tolist())}
+
+        with open(os.path.join(cache_dir, META_FILE), 'r', encoding='utf-8') as f:
+            self.tokenizer_name = json.load(f)['tokenizer']
+
+        # np.memmap refuses to map an empty file
+        if self._offsets[-1] > 0:
+            self._tokens = np.memmap(os.path.join(cache_dir, TOKENS_FILE), dtype=np.int32, mode='r',
+                                     shape=(int(self._offsets[-1]),))
+        else:
+            self._tokens = np.empty(0, dtype=np.int32)
+
+    def __contains__(self, pg_id):
+        return pg_id in self._positions
+
+    def __len__(self):
+        return len(self._ids)
+
+    def ids(self):
+        """
+        Return the PG ids in the cache, in the order they were tokenized.
+        """
+        return self._ids.tolist()
+
+    def tokens(self, pg_id):
+        """
+        Return the subword ids of a book as a read-only int32 view into the mapping.
+        """
+        i = self._positions[pg_id]
+        return self._tokens[self._offsets[i]:self._offsets[i + 1]]
+
+    def _book_spans(self, pg_ids, strip_tokens):
+        """
+        Start in the mapping and length of each book after stripping, skipping books (missing from
+        the cache, or with nothing left after stripping) that have no windows.
+        Returns (row of each kept book in pg_ids, starts, lengths).
+        """
+        rows = np.array([self._positions.get(pg_id, -1) for pg_id in pg_ids], dtype=np.int64)
+        kept = np.flatnonzero(rows >= 0)
+        starts = self._offsets[rows[kept]] + strip_tokens
+        lengths = self._offsets[rows[kept] + 1] - starts
+        has_tokens = lengths > 0
+        return kept[has_tokens], starts[has_tokens], lengths[has_tokens]
+
+    def window_positions(self, pg_ids, window_starts, window_length=512, strip_tokens=100):
+        """
+        Positions in the mapping of windows of window_length ids, given the start of each window
+        relative to its book's stripped ids as a (len(pg_ids), num_windows) array.  Windows running
+        past the end of a book wrap around to its start.
+        Returns (positions, a (num_windows_total, window_length) int64 array, and book_rows, the
+        row in pg_ids of each window's book).
+        """
+        window_starts = np.asarray(window_starts, dtype=np.int64)
+        kept, starts, lengths = self._book_spans(pg_ids, strip_tokens)
+        window_starts = window_starts[kept]
+
+        steps = np.arange(window_length, dtype=np.int64)
+        relative = (window_starts[:, :, None] + steps) % lengths[:, None, None]
+        positions = (starts[:, None, None] + relative).reshape(-1, window_length)
+        book_rows = np.repeat(kept, window_starts.shape[1])
+        return positions, book_rows
+
+    def tail_offsets(self, pg_ids, num_windows, window_length=512, strip_tokens=100, max_windows=None):
+        """
+        Starts of the last num_windows of the max_windows consecutive windows ending each book
+        (num_windows by default), relative to the book's stripped ids.  Books shorter than
+        max_windows windows are laid out as the notebook does: repeated until long enough.
+        """
+        max_windows = num_windows if max_windows is None else max_windows
+        if num_windows > max_windows:
+            raise ValueError(f'num_windows ({num_windows}) must be at most max_windows ({max_windows})')
+
+        rows = np.array([self._positions.get(pg_id, -1) for pg_id in pg_ids], dtype=np.int64)
+        lengths = np.zeros(len(rows), dtype=np.int64)
+        found = rows >= 0
+        lengths[found] = np.maximum(np.diff(self._offsets)[rows[found]] - strip_tokens, 0)
+
+        needed = max_windows * window_length
+        # The book doubled until it holds needed ids
+        repeated = lengths.copy()
+        short = (repeated > 0) & (repeated < needed)
+        while short.any():
+            repeated[short] *= 2
+            short = (repeated > 0) & (repeated < needed)
+
+        first = (max_windows - num_windows + np.arange(num_windows, dtype=np.int64)) * window_length
+        return repeated[:, None] - needed + first
+
+    def tail_windows(self, pg_ids, num_windows, window_length=512, strip_tokens=100, max_windows=None):
+        """
+        The last num_windows windows of each book (see tail_offsets), as a (num_windows_total,
+        window_length) int32 array, along with the row in pg_ids of each window's book.
+        """
+        window_starts = self.tail_offsets(pg_ids, num_windows, window_length, strip_tokens, max_windows)
+        positions, book_rows = self.window_positions(pg_ids, window_starts, window_length, strip_tokens)
+        return self._tokens[positions], book_rows
+
+    def random_windows(self, pg_ids, num_windows, window_length=512, strip_tokens=100, seed=None):
+        """
+        num_windows windows at uniformly random offsets in each book, drawn as tail_windows returns
+        them.  Books shorter than a window get windows wrapping around their start.
+        """
+        rng = np.random.default_rng(seed)
+        rows = np.array([self._positions.get(pg_id, -1) for pg_id in pg_ids], dtype=np.int64)
+        lengths = np.zeros(len(rows), dtype=np.int64)
+        found = rows >= 0
+        lengths[found] = np.diff(self._offsets)[rows[found]] - strip_tokens
+        high = np.maximum(lengths - window_length, 0) + 1
+        window_starts = rng.integers(0, high[:, None], size=(len(rows), num_windows))
+
+        positions, book_rows = self.window_positions(pg_ids, window_starts, window_length, strip_tokens)
+        return self._tokens[positions], book_rows
+
+
+class WindowDataset:
+    """
+    Map-style dataset of windows from a SubwordCache, for a torch DataLoader.  Items are dicts of
+    int64 numpy arrays (input_ids, attention_mask, labels and, for Longformer, a
+    global_attention_mask on the first token), which the default collate turns into tensors.
+    """
+
+    def __init__(self, windows, labels, global_attention=False):
+        self.windows = windows
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.global_attention = global_attention
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        input_ids = self.windows[idx].astype(np.int64)
+        item = {'input_ids': input_ids, 'attention_mask': np.ones_like(input_ids), 'labels': self.labels[idx]}
+        if self.global_attention:
+            global_attention_mask = np.zeros_like(input_ids)
+            global_attention_mask[:1] = 1
+            item['global_attention_mask'] = global_attention_mask
+        return item
@@ -0,0 +1,322 @@
+"""
+Opt-in per-stage telemetry for GutenbergDataLoader.
+
+Records wall and CPU time (own and worker processes) per stage and split, bytes read, per-book
+latency histograms and the slowest books, worker utilization and peak memory.  Results are
+available as a TelemetryReport and, optionally, as a JSON-lines trace written as the run goes.
+A single stage can also be run under cProfile (including inside the worker processes) or
+tracemalloc.
+
+The workers are long-lived, so their CPU time and memory never show up in this process's
+children usage: the workers measure them around each chunk and send them back with the results.
+"""
+import os
+import sys
+import json
+import time
+import heapq
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+# Number of slowest books kept per stage
+NUM_SLOWEST = 10
+
+# Profilers of the worker processes, one per profile name
+_WORKER_PROFILERS = {}
+
+
+def peak_rss_bytes():
+    """
+    Peak resident set size so far of this process, or None where it can't be measured (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def latency_bucket(seconds):
+    """
+    Histogram bucket of a latency: the power of two of milliseconds it falls under.
+    """
+    milliseconds = seconds * 1000
+    bucket = 1
+    while bucket < milliseconds:
+        bucket *= 2
+    return bucket
+
+
+class ProfiledFunction:
+    """
+    Wrap a worker function so every call runs under a per-process cProfile.  The worker pool
+    collects the stats after each chunk and sends them back for the parent to merge under name.
+    """
+
+    def __init__(self, func, name):
+        self.func = func
+        self.name = name
+
+    def __call__(self, item):
+        profiler = _WORKER_PROFILERS.get(self.name)
+        if profiler is None:
+            profiler = _WORKER_PROFILERS[self.name] = cProfile.Profile()
+
+        profiler.enable()
+        try:
+            return self.func(item)
+        finally:
+            profiler.disable()
+
+    def collect(self):
+        """
+        The stats gathered in this process since the last collect, as a WorkerProfile, or None.
+        """
+        profiler = _WORKER_PROFILERS.pop(self.name, None)
+        if profiler is None:
+            return None
+        profiler.create_stats()
+        return WorkerProfile(self.name, profiler.stats)
+
+
+class WorkerProfile:
+    """
+    cProfile stats sent back by a worker, in the form pstats.Stats loads.
+    """
+
+    def __init__(self, name, stats):
+        self.name = name
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class TelemetryReport:
+    """
+    Structured results of a run: one entry per stage and split, and per-stage book latencies.
+    """
+
+    def __init__(self, stages, books):
+        self.stages = stages
+        self.books = books
+
+    def to_dict(self):
+        """
+        The report as plain, JSON serializable data.
+        """
+        return {'stages': self.stages, 'books': self.books}
+
+    def slowest_books(self, stage):
+        """
+        The slowest books of a stage, as (seconds, label) pairs, slowest first.
+        """
+        return self.books.get(stage, {}).get('slowest', [])
+
+    def summary(self):
+        """
+        One line per stage and split, for printing.
+        """
+        def megabytes(num_bytes):
+            return '' if num_bytes is None else f'{num_bytes / 2**20:.1f}'
+
+        lines = [f'{"stage":<14} {"split":<16} {"wall s":>9} {"cpu s":>9} {"workers cpu s":>14} '
+                 f'{"util":>6} {"MB read":>9} {"peak MB":>9} {"worker MB":>10}']
+        for entry in self.stages:
+            utilization = entry.get('worker_utilization')
+            lines.append(f'{entry["stage"]:<14} {entry["split"] or "":<16} {entry["wall_s"]:>9.3f} '
+                         f'{entry["cpu_s"]:>9.3f} {entry["worker_cpu_s"]:>14.3f} '
+                         f'{"" if utilization is None else f"{utilization:.0%}":>6} '
+                         f'{entry["bytes_read"] / 2**20:>9.1f} {megabytes(entry["peak_rss_bytes"]):>9} '
+                         f'{megabytes(entry["peak_worker_rss_bytes"]):>10}')
+        return '\n'.join(lines)
+
+
+class LoaderTelemetry:
+    """
+    Collect timings for the loader's stages.
+
+    trace_path: append a JSON line per stage (and per book) to this file as the run goes.
+    profile_stage: run this stage under profiler, 'cprofile' or 'tracemalloc'.  cProfile stats,
+    merged with those of the worker processes, are written to profile_dir/<stage>[.<split>].prof.
+    """
+
+    def __init__(self, trace_path=None, profile_stage=None, profiler='cprofile', profile_dir='.'):
+        if profiler not in ('cprofile', 'tracemalloc'):
+            raise ValueError(f"profiler must be 'cprofile' or 'tracemalloc', not {profiler!r}")
+
+        self._trace_path = trace_path
+        self._profile_stage = profile_stage
+        self._profiler = profiler
+        self._profile_dir = profile_dir
+        self._lock = threading.Lock()
+
+        self._stages = []
+        self._latencies = {}
+        self._slowest = {}
+        self._bytes_read = 0
+        self._busy = 0.0
+        self._worker_cpu = 0.0
+        self._worker_rss = None
+        self._worker_profiles = {}
+        self._current = None
+
+    def _trace(self, event):
+        if self._trace_path is None:
+            return
+        with self._lock, open(self._trace_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(event) + '\n')
+
+    def profiles(self, stage):
+        """
+        Whether the worker functions of stage should be wrapped in ProfiledFunction.
+        """
+        return stage == self._profile_stage and self._profiler == 'cprofile'
+
+    def profile_name(self, stage, split=None):
+        """
+        Name the cProfile stats of stage on split are merged and written under.
+        """
+        return stage if split is None else f'{stage}.{split}'
+
+    @contextmanager
+    def stage(self, name, split=None, num_workers=None):
+        """
+        Time the enclosed code as one run of a stage on a split.
+        """
+        profiling = name == self._profile_stage
+        profiler = None
+        if profiling and self._profiler == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        elif profiling:
+            tracemalloc.start()
+
+        with self._lock:
+            outer = self._current
+            self._current = {'bytes_read': self._bytes_read, 'busy': self._busy,
+                             'worker_cpu': self._worker_cpu, 'worker_rss': None}
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - start_cpu
+            with self._lock:
+                current = self._current
+                bytes_read = self._bytes_read - current['bytes_read']
+                busy = self._busy - current['busy']
+                worker_cpu = self._worker_cpu - current['worker_cpu']
+                worker_profiles = self._worker_profiles
+                self._worker_profiles = {}
+                self._current = outer
+                # The workers of a nested stage also ran within the outer stage
+                if outer is not None and current['worker_rss'] is not None:
+                    outer['worker_rss'] = max(outer['worker_rss'] or 0, current['worker_rss'])
+
+            entry = {'stage': name,
+                     'split': split,
+                     'wall_s': wall,
+                     'cpu_s': cpu,
+                     'worker_cpu_s': worker_cpu,
+                     'bytes_read': bytes_read,
+                     'worker_busy_s': busy,
+                     'worker_utilization': (busy / (wall * num_workers)
+                                            if num_workers and busy and wall > 0 else None),
+                     'peak_rss_bytes': peak_rss_bytes(),
+                     'peak_worker_rss_bytes': current['worker_rss']}
+
+            if profiler is not None:
+                profiler.disable()
+                profile_name = self.profile_name(name, split)
+                entry['profile'] = self._write_profile(profile_name, profiler, worker_profiles.pop(profile_name, []))
+            elif profiling:
+                _, entry['tracemalloc_peak_bytes'] = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+            # Workers profiled under another stage's name, e.g. tokenizing while loading
+            if worker_profiles:
+                entry['worker_profiles'] = [self._write_profile(profile_name, None, profiles)
+                                            for profile_name, profiles in worker_profiles.items()]
+
+            with self._lock:
+                self._stages.append(entry)
+            self._trace({'event': 'stage', **entry})
+
+    def _write_profile(self, profile_name, profiler, worker_profiles):
+        """
+        Merge the parent's (if profiler isn't None) and the workers' cProfile stats into
+        profile_dir/<profile_name>.prof.
+        """
+        sources = ([profiler] if profiler is not None else []) + list(worker_profiles)
+        stats = pstats.Stats(*sources)
+
+        path = os.path.join(self._profile_dir, f'{profile_name}.prof')
+        stats.dump_stats(path)
+        return path
+
+    def record_read(self, label, seconds, num_bytes):
+        """
+        Record one book read.
+        """
+        with self._lock:
+            self._bytes_read += num_bytes
+        self.record_book('read', label, seconds)
+
+    def record_book(self, stage, label, seconds):
+        """
+        Record how long one book took in a stage.
+        """
+        with self._lock:
+            self._latencies.setdefault(stage, Counter())[latency_bucket(seconds)] += 1
+            slowest = self._slowest.setdefault(stage, [])
+            if len(slowest) < NUM_SLOWEST:
+                heapq.heappush(slowest, (seconds, str(label)))
+            elif seconds > slowest[0][0]:
+                heapq.heapreplace(slowest, (seconds, str(label)))
+        if self._trace_path is not None:
+            self._trace({'event': 'book', 'stage': stage, 'label': str(label), 'seconds': seconds})
+
+    def record_tasks(self, stage, labels, durations, usage=None):
+        """
+        Record the time worker processes spent on each of a chunk of books.  usage, as measured by
+        the worker around the chunk, holds its CPU seconds, peak RSS and WorkerProfile (or None).
+        """
+        with self._lock:
+            self._busy += sum(durations)
+            if usage is not None:
+                self._worker_cpu += usage['cpu_s']
+                if usage['profile'] is not None:
+                    self._worker_profiles.setdefault(usage['profile'].name, []).append(usage['profile'])
+                if usage['peak_rss_bytes'] is not None:
+                    self._worker_rss = max(self._worker_rss or 0, usage['peak_rss_bytes'])
+                    if self._current is not None:
+                        self._current['worker_rss'] = max(self._current['worker_rss'] or 0, usage['peak_rss_bytes'])
+        for label, seconds in zip(labels, durations):
+            self.record_book(stage, label, seconds)
+
+    def worker_usage(self):
+        """
+        CPU seconds the workers have spent on tasks so far and the largest peak RSS any of them
+        reported (None if unknown), as {'cpu_s': ..., 'peak_rss_bytes': ...}.
+        """
+        with self._lock:
+            return {'cpu_s': self._worker_cpu, 'peak_rss_bytes': self._worker_rss}
+
+    def report(self):
+        """
+        Return a TelemetryReport of everything recorded so far.
+        """
+        with self._lock:
+            books = {stage: {'latency_histogram_ms': dict(sorted(histogram.items())),
+                             'slowest': sorted(self._slowest.get(stage, []), reverse=True)}
+                     for stage, histogram in self._latencies.items()}
+            return TelemetryReport(list(self._stages), books)
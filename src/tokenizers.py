@@ -0,0 +1,272 @@
+"""
+Interchangeable tokenizer backends for the loader's tokenization stage.
+
+'nltk' is nltk.word_tokenize: Punkt sentence splitting, then the Treebank regex passes over each
+sentence.  'fast' reproduces it word by word: outside of sentence-final periods the Treebank
+rules only ever look inside a whitespace separated word, so each distinct word is run through
+them once and its tokens are looked up afterwards, and Punkt is replaced by a cheap
+sentence-boundary rule.  The two only differ on sentence-final periods that rule gets wrong.
+
+compare_tokenizers measures that difference on real books:
+
+    python -m src.tokenizers <gutenberg/data/text or packed store> --max-books 50
+"""
+import argparse
+import difflib
+from importlib.metadata import version
+
+# Read from the package metadata rather than nltk.__version__, importing nltk takes over a second
+NLTK_VERSION = version('nltk')
+
+# Words ending in a period that don't end a sentence, lowercased and without the period
+ABBREVIATIONS = frozenset((
+    'mr', 'mrs', 'messrs', 'ms', 'dr', 'st', 'mt', 'ft', 'rev', 'hon', 'prof', 'gen', 'col',
+    'capt', 'lieut', 'lt', 'sgt', 'maj', 'gov', 'sen', 'rep', 'esq', 'jr', 'sr', 'co', 'no', 'nos',
+    'vol', 'vols', 'ch', 'chap', 'p', 'pp', 'viz', 'vs', 'etc', 'cf', 'ibid', 'jan', 'feb', 'mar',
+    'apr', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec'))
+
+# Characters that may follow a sentence-final period, and that may open the next sentence
+_CLOSING = '"\'»”’)]}>'
+_OPENING = '"\'“‘«([{`'
+
+# Alphanumeric words the Treebank rules still split
+_SPLIT_WORDS = frozenset(('cannot', 'gimme', 'gonna', 'gotta', 'lemme', 'wanna'))
+
+# Bound on the number of distinct words each process remembers the tokens of
+MAX_MEMO_SIZE = 1000000
+
+
+# For each (starts a sentence, ends a sentence): the tokenizer that applies to the word, and the
+# surroundings it has in its sentence, which some of the rules look at.  Filled by _word_tokenizers.
+_WORD_TOKENIZERS = {}
+
+# Tokens of each word seen so far in this process, for each position in its sentence
+_MEMOS = {(starts, ends): {} for starts in (False, True) for ends in (False, True)}
+
+
+def _word_tokenizers():
+    """
+    The _WORD_TOKENIZERS, made on first use so importing this module doesn't import nltk.
+    """
+    if not _WORD_TOKENIZERS:
+        from nltk.tokenize.destructive import NLTKWordTokenizer
+
+        class _InnerWordTokenizer(NLTKWordTokenizer):
+            """
+            The Treebank tokenizer without the rules that split a period ending the sentence.
+            """
+            PUNCTUATION = [(regexp, substitution) for regexp, substitution in NLTKWordTokenizer.PUNCTUATION
+                           if not regexp.pattern.endswith(r'\s*$')]
+
+        _WORD_TOKENIZERS.update({(False, False): (_InnerWordTokenizer(), ' {} '),
+                                 (True, False): (_InnerWordTokenizer(), '{} '),
+                                 (False, True): (NLTKWordTokenizer(), ' {}'),
+                                 (True, True): (NLTKWordTokenizer(), '{}')})
+    return _WORD_TOKENIZERS
+
+
+def ends_sentence(word, next_word):
+    """
+    Whether word (ending in a period) ends a sentence, judging by the word itself and the next one.
+    """
+    core = word.rstrip(_CLOSING)
+    if not core.endswith('.') or core.endswith('..'):
+        return False
+    if next_word is None:
+        return True
+
+    stem = core[:-1].lstrip(_OPENING)
+    # Initials (J.), abbreviations (Mr.) and dotted abbreviations (U.S.)
+    if len(stem) <= 1 or stem.lower() in ABBREVIATIONS or '.' in stem:
+        return False
+
+    next_start = next_word.lstrip(_OPENING)
+    return next_start[:1].isupper() or next_start[:1].isdigit() or not next_start
+
+
+def fast_word_tokenize(text):
+    """
+    Tokenize text like nltk.word_tokenize, one distinct word at a time.
+    """
+    words = text.split()
+    tokens = []
+    starts_sentence = True
+    for i, word in enumerate(words):
+        ends = False
+        if word[-1] in _CLOSING or word[-1] == '.':
+            ends = ends_sentence(word, words[i + 1] if i + 1 < len(words) else None)
+
+        memo = _MEMOS[starts_sentence, ends]
+        word_tokens = memo.get(word)
+        if word_tokens is None:
+            if word.isalnum() and word.lower() not in _SPLIT_WORDS:
+                # None of the rules touch a plain word
+                word_tokens = [word]
+            else:
+                tokenizer, context = _word_tokenizers()[starts_sentence, ends]
+                word_tokens = tokenizer.tokenize(context.format(word))
+            if len(memo) < MAX_MEMO_SIZE:
+                memo[word] = word_tokens
+        tokens.extend(word_tokens)
+        starts_sentence = ends
+
+    return tokens
+
+
+class NLTKTokenizer:
+    """
+    nltk.word_tokenize, the reference Treebank tokenization.
+    """
+    name = 'nltk'
+    version = f'nltk-{NLTK_VERSION}-word_tokenize'
+
+    def __call__(self, text):
+        from nltk.tokenize import word_tokenize
+        return word_tokenize(text)
+
+
+class FastTokenizer:
+    """
+    fast_word_tokenize, Treebank tokenization word by word with a heuristic sentence splitter.
+    """
+    name = 'fast'
+    version = f'fast-treebank-1|nltk-{NLTK_VERSION}'
+
+    def __call__(self, text):
+        return fast_word_tokenize(text)
+
+
+TOKENIZERS = {tokenizer.name: tokenizer for tokenizer in (NLTKTokenizer, FastTokenizer)}
+
+
+def get_tokenizer(tokenizer='nltk'):
+    """
+    Return a tokenizer backend from its name, or tokenizer itself if it is already a backend
+    (any picklable callable with name and version attributes).
+    """
+    if isinstance(tokenizer, str):
+        if tokenizer not in TOKENIZERS:
+            raise ValueError(f'Unknown tokenizer {tokenizer!r}, expected one of {sorted(TOKENIZERS)}')
+        return TOKENIZERS[tokenizer]()
+    return tokenizer
+
+
+def diff_tokens(reference, candidate):
+    """
+    Yield (ref_start, ref_end, cand_start, cand_end) for each region where two tokenizations of
+    the same text differ.
+    """
+    if ''.join(reference) != ''.join(candidate):
+        # The tokens don't even spell the same text, fall back to a generic diff
+        matcher = difflib.SequenceMatcher(None, reference, candidate, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag != 'equal':
+                yield i1, i2, j1, j2
+        return
+
+    # Both spell the same characters, so they are back in step wherever a token boundary falls
+    # at the same position in both
+    i = j = 0
+    while i < len(reference) and j < len(candidate):
+        if reference[i] == candidate[j]:
+            i += 1
+            j += 1
+            continue
+
+        i0, j0 = i, j
+        ref_end = len(reference[i])
+        cand_end = len(candidate[j])
+        i += 1
+        j += 1
+        while ref_end != cand_end:
+            if ref_end < cand_end:
+                ref_end += len(reference[i])
+                i += 1
+            else:
+                cand_end += len(candidate[j])
+                j += 1
+        yield i0, i, j0, j
+
+
+class TokenizerComparison:
+    """
+    Mismatches between a candidate tokenizer and a reference over a set of books.
+    """
+
+    def __init__(self, reference_name, candidate_name, max_examples=20):
+        self.reference_name = reference_name
+        self.candidate_name = candidate_name
+        self.max_examples = max_examples
+        self.num_books = 0
+        self.num_tokens = 0
+        self.num_mismatches = 0
+        self.books_with_mismatches = {}
+        self.examples = []
+
+    @property
+    def error_rate(self):
+        """
+        Mismatched tokens per reference token.
+        """
+        return self.num_mismatches / self.num_tokens if self.num_tokens else 0.0
+
+    def add(self, label, reference, candidate):
+        """
+        Compare the reference and candidate tokens of one book.
+        """
+        self.num_books += 1
+        self.num_tokens += len(reference)
+        mismatches = 0
+        for i1, i2, j1, j2 in diff_tokens(reference, candidate):
+            mismatches += max(i2 - i1, j2 - j1)
+            if len(self.examples) < self.max_examples:
+                self.examples.append((label, reference[max(i1 - 2, 0):i2 + 2], candidate[max(j1 - 2, 0):j2 + 2]))
+
+        if mismatches:
+            self.books_with_mismatches[label] = mismatches
+        self.num_mismatches += mismatches
+
+    def summary(self):
+        """
+        Human readable report of the comparison.
+        """
+        lines = [f'{self.candidate_name} vs {self.reference_name}: {self.num_books} books, '
+                 f'{self.num_tokens} tokens, {self.num_mismatches} mismatched '
+                 f'({self.error_rate:.4%}), {len(self.books_with_mismatches)} books with mismatches']
+        for label, reference, candidate in self.examples:
+            lines.append(f'  {label}: {reference} != {candidate}')
+        return '\n'.join(lines)
+
+
+def compare_tokenizers(texts, candidate='fast', reference='nltk', labels=None, max_examples=20):
+    """
+    Tokenize each of texts with both tokenizers, returning a TokenizerComparison.
+    """
+    candidate = get_tokenizer(candidate)
+    reference = get_tokenizer(reference)
+    comparison = TokenizerComparison(reference.name, candidate.name, max_examples=max_examples)
+    for i, text in enumerate(texts):
+        comparison.add(i if labels is None else labels[i], reference(text), candidate(text))
+    return comparison
+
+
+def main():
+    from src.book_store import open_book_store
+    from src.data_loader import trim_words
+
+    parser = argparse.ArgumentParser(description='Compare a tokenizer backend with nltk.word_tokenize')
+    parser.add_argument('book_store', help='SPGC text directory or packed book store')
+    parser.add_argument('--backend', default='fast', choices=sorted(TOKENIZERS))
+    parser.add_argument('--max-books', type=int, default=50)
+    parser.add_argument('--skip-first-and-last-words', type=int, default=100)
+    parser.add_argument('--max-examples', type=int, default=20)
+    args = parser.parse_args()
+
+    store = open_book_store(args.book_store)
+    pg_ids = store.ids()[:args.max_books]
+    texts = [trim_words(store.get_text(pg_id), args.skip_first_and_last_words) for pg_id in pg_ids]
+    print(compare_tokenizers(texts, args.backend, labels=pg_ids, max_examples=args.max_examples).summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Corpus-wide token vocabulary, used to store books as compact int32 arrays of token ids.
+
+Worker processes don't share the vocabulary.  They encode a book against its own distinct tokens
+(encode_local), which only needs the book's distinct token strings plus an int32 buffer to be sent
+back, and the parent process maps those local codes to corpus-wide ids (Vocabulary.intern_local).
+"""
+import os
+import json
+
+import numpy as np
+
+
+def encode_local(tokens):
+    """
+    Encode a token sequence against its own distinct tokens.
+    Returns (types, codes) such that tokens[i] == types[codes[i]].
+    """
+    index = {}
+    codes = np.fromiter((index.setdefault(token, len(index)) for token in tokens),
+                        dtype=np.int32, count=len(tokens))
+    return list(index), codes
+
+
+def decode_local(types, codes):
+    """
+    Rebuild the token list of a (types, codes) pair made by encode_local.
+    """
+    return [types[code] for code in codes.tolist()]
+
+
+class Vocabulary:
+    """
+    Bidirectional mapping between tokens and int32 ids, assigned in order of first appearance.
+    """
+
+    def __init__(self, tokens=()):
+        self._tokens = []
+        self._ids = {}
+        for token in tokens:
+            self._add(token)
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def __contains__(self, token):
+        return token in self._ids
+
+    @property
+    def tokens(self):
+        """
+        All tokens, indexed by id.
+        """
+        return self._tokens
+
+    def _add(self, token):
+        token_id = self._ids.get(token)
+        if token_id is None:
+            token_id = self._ids[token] = len(self._tokens)
+            self._tokens.append(token)
+        return token_id
+
+    def encode(self, tokens):
+        """
+        Return the int32 ids of tokens, adding any new tokens to the vocabulary.
+        """
+        return np.fromiter((self._add(token) for token in tokens), dtype=np.int32, count=len(tokens))
+
+    def decode(self, ids):
+        """
+        Return the list of tokens of an array of ids.
+        """
+        tokens = self._tokens
+        return [tokens[token_id] for token_id in np.asarray(ids).tolist()]
+
+    def intern_local(self, types, codes):
+        """
+        Map a (types, codes) pair from encode_local to an int32 array of vocabulary ids.
+        """
+        lookup = self.encode(types)
+        return lookup[codes]
+
+    def to_local(self, ids):
+        """
+        Turn an array of vocabulary ids into a (types, codes) pair, the form books are sent to
+        worker processes in so they don't need the whole vocabulary.
+        """
+        unique_ids, codes = np.unique(ids, return_inverse=True)
+        return self.decode(unique_ids), codes.astype(np.int32)
+
+    def save(self, path):
+        """
+        Save the vocabulary as a JSON list of tokens, replacing any previous file atomically.
+        """
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._tokens, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a vocabulary saved with save.
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
@@ -0,0 +1,248 @@
+"""
+Long-lived, length-aware process pool shared by the loader's processing stages.
+
+One pool is started per loader and reused across splits and stages, and each worker loads the NLTK
+resources once when it starts.  Work is scheduled longest book first, with books batched into
+chunks of roughly equal total length: long books go out alone and early, short books are grouped
+so they don't cost a round trip each, and no core is left waiting on one huge book at the end.
+"""
+import time
+import weakref
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Aim for this many chunks per worker, enough to balance the load without much per-chunk overhead
+CHUNKS_PER_WORKER = 4
+
+
+def warm_up_worker(stages=('tokenized', 'lemmatized'), lemma_memo_path=None, tag_mode='book', tokenizer=None):
+    """
+    Load the NLTK resources used by the stages, run once in each worker when it starts.
+    tokenizer is the tokenizer backend of the tokenized stage, nltk.word_tokenize by default.
+    """
+    # Imported here so only workers that need them pay for them.  Missing NLTK data is only warned
+    # about, a failing initializer would show up as a broken pool rather than the stage's own error.
+    try:
+        if 'tokenized' in stages:
+            from src.tokenizers import NLTKTokenizer
+            (tokenizer or NLTKTokenizer())('Warm up the tokenizer.')
+        if 'lemmatized' in stages:
+            from src.lemmatizer import get_engine
+            get_engine(lemma_memo_path, tag_mode).lemmatize(['Warming', 'up', 'the', 'lemmatizer'])
+    except LookupError as e:
+        message = ' '.join(str(e).replace('*', '').split())
+        print(f'Warning: could not warm up the worker, NLTK data is missing: {message[:200]}')
+
+
+def default_mp_context():
+    """
+    Multiprocessing context of the workers when none is given: forkserver where available, else
+    spawn.  Forking the loader itself is unsafe, its prefetch threads may hold locks at that point.
+    """
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(start_method)
+
+
+def _run_chunk(func, items):
+    return [func(item) for item in items]
+
+
+def _run_timed_chunk(func, items):
+    from src.telemetry import ProfiledFunction, peak_rss_bytes
+
+    results = []
+    durations = []
+    start_cpu = time.process_time()
+    for item in items:
+        start = time.perf_counter()
+        results.append(func(item))
+        durations.append(time.perf_counter() - start)
+
+    # Measured here, the parent only sees a worker's usage once the worker has exited
+    usage = {'cpu_s': time.process_time() - start_cpu,
+             'peak_rss_bytes': peak_rss_bytes(),
+             'profile': func.collect() if isinstance(func, ProfiledFunction) else None}
+    return results, durations, usage
+
+
+def make_chunks(weights, num_workers, chunks_per_worker=CHUNKS_PER_WORKER):
+    """
+    Group item indices into chunks, heaviest items first, each chunk closing once its total weight
+    reaches the target weight of total / (num_workers * chunks_per_worker).
+    """
+    order = sorted(range(len(weights)), key=lambda i: weights[i], reverse=True)
+    target = max(sum(weights) / max(num_workers * chunks_per_worker, 1), 1)
+
+    chunks = []
+    chunk = []
+    chunk_weight = 0
+    for i in order:
+        chunk.append(i)
+        chunk_weight += weights[i]
+        if chunk_weight >= target:
+            chunks.append(chunk)
+            chunk = []
+            chunk_weight = 0
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
+
+
+class WorkerPool:
+    """
+    Process pool whose map schedules items longest first in adaptively sized chunks.
+    With a telemetry (a LoaderTelemetry), the time spent on each item is recorded under desc.
+    Workers are started with mp_context, default_mp_context() by default.  Those workers import the
+    main module afresh, so a script creating a pool must do it under ``if __name__ == '__main__':``.
+    """
+
+    def __init__(self, num_workers, initializer=None, initargs=(), mp_context=None, telemetry=None):
+        self.num_workers = num_workers
+        self.telemetry = telemetry
+        if mp_context is None:
+            mp_context = default_mp_context()
+        self._executor = ProcessPoolExecutor(max_workers=num_workers, mp_context=mp_context,
+                                             initializer=initializer, initargs=initargs)
+        # Submitted work, so close can cancel what hasn't started (cancel_futures needs Python 3.9)
+        self._futures = weakref.WeakSet()
+
+    def submit(self, func, *args):
+        """
+        Run func(*args) on a worker, returning its Future.
+        """
+        future = self._executor.submit(func, *args)
+        self._futures.add(future)
+        return future
+
+    def map(self, func, items, weights=None, desc=None, progress=True, labels=None):
+        """
+        Apply func to every item, returning the results in the order of items.
+        weights (e.g. book lengths) drive the scheduling, by default all items weigh the same.
+        labels (e.g. PG ids) name the items in the telemetry, by default their positions.
+        """
+        items = list(items)
+        if not items:
+            return []
+        if weights is None:
+            weights = [1] * len(items)
+        if labels is None:
+            labels = range(len(items))
+
+        run_chunk = _run_chunk if self.telemetry is None else _run_timed_chunk
+        chunks = make_chunks(weights, self.num_workers)
+        futures = {self.submit(run_chunk, func, [items[i] for i in chunk]): chunk
+                   for chunk in chunks}
+
+        from tqdm import tqdm
+
+        results = [None] * len(items)
+        with tqdm(total=len(items), desc=desc, disable=not progress) as progress_bar:
+            for future in as_completed(futures):
+                chunk = futures[future]
+                chunk_results = future.result()
+                if self.telemetry is not None:
+                    chunk_results, durations, usage = chunk_results
+                    self.telemetry.record_tasks(desc, [labels[i] for i in chunk], durations, usage)
+                for i, result in zip(chunk, chunk_results):
+                    results[i] = result
+                progress_bar.update(len(chunk))
+
+        return results
+
+    def start(self):
+        """
+        Start the workers now rather than as work is submitted, waiting for them to be warmed up.
+        """
+        futures = [self.submit(abs, 0) for _ in range(self.num_workers * CHUNKS_PER_WORKER)]
+        for future in futures:
+            future.result()
+
+    def stream(self, func, chunk_weight=2**21, desc=None, progress=True):
+        """
+        Return a StreamingMap that applies func to items submitted one at a time as they arrive.
+        """
+        return StreamingMap(self, func, chunk_weight, desc=desc, progress=progress,
+                            telemetry=self.telemetry)
+
+    def close(self):
+        """
+        Shut the workers down, cancelling the work that hasn't started.
+        """
+        for future in list(self._futures):
+            future.cancel()
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StreamingMap:
+    """
+    Apply func to items as they are added, sending them to the workers in chunks of about
+    chunk_weight so the workers start before the last item has arrived.  Chunks are submitted to
+    pool, a WorkerPool.
+    """
+
+    def __init__(self, pool, func, chunk_weight, desc=None, progress=True, telemetry=None):
+        self._pool = pool
+        self._telemetry = telemetry
+        self._func = func
+        self._chunk_weight = chunk_weight
+        self._desc = desc
+        self._progress = progress
+        self._futures = {}
+        self._keys = []
+        self._labels = []
+        self._items = []
+        self._weight = 0
+        self._num_items = 0
+
+    def add(self, key, item, weight=1, label=None):
+        """
+        Queue func(item), whose result will be returned under key.
+        label names the item in the telemetry, by default key.
+        """
+        self._keys.append(key)
+        self._labels.append(key if label is None else label)
+        self._items.append(item)
+        self._weight += weight
+        self._num_items += 1
+        if self._weight >= self._chunk_weight:
+            self._flush()
+
+    def _flush(self):
+        if self._items:
+            run_chunk = _run_chunk if self._telemetry is None else _run_timed_chunk
+            future = self._pool.submit(run_chunk, self._func, self._items)
+            self._futures[future] = (self._keys, self._labels)
+        self._keys = []
+        self._labels = []
+        self._items = []
+        self._weight = 0
+
+    def results(self):
+        """
+        Wait for every queued item, returning {key: result}.
+        """
+        self._flush()
+
+        from tqdm import tqdm
+
+        results = {}
+        with tqdm(total=self._num_items, desc=self._desc, disable=not self._progress) as progress_bar:
+            for future in as_completed(self._futures):
+                keys, labels = self._futures[future]
+                chunk_results = future.result()
+                if self._telemetry is not None:
+                    chunk_results, durations, usage = chunk_results
+                    self._telemetry.record_tasks(self._desc, labels, durations, usage)
+                results.update(zip(keys, chunk_results))
+                progress_bar.update(len(keys))
+
+        self._futures = {}
+        self._num_items = 0
+        return results
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
+
+# pylint: disable=wrong-import-position
+from benchmarks.synthetic_corpus import generate_corpus
+
+
+@pytest.fixture(scope='session')
+def corpus(tmp_path_factory):
+    """
+    A small synthetic corpus, as (dataset_dir, gutenberg_repo_path).
+    """
+    return generate_corpus(str(tmp_path_factory.mktemp('corpus')), num_books=8, num_authors=2, mean_words=400,
+                           vocabulary_size=300)
@@ -0,0 +1,61 @@
+import os
+
+from src.book_store import DirectoryBookStore, PackedBookStore, pack_books
+from src.data_loader import GutenbergDataLoader
+
+
+def _text_dir(tmp_path):
+    text_dir = tmp_path / 'text'
+    text_dir.mkdir()
+    (text_dir / 'PG1_text.txt').write_bytes(b'First line \r\n  second\rthird\n\nlast')
+    (text_dir / 'PG2_text.txt').write_bytes('café au lait\n'.encode('utf-8'))
+    return text_dir
+
+
+def test_text_and_hash_match_separate_reads(tmp_path):
+    text_dir = _text_dir(tmp_path)
+    pack_books(str(text_dir), str(tmp_path / 'packed'))
+
+    for store in (DirectoryBookStore(str(text_dir)), PackedBookStore(str(tmp_path / 'packed'))):
+        for pg_id in ('PG1', 'PG2'):
+            assert store.get_text_and_hash(pg_id) == (store.get_text(pg_id), store.content_hash(pg_id))
+        assert store.get_text_and_hash('PG3') == (None, None)
+        store.close()
+
+
+class CountingBookStore(DirectoryBookStore):
+    """
+    Directory store counting the separate content hash reads.
+    """
+
+    def __init__(self, text_dir):
+        super().__init__(text_dir)
+        self.hash_reads = 0
+
+    def content_hash(self, pg_id):
+        self.hash_reads += 1
+        return super().content_hash(pg_id)
+
+
+def test_tokenizing_while_loading_reads_each_book_once(corpus, tmp_path):
+    dataset_dir, gutenberg_path = corpus
+    store = CountingBookStore(os.path.join(gutenberg_path, 'data', 'text'))
+    with GutenbergDataLoader(dataset_dir, gutenberg_repo_path=gutenberg_path, num_threads=1, book_store=store,
+                             cache_dir=str(tmp_path / 'cache'), tokenizer='fast') as loader:
+        loader.load_splits(skip_first_and_last_words=5, tokenize=True)
+
+        assert store.hash_reads == 0
+        for pg_id, tokens in zip(loader.train_df['id'], loader.train_df['tokenized']):
+            assert loader._content_hashes[pg_id] == DirectoryBookStore.content_hash(store, pg_id)
+            assert loader._cache.get(loader._cache_key(pg_id, 'tokenized', 5)) == tokens
+
+
+def test_raw_text_keeps_the_newlines(tmp_path):
+    text_dir = _text_dir(tmp_path)
+    pack_books(str(text_dir), str(tmp_path / 'packed'))
+
+    for store in (DirectoryBookStore(str(text_dir)), PackedBookStore(str(tmp_path / 'packed'))):
+        assert store.get_raw_text('PG1') == 'First line \n  second\nthird\n\nlast'
+        assert store.get_raw_text('PG2') == 'café au lait\n'
+        assert store.get_raw_text('PG3') is None
+        store.close()
@@ -0,0 +1,69 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from src.chunking import ChunkSampler, materialize_chunks
+
+PG_IDS = ['PG1', 'PG42', 'PG10007', 'PG99999']
+
+
+def _assert_in_range(offsets, num_words):
+    assert offsets.dtype == np.int64
+    assert (offsets[:, 0] >= 0).all() and (offsets[:, 1] <= num_words).all()
+    assert (offsets[:, 0] < offsets[:, 1]).all() or num_words == 0
+    assert (np.diff(offsets[:, 0]) >= 0).all()
+
+
+@pytest.mark.parametrize('num_chunks, chunk_size', [(1, 1), (3, 7), (10, 50), (8, 1)])
+@pytest.mark.parametrize('extra_words', [0, 1, 5, 1000])
+def test_non_overlapping_chunks_do_not_overlap(num_chunks, chunk_size, extra_words):
+    num_words = num_chunks * chunk_size + extra_words
+    for seed in range(20):
+        sampler = ChunkSampler(num_chunks, chunk_size, overlap=False, seed=seed)
+        for pg_id in PG_IDS:
+            offsets = sampler.sample(num_words, pg_id)
+            assert offsets.shape == (num_chunks, 2)
+            assert (offsets[:, 1] - offsets[:, 0] == chunk_size).all()
+            _assert_in_range(offsets, num_words)
+            assert (offsets[1:, 0] >= offsets[:-1, 1]).all()
+
+            # Materialized, every word of the book shows up at most once
+            chunked = materialize_chunks(list(range(num_words)), offsets)
+            assert len(chunked) == len(set(chunked)) == num_chunks * chunk_size
+
+
+@pytest.mark.parametrize('overlap', [False, True])
+def test_chunks_stay_in_range_for_short_books(overlap):
+    sampler = ChunkSampler(num_chunks=4, chunk_size=10, overlap=overlap, seed=0)
+    for num_words in (0, 1, 9, 10, 11, 39, 40, 41):
+        offsets = sampler.sample(num_words, 'PG1')
+        _assert_in_range(offsets, num_words)
+        if num_words < (10 if overlap else 40):
+            # Too short for the chunks, one window over the whole book
+            assert offsets.tolist() == [[0, num_words]]
+        else:
+            assert offsets.shape == (4, 2)
+            assert (offsets[:, 1] - offsets[:, 0] == 10).all()
+
+    text = ' '.join(f'w{i}' for i in range(7))
+    assert materialize_chunks(text, sampler.sample(7, 'PG1')) == text
+
+
+def _sample_all(num_chunks, chunk_size, overlap, seed):
+    sampler = ChunkSampler(num_chunks, chunk_size, overlap=overlap, seed=seed)
+    return {pg_id: sampler.sample(5000, pg_id).tolist() for pg_id in PG_IDS}
+
+
+@pytest.mark.parametrize('overlap', [False, True])
+def test_same_seed_and_book_give_the_same_chunks_across_processes(overlap):
+    expected = _sample_all(5, 100, overlap, seed=3)
+    assert _sample_all(5, 100, overlap, seed=3) == expected
+
+    # A new interpreter has another hash seed, the offsets don't depend on it
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        assert executor.submit(_sample_all, 5, 100, overlap, 3).result() == expected
+
+    assert _sample_all(5, 100, overlap, seed=4) != expected
+    assert len({str(offsets) for offsets in expected.values()}) == len(PG_IDS)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from src.columnar_store import save_frame
+from src.data_loader import GutenbergDataLoader
+
+pytest.importorskip('pyarrow')
+
+
+def _loader(corpus, **kwargs):
+    dataset_dir, gutenberg_path = corpus
+    return GutenbergDataLoader(dataset_dir, gutenberg_repo_path=gutenberg_path, num_threads=1, tokenizer='fast',
+                               **kwargs)
+
+
+@pytest.mark.parametrize('file_format', ['arrow', 'parquet'])
+def test_encoded_columns_round_trip_with_their_vocabulary(corpus, tmp_path, file_format):
+    with _loader(corpus, encode_tokens=True) as loader:
+        loader.load_splits(skip_first_and_last_words=5, tokenize=True)
+        loader.save_columnar(str(tmp_path), 'encoded', file_format=file_format)
+        saved = loader._split_dfs()
+        vocabulary = loader.vocabulary
+
+    with _loader(corpus) as loader:
+        loader.load_columnar(str(tmp_path), 'encoded', file_format=file_format)
+        assert loader.vocabulary.tokens == vocabulary.tokens
+        for split, df in loader._split_dfs().items():
+            assert df['id'].tolist() == saved[split]['id'].tolist()
+            assert df['text'].tolist() == saved[split]['text'].tolist()
+            for ids, expected in zip(df['tokenized'], saved[split]['tokenized']):
+                assert isinstance(ids, np.ndarray) and ids.dtype == np.int32
+                assert loader.vocabulary.decode(ids) == vocabulary.decode(expected)
+
+        # Tokenizing again extends the loaded vocabulary instead of a new one
+        loader.tokenize_all_text()
+        assert loader.vocabulary.tokens == vocabulary.tokens
+        for split, df in loader._split_dfs().items():
+            assert [ids.tolist() for ids in df['tokenized']] == [ids.tolist() for ids in saved[split]['tokenized']]
+
+
+@pytest.mark.parametrize('file_format', ['arrow', 'parquet'])
+def test_columns_and_rows_are_projected(corpus, tmp_path, file_format):
+    with _loader(corpus) as loader:
+        loader.load_splits(skip_first_and_last_words=5, tokenize=True)
+        loader.save_columnar(str(tmp_path), file_format=file_format)
+        saved = loader._split_dfs()
+    author = saved['train']['author'].iloc[0]
+
+    with _loader(corpus) as loader:
+        loader.load_columnar(str(tmp_path), file_format=file_format, columns=['tokenized', 'author'],
+                             authors=[author])
+        for split, df in loader._split_dfs().items():
+            expected = saved[split][saved[split]['author'] == author]
+            assert df.columns.tolist() == ['tokenized', 'author']
+            assert df['tokenized'].tolist() == expected['tokenized'].tolist()
+            assert (df['author'] == author).all()
+
+        pg_ids = saved['test']['id'].tolist()[:1]
+        loader.load_columnar(str(tmp_path), file_format=file_format, columns=['id'], ids=pg_ids)
+        assert loader.test_df['id'].tolist() == pg_ids
+        assert loader.train_df.empty and loader.val_df.empty
+
+        with pytest.raises(KeyError):
+            loader.load_columnar(str(tmp_path), file_format=file_format, columns=['lemmatized'])
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        save_frame(None, str(tmp_path / 'train_df.csv'), file_format='csv')
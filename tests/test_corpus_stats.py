@@ -0,0 +1,108 @@
+import os
+
+import numpy as np
+
+from misc_utils import dataset_filtering
+from src import corpus_stats
+from src.corpus_stats import STATS_COLUMNS, CorpusStatsIndex, _count_lines
+
+
+def _book(tmp_path, pg_id, text, counts='the 2\ncat 1\n'):
+    for directory in ('text', 'counts', 'tokens'):
+        (tmp_path / directory).mkdir(exist_ok=True)
+    (tmp_path / 'text' / f'{pg_id}_text.txt').write_bytes(text)
+    (tmp_path / 'counts' / f'{pg_id}_counts.txt').write_text(counts, encoding='utf-8')
+    (tmp_path / 'tokens' / f'{pg_id}_tokens.txt').write_text('the\ncat\nthe\n', encoding='utf-8')
+
+
+def _line_count(index, pg_id):
+    return index.to_frame().loc[pg_id, 'line_count']
+
+
+def test_lines_are_counted_as_in_text_mode(tmp_path):
+    for i, data in enumerate((b'', b'one', b'one\n', b'one\rtwo', b'one\r\ntwo\r\n', b'a\r\rb\n\r', b'\r\n\n\r')):
+        path = tmp_path / f'{i}.txt'
+        path.write_bytes(data)
+        with open(path, 'r', encoding='utf-8') as f:
+            assert _count_lines(str(path)) == sum(1 for _ in f), data
+
+
+def test_changed_books_are_only_scanned_again_by_refresh(tmp_path):
+    _book(tmp_path, 'PG1', b'one\ntwo\n')
+    _book(tmp_path, 'PG2', b'one\n')
+    index = CorpusStatsIndex()
+    assert index.update(str(tmp_path), ['PG1', 'PG2'], num_threads=1) == 2
+    assert index.refresh(str(tmp_path), num_threads=1) == 0
+
+    text_path = tmp_path / 'text' / 'PG1_text.txt'
+    mtime_ns = os.stat(text_path).st_mtime_ns
+    text_path.write_bytes(b'one\ntwo\nthree\n')
+    os.utime(text_path, ns=(mtime_ns + 10**9, mtime_ns + 10**9))
+    assert index.update(str(tmp_path), ['PG1', 'PG2'], num_threads=1) == 0
+    assert _line_count(index, 'PG1') == 2
+
+    assert index.refresh(str(tmp_path), ['PG1', 'PG2'], num_threads=1) == 1
+    assert len(index) == 2
+    assert _line_count(index, 'PG1') == 3
+    assert _line_count(index, 'PG2') == 1
+
+
+def test_update_does_not_check_indexed_books(tmp_path, monkeypatch):
+    _book(tmp_path, 'PG1', b'one\n')
+    _book(tmp_path, 'PG2', b'one\n')
+    index = CorpusStatsIndex()
+    index.update(str(tmp_path), ['PG1'], num_threads=1)
+
+    checked = []
+    signature = corpus_stats.book_signature
+    monkeypatch.setattr(corpus_stats, 'book_signature',
+                        lambda path, pg_id: checked.append(pg_id) or signature(path, pg_id))
+    assert index.update(str(tmp_path), ['PG1', 'PG2'], num_threads=1) == 1
+    assert checked == ['PG2']
+
+
+def test_indexes_saved_without_signatures_are_scanned_again(tmp_path):
+    _book(tmp_path, 'PG1', b'one\ntwo\n')
+    old_path = str(tmp_path / 'old.npz')
+    np.savez(old_path, id=np.array(['PG1']), **{name: np.array([7.0]) for name in STATS_COLUMNS})
+
+    index = CorpusStatsIndex.load(old_path)
+    assert index.update(str(tmp_path), ['PG1'], num_threads=1) == 0
+    assert index.refresh(str(tmp_path), num_threads=1) == 1
+    assert _line_count(index, 'PG1') == 2
+
+    index.save(str(tmp_path / 'new.npz'))
+    assert CorpusStatsIndex.load(str(tmp_path / 'new.npz')).refresh(str(tmp_path), ['PG1'], num_threads=1) == 0
+
+
+def test_index_is_kept_without_the_corpus(tmp_path):
+    _book(tmp_path, 'PG1', b'one\ntwo\n')
+    index = CorpusStatsIndex()
+    index.update(str(tmp_path), ['PG1'], num_threads=1)
+
+    assert index.refresh(str(tmp_path / 'elsewhere'), ['PG1'], num_threads=1) == 0
+    assert _line_count(index, 'PG1') == 2
+
+
+def test_count_helpers_match_the_index(corpus, monkeypatch):
+    _, gutenberg_path = corpus
+    monkeypatch.setattr(dataset_filtering, '_STATS_INDEXES', {})
+    data_path = os.path.join(gutenberg_path, 'data')
+    pg_ids = sorted(name[:-len('_text.txt')] for name in os.listdir(os.path.join(data_path, 'text')))
+    index = CorpusStatsIndex()
+    index.update(data_path, pg_ids + ['PG0'], num_threads=1)
+
+    helpers = {'word_count': (dataset_filtering.get_word_count, 'counts'),
+               'unique_word_count': (dataset_filtering.get_unique_word_count, 'counts'),
+               'line_count': (dataset_filtering.get_line_count, 'text'),
+               'token_count': (dataset_filtering.get_token_count, 'tokens')}
+    for pg_id in pg_ids + ['PG0']:
+        for name, (helper, directory) in helpers.items():
+            assert helper(pg_id, os.path.join(data_path, directory)) == index.get(pg_id)[name]
+    assert index.get('PG0') == dict.fromkeys(STATS_COLUMNS)
+
+    with open(os.path.join(data_path, 'counts', f'{pg_ids[0]}_counts.txt'), encoding='utf-8') as f:
+        counts = [int(line.split()[1]) for line in f]
+    assert dataset_filtering.get_word_count(pg_ids[0], os.path.join(data_path, 'counts')) == sum(counts)
+    assert dataset_filtering.get_unique_word_count(pg_ids[0], os.path.join(data_path, 'counts')) == len(counts)
+    assert all(isinstance(value, int) for value in index.get(pg_ids[0]).values())
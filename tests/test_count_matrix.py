@@ -0,0 +1,89 @@
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from src.count_matrix import CountMatrix
+from src.data_loader import GutenbergDataLoader
+
+
+def _file_counts(gutenberg_path, pg_id):
+    counts = Counter()
+    with open(os.path.join(gutenberg_path, 'data', 'counts', f'{pg_id}_counts.txt'), encoding='utf-8') as f:
+        for line in f:
+            word, count = line.split()
+            counts[word] += int(count)
+    return counts
+
+
+def _row_counts(count_matrix, row):
+    row = count_matrix.matrix[row]
+    return Counter(dict(zip(count_matrix.vocabulary.decode(row.indices), row.data.tolist())))
+
+
+def _is_mapped(array):
+    while array is not None and not isinstance(array, np.memmap):
+        array = array.base
+    return array is not None
+
+
+def _build(corpus, tmp_path, pg_ids=None):
+    dataset_dir, gutenberg_path = corpus
+    with GutenbergDataLoader(dataset_dir, gutenberg_repo_path=gutenberg_path, num_threads=1) as loader:
+        return loader.build_count_matrix(pg_ids, path=str(tmp_path / 'count_matrix'))
+
+
+def test_rows_match_the_counts_files(corpus, tmp_path):
+    _, gutenberg_path = corpus
+    count_matrix = _build(corpus, tmp_path)
+    pg_ids = sorted(name[:-len('_counts.txt')] for name in os.listdir(os.path.join(gutenberg_path, 'data', 'counts')))
+
+    assert sorted(count_matrix.ids.tolist()) == pg_ids
+    assert count_matrix.matrix.has_canonical_format
+    for row, pg_id in enumerate(count_matrix.ids):
+        assert _row_counts(count_matrix, row) == _file_counts(gutenberg_path, pg_id)
+
+
+def test_duplicate_words_and_missing_books(tmp_path):
+    counts_dir = tmp_path / 'counts'
+    counts_dir.mkdir()
+    (counts_dir / 'PG1_counts.txt').write_text('the 3\ncat 1\nthe 2\n', encoding='utf-8')
+    (counts_dir / 'PG2_counts.txt').write_text('dog 4\ncafé 1\n\n', encoding='utf-8')
+    (counts_dir / 'PG3_counts.txt').write_text('', encoding='utf-8')
+
+    count_matrix = CountMatrix.build(str(tmp_path), ['PG1', 'PG4', 'PG2', 'PG3'], num_threads=1)
+    assert count_matrix.ids.tolist() == ['PG1', 'PG2', 'PG3']
+    assert [_row_counts(count_matrix, row) for row in range(3)] == [Counter(the=5, cat=1), Counter(dog=4, café=1),
+                                                                    Counter()]
+
+
+def test_saved_matrix_loads_memory_mapped(corpus, tmp_path):
+    count_matrix = _build(corpus, tmp_path)
+    loaded = CountMatrix.load(str(tmp_path / 'count_matrix'))
+
+    assert all(_is_mapped(getattr(loaded.matrix, name)) for name in ('data', 'indices', 'indptr'))
+    assert loaded.ids.tolist() == count_matrix.ids.tolist()
+    assert loaded.vocabulary.tokens == count_matrix.vocabulary.tokens
+    assert (loaded.matrix != count_matrix.matrix).nnz == 0
+    assert loaded.term_totals().tolist() == count_matrix.term_totals().tolist()
+    assert (CountMatrix.load(str(tmp_path / 'count_matrix'), mmap=False).matrix != count_matrix.matrix).nnz == 0
+
+
+def test_author_counts_sum_their_books(corpus, tmp_path):
+    dataset_dir, gutenberg_path = corpus
+    df = pd.concat([pd.read_csv(os.path.join(dataset_dir, f'final_{split}.csv')) for split in ('train', 'val', 'test')])
+    count_matrix = _build(corpus, tmp_path)
+
+    # Duplicate rows and books without counts are left out
+    df = pd.concat([df, df.iloc[:1], pd.DataFrame({'id': ['PG0'], 'author': ['Nobody']})])
+    authors, author_matrix = count_matrix.aggregate_by(df)
+
+    expected = {}
+    for pg_id, author in df.drop_duplicates('id')[['id', 'author']].itertuples(index=False):
+        if pg_id != 'PG0':
+            expected.setdefault(author, Counter()).update(_file_counts(gutenberg_path, pg_id))
+    assert sorted(authors.tolist()) == sorted(expected)
+    for row, author in enumerate(authors):
+        assert Counter(dict(zip(count_matrix.vocabulary.decode(author_matrix[row].indices),
+                                author_matrix[row].data.tolist()))) == expected[author]
@@ -0,0 +1,15 @@
+import numpy as np
+import pandas as pd
+
+from misc_utils.dataset_filtering import compare_columns
+
+
+def test_compare_columns_returns_the_rows_it_cant_compare_as_a_list():
+    df = pd.DataFrame({'id': [1, 2, 3, 4],
+                       'title': ['A b', 'X', None, 'Q'],
+                       'title_pgc': ['a B', 'Y', 'Z', np.nan]})
+    dont_match, attribute_errors = compare_columns(df, 'title', 'title_pgc')
+
+    assert dont_match['id'].tolist() == [1, 2, 3, 4]
+    assert isinstance(attribute_errors, list)
+    assert [row['id'] for row in attribute_errors] == [3, 4]
@@ -0,0 +1,91 @@
+import os
+import random
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data_loader import GutenbergDataLoader
+from src.dedup import MAX_BUCKET_SIZE, candidate_pairs, estimate_jaccard, minhash_signature, shingle_hashes
+
+
+def _edit(text, fraction, seed):
+    """
+    text with a fraction of its words replaced by new ones.
+    """
+    rng = random.Random(seed)
+    words = text.split(' ')
+    for i in rng.sample(range(len(words)), int(len(words) * fraction)):
+        words[i] = f'edit{i}'
+    return ' '.join(words)
+
+
+@pytest.fixture
+def planted_corpus(corpus, tmp_path):
+    """
+    The corpus with a test book replaced by a lightly edited copy of a train book.
+    Returns (dataset_dir, gutenberg_path, train_id, test_id).
+    """
+    dataset_dir, gutenberg_path = corpus
+    copy = str(tmp_path / 'gutenberg')
+    shutil.copytree(gutenberg_path, copy)
+    train_id = pd.read_csv(os.path.join(dataset_dir, 'final_train.csv'))['id'].iloc[0]
+    test_id = pd.read_csv(os.path.join(dataset_dir, 'final_test.csv'))['id'].iloc[0]
+
+    text_dir = os.path.join(copy, 'data', 'text')
+    with open(os.path.join(text_dir, f'{train_id}_text.txt'), encoding='utf-8') as f:
+        text = f.read()
+    with open(os.path.join(text_dir, f'{test_id}_text.txt'), 'w', encoding='utf-8') as f:
+        f.write(_edit(text, 0.01, seed=0))
+    return dataset_dir, copy, train_id, test_id
+
+
+def test_planted_duplicates_are_found_across_splits(planted_corpus):
+    dataset_dir, gutenberg_path, train_id, test_id = planted_corpus
+    with GutenbergDataLoader(dataset_dir, gutenberg_repo_path=gutenberg_path, num_threads=1) as loader:
+        loader.load_splits(skip_first_and_last_words=5)
+        report = loader.find_duplicates(threshold=0.5)
+
+        assert report[['id_a', 'id_b']].values.tolist() == [[train_id, test_id]]
+        assert report['split_a'].tolist() == ['train'] and report['split_b'].tolist() == ['test']
+        assert report['cross_split'].tolist() == [True]
+        assert report['jaccard'].iloc[0] > 0.8
+        assert report['author_a'].notna().all()
+
+        # Without an author column, as after load_columnar(columns=...)
+        for df in (loader.train_df, loader.val_df, loader.test_df):
+            df.drop(columns='author', inplace=True)
+        report = loader.find_duplicates(threshold=0.5)
+        assert report[['id_a', 'id_b']].values.tolist() == [[train_id, test_id]]
+        assert report['author_a'].isna().all() and report['author_b'].isna().all()
+
+
+def _exact_jaccard(text_a, text_b, shingle_size=5):
+    a = set(shingle_hashes(text_a, shingle_size).tolist())
+    b = set(shingle_hashes(text_b, shingle_size).tolist())
+    return len(a & b) / len(a | b)
+
+
+def test_similarity_estimates_the_jaccard_of_the_shingles():
+    rng = random.Random(1)
+    text = ' '.join(rng.choice([f'w{i}' for i in range(500)]) for _ in range(3000))
+    for fraction in (0.0, 0.02, 0.05, 0.1, 0.3, 1.0):
+        edited = _edit(text, fraction, seed=2)
+        signatures = np.stack([minhash_signature(text, num_perm=512), minhash_signature(edited, num_perm=512)])
+        estimate = estimate_jaccard(signatures, np.array([[0, 1]]))[0]
+        # The standard error of the estimate is at most 0.5 / sqrt(num_perm), about 0.022
+        assert estimate == pytest.approx(_exact_jaccard(text, edited), abs=0.1), fraction
+
+
+def test_large_buckets_are_skipped():
+    rng = np.random.default_rng(0)
+    signatures = rng.integers(0, 2**32, size=(MAX_BUCKET_SIZE + 3, 16), dtype=np.uint64).astype(np.uint32)
+    # One bucket of MAX_BUCKET_SIZE + 1 identical books, and one pair sharing a single band
+    signatures[:MAX_BUCKET_SIZE + 1] = signatures[0]
+    signatures[-1, :4] = signatures[-2, :4]
+
+    assert candidate_pairs(signatures, bands=4).tolist() == [[MAX_BUCKET_SIZE + 1, MAX_BUCKET_SIZE + 2]]
+    num_pairs = MAX_BUCKET_SIZE * (MAX_BUCKET_SIZE + 1) // 2 + 1
+    assert len(candidate_pairs(signatures, bands=4, max_bucket_size=None)) == num_pairs
+    assert len(candidate_pairs(signatures[MAX_BUCKET_SIZE - 2:], bands=4, max_bucket_size=3)) == 3 + 1
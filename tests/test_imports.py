@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only imported by the loader methods that use them
+LAZY_MODULES = ('pandas', 'tqdm', 'scipy', 'src.corpus_stats', 'src.telemetry', 'src.columnar_store', 'src.sharding',
+                'src.stylometry', 'src.subword_cache', 'src.dedup')
+
+
+def test_importing_the_loader_is_cheap():
+    code = f'import sys, src.data_loader; print(sorted(m for m in {LAZY_MODULES!r} if m in sys.modules))'
+    output = subprocess.run([sys.executable, '-c', code], cwd=REPO_PATH, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == '[]'
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from src.data_loader import GutenbergDataLoader
+
+
+def _has_lemmatizer_data():
+    try:
+        from nltk.corpus import stopwords, wordnet
+        from nltk.tag.perceptron import PerceptronTagger
+        stopwords.words('english')
+        wordnet.ensure_loaded()
+        PerceptronTagger()
+    except LookupError:
+        return False
+    return True
+
+
+def _loader(corpus, tmp_path, **kwargs):
+    dataset_dir, gutenberg_path = corpus
+    return GutenbergDataLoader(dataset_dir, gutenberg_repo_path=gutenberg_path, num_threads=1,
+                               cache_dir=str(tmp_path / 'cache'), tokenizer='fast', **kwargs)
+
+
+def test_books_are_cached_while_the_splits_are_chunked(corpus, tmp_path):
+    skip = 5
+    with _loader(corpus, tmp_path) as loader:
+        loader.load_splits(skip_first_and_last_words=skip)
+        loader.random_chunk_all_text(num_chunks=2, chunk_size=20, seed=0)
+
+        books = dict(loader.iter_books('train', stages=('tokenized',), skip_first_and_last_words=skip))
+        assert books
+        for pg_id, book in books.items():
+            assert loader._cache.get(loader._cache_key(pg_id, 'tokenized', skip)) == book['tokenized']
+
+
+@pytest.mark.skipif(not _has_lemmatizer_data(), reason='NLTK lemmatizer data not installed')
+def test_iter_books_lemmatizes_like_lemmatize_all_text(corpus, tmp_path):
+    skip = 5
+    memo_path = str(tmp_path / 'lemmas.pkl')
+    with _loader(corpus, tmp_path, lemma_memo_path=memo_path, tag_mode='sentence') as loader:
+        books = dict(loader.iter_books('train', stages=('lemmatized',), skip_first_and_last_words=skip))
+        assert os.path.exists(memo_path)
+
+    with _loader(corpus, tmp_path / 'other', lemma_memo_path=memo_path, tag_mode='sentence') as loader:
+        loader.load_splits(skip_first_and_last_words=skip, tokenize=True)
+        loader.lemmatize_all_text()
+        expected = dict(zip(loader.train_df['id'], loader.train_df['lemmatized']))
+    assert books == {pg_id: {'lemmatized': lemmas} for pg_id, lemmas in expected.items()}
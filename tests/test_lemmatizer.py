@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from src.lemmatizer import LemmatizerEngine
+from src.tokenizers import fast_word_tokenize
+
+
+def _has_lemmatizer_data():
+    try:
+        from nltk.corpus import stopwords, wordnet
+        from nltk.tag.perceptron import PerceptronTagger
+        stopwords.words('english')
+        wordnet.ensure_loaded()
+        PerceptronTagger()
+    except LookupError:
+        return False
+    return True
+
+
+pytestmark = pytest.mark.skipif(not _has_lemmatizer_data(), reason='NLTK lemmatizer data not installed')
+
+TEXTS = [
+    'The children were running quickly through the leaves, and the geese flew over the better houses.',
+    "She has been studying the oldest books; they're written by wolves who ate berries.",
+    'Running, ran, runs: the runner ran faster than the fastest runners had ever run 100 miles!',
+]
+
+
+def _baseline_lemmas(tokens):
+    """
+    The lemmatization loop the loader used before LemmatizerEngine.
+    """
+    from nltk import pos_tag
+    from nltk.corpus import stopwords
+    from nltk.corpus.reader.wordnet import ADJ, ADV, NOUN, VERB
+    from nltk.stem import WordNetLemmatizer
+
+    tag_map = {'J': ADJ, 'V': VERB, 'R': ADV}
+    lemmatizer = WordNetLemmatizer()
+    return [lemmatizer.lemmatize(word, tag_map.get(tag[0], NOUN)) for word, tag in pos_tag(tokens)
+            if word not in stopwords.words('english') and word.isalpha()]
+
+
+def _books(corpus):
+    _, gutenberg_path = corpus
+    text_dir = os.path.join(gutenberg_path, 'data', 'text')
+    books = [fast_word_tokenize(text) for text in TEXTS]
+    for name in sorted(os.listdir(text_dir))[:3]:
+        with open(os.path.join(text_dir, name), encoding='utf-8') as f:
+            books.append(fast_word_tokenize(f.read()))
+    return books
+
+
+@pytest.mark.parametrize('max_memo_size', [0, 500000])
+def test_engine_matches_the_baseline_loop(corpus, max_memo_size):
+    engine = LemmatizerEngine(max_memo_size=max_memo_size)
+    for tokens in _books(corpus):
+        # Twice, the second time from the memo
+        assert engine.lemmatize(tokens) == _baseline_lemmas(tokens)
+        assert engine.lemmatize(tokens) == _baseline_lemmas(tokens)
+    assert (len(engine) > 0) == (max_memo_size > 0)
+
+
+def test_reloaded_memo_matches_the_baseline_loop(corpus, tmp_path):
+    books = _books(corpus)
+    memo_path = str(tmp_path / 'lemmas.pkl')
+    engine = LemmatizerEngine()
+    for tokens in books:
+        engine.lemmatize(tokens)
+    engine.save_memo(memo_path)
+
+    reloaded = LemmatizerEngine(memo_path)
+    assert len(reloaded) == len(engine)
+    for tokens in books:
+        assert reloaded.lemmatize(tokens) == _baseline_lemmas(tokens)
+    assert not reloaded.pop_new_entries()
@@ -0,0 +1,52 @@
+import random
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from src.ngram_features import NgramCounts
+
+# Tokens as word_tokenize leaves them, single characters and punctuation included
+VOCABULARY = ['I', 'a', 'x', 'The', 'the', 'cat', 'sat', 'on', 'mat', 'Dog', 'ran', "n't", "'s", '.', ',', '!',
+              'over', 'and', 'it', 'was', 'not', 'good', 'O', 'well-known', 'café']
+
+
+def _documents(num_docs, seed):
+    rng = random.Random(seed)
+    return [[rng.choice(VOCABULARY) for _ in range(rng.randint(5, 60))] for _ in range(num_docs)]
+
+
+def _untied_max_features(counts, columns):
+    """
+    A max_features cutting between two different term frequencies, sklearn breaks ties arbitrarily.
+    """
+    freqs = np.sort(counts.term_freq[columns])[::-1]
+    return next(k for k in range(len(freqs) // 2, 0, -1) if freqs[k - 1] != freqs[k])
+
+
+@pytest.mark.parametrize('ngram_range', [(1, 1), (1, 2), (2, 3)])
+@pytest.mark.parametrize('limit', [False, True])
+@pytest.mark.parametrize('stop_words', [None, 'english'])
+@pytest.mark.parametrize('sublinear_tf', [False, True])
+def test_token_documents_match_tfidf_vectorizer(ngram_range, limit, stop_words, sublinear_tf):
+    train = _documents(30, seed=0)
+    val = _documents(10, seed=1)
+
+    counts = NgramCounts(max_n=3, stop_words=stop_words)
+    train_counts = counts.fit(train)
+    val_counts = counts.transform(val)
+    max_features = _untied_max_features(counts, counts.select(ngram_range=ngram_range)) if limit else None
+    columns = counts.select(max_features=max_features, ngram_range=ngram_range)
+
+    vectorizer = TfidfVectorizer(ngram_range=ngram_range, max_features=max_features, stop_words=stop_words,
+                                 sublinear_tf=sublinear_tf)
+    expected_train = vectorizer.fit_transform(' '.join(doc) for doc in train)
+    expected_val = vectorizer.transform(' '.join(doc) for doc in val)
+
+    # sklearn orders its features alphabetically
+    names = counts.feature_names(columns)
+    assert sorted(names) == vectorizer.get_feature_names_out().tolist()
+    order = np.argsort(names, kind='stable')
+    for matrix, expected in ((train_counts, expected_train), (val_counts, expected_val)):
+        actual = counts.tfidf(matrix, columns, sublinear_tf=sublinear_tf)[:, order]
+        assert np.allclose(actual.toarray(), expected.toarray())
@@ -0,0 +1,58 @@
+import os
+import random
+
+import pytest
+from nltk.tag.perceptron import PerceptronTagger
+
+from src.pos_tagging import CachedTagger
+from src.tokenizers import fast_word_tokenize
+
+
+def _has_tagger_data():
+    try:
+        PerceptronTagger()
+    except LookupError:
+        return False
+    return True
+
+
+def _small_tagger():
+    """
+    A perceptron tagger trained on a few made-up sentences, so the test runs without NLTK data.
+    """
+    rng = random.Random(0)
+    words = {'DT': ['the', 'a'], 'JJ': ['big', 'old', 'red'], 'NN': ['dog', 'house', 'man', 'time'],
+             'VBD': ['ran', 'saw', 'walked'], 'VB': ['run', 'see'], 'RB': ['quickly', 'very'], '.': ['.']}
+    patterns = (['DT', 'JJ', 'NN', 'VBD', 'RB', '.'], ['DT', 'NN', 'VB', 'DT', 'NN', '.'], ['NN', 'VBD', 'JJ', '.'])
+    sentences = [[(rng.choice(words[tag]), tag) for tag in rng.choice(patterns)] for _ in range(300)]
+    tagger = PerceptronTagger(load=False)
+    tagger.train(sentences, nr_iter=3)
+    return tagger
+
+
+def _books(corpus):
+    _, gutenberg_path = corpus
+    text_dir = os.path.join(gutenberg_path, 'data', 'text')
+    books = []
+    for name in sorted(os.listdir(text_dir))[:4]:
+        with open(os.path.join(text_dir, name), encoding='utf-8') as f:
+            books.append(fast_word_tokenize(f.read()))
+    return books
+
+
+def test_book_mode_matches_the_wrapped_tagger(corpus):
+    tagger = _small_tagger()
+    cached = CachedTagger(tagger)
+    for tokens in _books(corpus) + [['The', 'old', 'dog', 'walked', 'quickly', '.'] * 3]:
+        # Twice, the second time from the window cache
+        assert cached.tag(tokens, 'book') == tagger.tag(tokens)
+        assert cached.tag(tokens, 'book') == tagger.tag(tokens)
+
+
+@pytest.mark.skipif(not _has_tagger_data(), reason='NLTK tagger data not installed')
+def test_book_mode_matches_pos_tag(corpus):
+    from nltk import pos_tag
+
+    cached = CachedTagger(PerceptronTagger())
+    for tokens in _books(corpus):
+        assert cached.tag(tokens, 'book') == pos_tag(tokens)
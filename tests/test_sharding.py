@@ -0,0 +1,112 @@
+import os
+import json
+import time
+
+import pytest
+
+from src.data_loader import GutenbergDataLoader, trim_words
+from src.sharding import ShardManifest
+from src.tokenizers import fast_word_tokenize
+
+
+def _has_lemmatizer_data():
+    try:
+        from nltk.corpus import stopwords, wordnet
+        from nltk.tag.perceptron import PerceptronTagger
+        stopwords.words('english')
+        wordnet.ensure_loaded()
+        PerceptronTagger()
+    except LookupError:
+        return False
+    return True
+
+
+def _loader(corpus, cache_dir):
+    dataset_dir, gutenberg_path = corpus
+    return GutenbergDataLoader(dataset_dir, gutenberg_repo_path=gutenberg_path, num_threads=1,
+                               cache_dir=str(cache_dir), tokenizer='fast')
+
+
+def test_shards_cache_under_their_own_skip(corpus, tmp_path):
+    skip = 5
+    out_dir = str(tmp_path / 'shards')
+    with _loader(corpus, tmp_path / 'cache') as loader:
+        loader.process_shards(out_dir, skip_first_and_last_words=skip, lemmatize=False, shard_size=2)
+        loader.merge_shards(out_dir)
+
+        for pg_id, tokens in zip(loader.train_df['id'], loader.train_df['tokenized']):
+            assert tokens == fast_word_tokenize(trim_words(loader._book_store.get_text(pg_id), skip))
+            assert loader._cache.get(loader._cache_key(pg_id, 'tokenized', skip)) == tokens
+            assert loader._cache.get(loader._cache_key(pg_id, 'tokenized', 100)) is None
+
+
+@pytest.mark.skipif(not _has_lemmatizer_data(), reason='NLTK lemmatizer data not installed')
+def test_shards_cache_lemmas_under_their_own_skip(corpus, tmp_path):
+    skip = 5
+    out_dir = str(tmp_path / 'shards')
+    with _loader(corpus, tmp_path / 'cache') as loader:
+        loader.process_shards(out_dir, skip_first_and_last_words=skip, shard_size=2)
+        loader.merge_shards(out_dir)
+
+        for pg_id, lemmas in zip(loader.train_df['id'], loader.train_df['lemmatized']):
+            assert loader._cache.get(loader._cache_key(pg_id, 'lemmatized', skip)) == lemmas
+            assert loader._cache.get(loader._cache_key(pg_id, 'lemmatized', 100)) is None
+
+        # Lemmatizing the merged splits again reads the lemmas cached under the shards' skip
+        loader.lemmatize_all_text()
+        assert loader.train_df['lemmatized'].notna().all()
+
+
+def _manifest(out_dir):
+    return ShardManifest.create(str(out_dir), {'final_train.csv': ['PG1', 'PG2']}, 2, {'format': 'arrow'})
+
+
+def _age_lock(manifest, shard_id, seconds):
+    lock_path = manifest._path(shard_id, '.lock')
+    old = time.time() - seconds
+    os.utime(lock_path, (old, old))
+
+
+def test_claim_takes_over_a_stale_lock_once(tmp_path):
+    manifest = _manifest(tmp_path)
+    shard_id = manifest.shards[0]['shard_id']
+    assert manifest.claim(shard_id, lock_timeout=60)
+    assert not manifest.claim(shard_id, lock_timeout=60)
+
+    _age_lock(manifest, shard_id, 120)
+    other = ShardManifest.load(str(tmp_path))
+    assert other.claim(shard_id, lock_timeout=60)
+    # The stale lock has been replaced by a fresh one, which nobody else can take over
+    assert not manifest.claim(shard_id, lock_timeout=60)
+    assert not [name for name in os.listdir(tmp_path / 'shards') if name.endswith('.stale')]
+
+
+def test_claim_puts_back_a_lock_taken_over_in_between(tmp_path):
+    manifest = _manifest(tmp_path)
+    shard_id = manifest.shards[0]['shard_id']
+    lock_path = manifest._path(shard_id, '.lock')
+    assert manifest.claim(shard_id, lock_timeout=60)
+    _age_lock(manifest, shard_id, 120)
+    stale_owner = manifest._stale_owner(lock_path, 60)
+
+    # Another process takes the lock over after we found it stale, but before we move it
+    os.remove(lock_path)
+    assert manifest._create_lock(lock_path)
+    with open(lock_path, 'r', encoding='utf-8') as f:
+        fresh_owner = json.load(f)
+
+    manifest._stale_owner = lambda path, timeout: stale_owner if path == lock_path else None
+    assert not manifest.claim(shard_id, lock_timeout=60)
+    with open(lock_path, 'r', encoding='utf-8') as f:
+        assert json.load(f)['token'] == fresh_owner['token']
+
+
+def test_holding_refreshes_the_lock(tmp_path):
+    manifest = _manifest(tmp_path)
+    shard_id = manifest.shards[0]['shard_id']
+    assert manifest.claim(shard_id, lock_timeout=1)
+    _age_lock(manifest, shard_id, 120)
+
+    with manifest.holding(shard_id, lock_timeout=1):
+        time.sleep(0.3)
+        assert not ShardManifest.load(str(tmp_path)).claim(shard_id, lock_timeout=1)
@@ -0,0 +1,109 @@
+import multiprocessing
+import os
+import pickle
+import shutil
+
+from src.data_loader import GutenbergDataLoader
+
+SPLITS = ('final_train.csv', 'final_val.csv', 'final_test.csv')
+
+
+class MarkingTokenizer:
+    """
+    Tokenizer backend starting every book's tokens with marker, which shows which run produced a
+    cached output.
+    """
+    name = 'marking'
+
+    def __init__(self, marker, version='marking-1'):
+        self.marker = marker
+        self.version = version
+
+    def __call__(self, text):
+        return [self.marker] + text.split()
+
+
+def _tokenize(corpus, cache_dir, marker, split='final_train.csv', pg_ids=None, skip=5, version='marking-1',
+              gutenberg_path=None, **kwargs):
+    """
+    {pg_id: tokens} of the books of a split, tokenized by a fresh loader using cache_dir.
+    """
+    dataset_dir, corpus_path = corpus
+    with GutenbergDataLoader(dataset_dir, gutenberg_repo_path=gutenberg_path or corpus_path, num_threads=1,
+                             cache_dir=str(cache_dir), tokenizer=MarkingTokenizer(marker, version),
+                             **kwargs) as loader:
+        df = loader.process_split(split, skip, pg_ids=pg_ids)
+    return dict(zip(df['id'], df['tokenized']))
+
+
+def _markers(books):
+    return {pg_id: tokens[0] for pg_id, tokens in books.items()}
+
+
+def _cache_files(cache_dir):
+    return [os.path.join(root, name) for root, _, names in os.walk(cache_dir) for name in names]
+
+
+def test_entries_are_keyed_on_content_trim_and_version(corpus, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    first = _tokenize(corpus, cache_dir, 'a')
+    assert set(_markers(first).values()) == {'a'}
+    assert _tokenize(corpus, cache_dir, 'b') == first
+
+    # Another trim length or tokenizer version is another entry
+    assert set(_markers(_tokenize(corpus, cache_dir, 'c', skip=6)).values()) == {'c'}
+    assert set(_markers(_tokenize(corpus, cache_dir, 'd', version='marking-2')).values()) == {'d'}
+
+    # So is a book whose text changed
+    gutenberg_path = str(tmp_path / 'gutenberg')
+    shutil.copytree(corpus[1], gutenberg_path)
+    changed = sorted(first)[0]
+    with open(os.path.join(gutenberg_path, 'data', 'text', f'{changed}_text.txt'), 'a', encoding='utf-8') as f:
+        f.write('\nA new last line.\n')
+    markers = _markers(_tokenize(corpus, cache_dir, 'e', gutenberg_path=gutenberg_path))
+    assert markers == {pg_id: 'e' if pg_id == changed else 'a' for pg_id in first}
+
+
+def test_least_recently_used_entries_are_evicted(corpus, tmp_path):
+    train = _tokenize(corpus, tmp_path / 'unbounded', 'a')
+    val = _tokenize(corpus, tmp_path / 'unbounded', 'a', split='final_val.csv')
+    sizes = {pg_id: len(pickle.dumps(tokens, protocol=pickle.HIGHEST_PROTOCOL))
+             for pg_id, tokens in {**train, **val}.items()}
+    kept = sorted(train)[0]
+    max_bytes = max(sum(sizes[pg_id] for pg_id in train), sum(sizes[pg_id] for pg_id in val) + sizes[kept])
+
+    # Train fits, reading one of its books again makes it the most recent, then val evicts the rest
+    cache_dir = tmp_path / 'bounded'
+    _tokenize(corpus, cache_dir, 'a', cache_max_bytes=max_bytes)
+    _tokenize(corpus, cache_dir, 'a', pg_ids=[kept], cache_max_bytes=max_bytes)
+    _tokenize(corpus, cache_dir, 'a', split='final_val.csv', cache_max_bytes=max_bytes)
+    assert sum(os.path.getsize(path) for path in _cache_files(cache_dir)) <= max_bytes
+
+    assert set(_markers(_tokenize(corpus, cache_dir, 'b', split='final_val.csv')).values()) == {'a'}
+    markers = _markers(_tokenize(corpus, cache_dir, 'b'))
+    assert markers[kept] == 'a'
+    assert 'b' in markers.values()
+
+
+def _tokenize_all(corpus, cache_dir, marker):
+    for split in SPLITS:
+        _tokenize(corpus, cache_dir, marker, split=split)
+
+
+def test_processes_can_share_a_cache(corpus, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=_tokenize_all, args=(corpus, cache_dir, marker)) for marker in 'ab']
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert [process.exitcode for process in processes] == [0, 0]
+
+    # Every entry is complete, and holds the output of one of the two runs
+    assert not [path for path in _cache_files(cache_dir) if not path.endswith('.pkl')]
+    for split in SPLITS:
+        expected = _tokenize(corpus, tmp_path / 'fresh', 'c', split=split)
+        for pg_id, tokens in _tokenize(corpus, cache_dir, 'c', split=split).items():
+            assert tokens[0] in ('a', 'b')
+            assert tokens[1:] == expected[pg_id][1:]
@@ -0,0 +1,80 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from src.chunking import count_words
+from src.data_loader import GutenbergDataLoader
+from src.stylometry import FEATURE_NAMES, NUM_FEATURES, book_features, document_features
+from src.tokenizers import fast_word_tokenize
+
+
+def test_features_of_a_hand_checked_text():
+    text = 'The cat sat. The dog ran!'
+    tokens = ['The', 'cat', 'sat', '.', 'The', 'dog', 'ran', '!']
+    features = dict(zip(FEATURE_NAMES, document_features(text, tokens).tolist()))
+
+    # 6 words of 3 letters in 2 sentences of 4 tokens, 25 characters
+    expected = {'avg_word_length': 3, 'word_length_3': 1,
+                'avg_sentence_length': 4, 'median_sentence_length': 4, 'sentence_length_1-5': 1,
+                'type_token_ratio': 5 / 6, 'hapax_ratio': 4 / 6,
+                'punct_.': 1 / 25, 'punct_!': 1 / 25, 'uppercase_ratio': 2 / 25, 'whitespace_ratio': 5 / 25,
+                'automated_readability_index': 4.71 * 3 + 0.5 * 3 - 21.43,
+                'coleman_liau_index': 5.88 * 3 - 29.6 * 2 / 6 - 15.8,
+                'fw_the': 2 / 6}
+    for name, value in features.items():
+        assert value == pytest.approx(expected.get(name, 0), abs=1e-6), name
+
+
+def test_empty_text_has_zero_features():
+    assert not document_features('', []).any()
+
+
+@pytest.fixture
+def short_and_missing_books(corpus, tmp_path):
+    """
+    The corpus without the text of its first book, and the PG id of that book.
+    """
+    dataset_dir, gutenberg_path = corpus
+    copy = str(tmp_path / 'gutenberg')
+    shutil.copytree(gutenberg_path, copy)
+    missing = sorted(os.listdir(os.path.join(copy, 'data', 'text')))[0][:-len('_text.txt')]
+    os.remove(os.path.join(copy, 'data', 'text', f'{missing}_text.txt'))
+    return dataset_dir, copy, missing
+
+
+def test_features_per_book_and_per_chunk(short_and_missing_books):
+    dataset_dir, gutenberg_path, missing = short_and_missing_books
+    with GutenbergDataLoader(dataset_dir, gutenberg_repo_path=gutenberg_path, num_threads=1,
+                             tokenizer='fast') as loader:
+        loader.load_splits(skip_first_and_last_words=5)
+        dfs = {'train': loader.train_df, 'val': loader.val_df, 'test': loader.test_df}
+        num_words = {pg_id: count_words(text) for df in dfs.values() for pg_id, text in zip(df['id'], df['text'])
+                     if isinstance(text, str)}
+        # Some books hold the 3 chunks, the shortest doesn't
+        num_chunks, chunk_size = 3, min(num_words.values()) // 3 + 1
+        assert max(num_words.values()) >= num_chunks * chunk_size
+
+        per_book = loader.stylometry_features()
+        offsets = loader.sample_chunk_offsets(num_chunks, chunk_size, seed=0)
+        per_chunk = loader.stylometry_features(offsets)
+
+    for split, df in dfs.items():
+        assert per_book[split].shape == (len(df), NUM_FEATURES)
+        assert per_chunk[split].shape == (len(df), num_chunks, NUM_FEATURES)
+        assert per_book[split].dtype == per_chunk[split].dtype == np.float32
+
+        for i, (pg_id, text) in enumerate(zip(df['id'], df['text'])):
+            if pg_id == missing:
+                assert np.isnan(per_book[split][i]).all() and np.isnan(per_chunk[split][i]).all()
+                continue
+
+            assert np.allclose(per_book[split][i], document_features(text, fast_word_tokenize(text)))
+            expected = book_features(text, fast_word_tokenize, offsets=offsets[split][i])
+            drawn = len(expected)
+            assert drawn == (num_chunks if num_words[pg_id] >= num_chunks * chunk_size else 1)
+            assert np.allclose(per_chunk[split][i, :drawn], expected)
+            # Chunks a short book doesn't have are padding
+            assert np.isnan(per_chunk[split][i, drawn:]).all()
+    assert missing in set().union(*(df['id'] for df in dfs.values()))
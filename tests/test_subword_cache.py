@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.book_store import pack_books
+from src.data_loader import GutenbergDataLoader
+
+
+class CharTokenizer:
+    """
+    Character-level stand-in for a byte-level BPE tokenizer: newlines are tokens of their own.
+    """
+    name_or_path = 'chars'
+
+    def __call__(self, texts):
+        return {'input_ids': [[ord(c) for c in text] for text in texts]}
+
+
+def notebook_samples(path_gutenberg, pg_id, tokenizer, num_samples, max_length, strip_tokens):
+    """
+    The windows get_token_samples_multiple in PreTrained_Transformer.ipynb takes from one book.
+    """
+    with open(f'{path_gutenberg}/data/text/{pg_id}_text.txt', 'r', encoding='utf-8', errors='replace') as f:
+        book_str = f.read()
+
+    tokens = np.asarray(tokenizer([book_str])['input_ids'][0])
+    if strip_tokens > 0:
+        tokens = tokens[strip_tokens:]
+
+    total_tokens_needed = num_samples * max_length
+    if len(tokens) < total_tokens_needed:
+        while len(tokens) < total_tokens_needed:
+            tokens = np.concatenate([tokens, tokens])
+
+    last_n_tokens = tokens[-total_tokens_needed:]
+    return [last_n_tokens[i * max_length:(i + 1) * max_length].tolist() for i in range(num_samples)]
+
+
+@pytest.fixture
+def newline_corpus(corpus, tmp_path):
+    """
+    The synthetic corpus, with a short book and Windows and old Mac line endings in some books.
+    """
+    dataset_dir, gutenberg_path = corpus
+    text_dir = os.path.join(gutenberg_path, 'data', 'text')
+    books = {}
+    for name in sorted(os.listdir(text_dir)):
+        with open(os.path.join(text_dir, name), 'rb') as f:
+            books[name] = f.read()
+
+    copy = tmp_path / 'gutenberg' / 'data' / 'text'
+    copy.mkdir(parents=True)
+    for i, (name, raw) in enumerate(books.items()):
+        if i % 3 == 1:
+            raw = raw.replace(b'\n', b'\r\n')
+        elif i % 3 == 2:
+            raw = raw[:300].replace(b'\n', b'\r') + b'  \n\n end \n'
+        (copy / name).write_bytes(raw)
+    return dataset_dir, str(tmp_path / 'gutenberg')
+
+
+@pytest.mark.parametrize('packed', [False, True])
+def test_tail_windows_match_the_notebook(newline_corpus, tmp_path, packed):
+    dataset_dir, gutenberg_path = newline_corpus
+    book_store = None
+    if packed:
+        book_store = str(tmp_path / 'packed')
+        pack_books(os.path.join(gutenberg_path, 'data', 'text'), book_store)
+
+    tokenizer = CharTokenizer()
+    max_length, strip_tokens, max_windows = 16, 10, 6
+    with GutenbergDataLoader(dataset_dir, gutenberg_repo_path=gutenberg_path, num_threads=1,
+                             book_store=book_store) as loader:
+        cache = loader.build_subword_cache(str(tmp_path / 'subwords'), tokenizer, batch_size=3)
+        pg_ids = loader.read_split_csv('final_train.csv')['id'].tolist()
+
+    assert any(ord('\n') in cache.tokens(pg_id) for pg_id in pg_ids)
+    for num_windows in (1, 4, max_windows):
+        windows, rows = cache.tail_windows(pg_ids, num_windows, max_length, strip_tokens=strip_tokens,
+                                           max_windows=max_windows)
+        for i, pg_id in enumerate(pg_ids):
+            expected = notebook_samples(gutenberg_path, pg_id, tokenizer, max_windows, max_length, strip_tokens)
+            assert windows[rows == i].tolist() == expected[max_windows - num_windows:]
@@ -0,0 +1,44 @@
+import os
+import pstats
+
+from src.data_loader import GutenbergDataLoader
+from src.telemetry import LoaderTelemetry
+
+
+def _loader(corpus, telemetry):
+    dataset_dir, gutenberg_path = corpus
+    return GutenbergDataLoader(dataset_dir, gutenberg_repo_path=gutenberg_path, num_threads=1,
+                               telemetry=telemetry, tokenizer='fast')
+
+
+def _profiled_functions(path):
+    return {function for _, _, function in pstats.Stats(path).stats}
+
+
+def test_workers_report_their_own_usage(corpus, tmp_path):
+    telemetry = LoaderTelemetry(profile_stage='tokenized', profile_dir=str(tmp_path))
+    with _loader(corpus, telemetry) as loader:
+        loader.load_splits(skip_first_and_last_words=5)
+        loader.tokenize_all_text()
+
+    tokenized = [entry for entry in telemetry.report().stages if entry['stage'] == 'tokenized']
+    assert tokenized
+    for entry in tokenized:
+        # The pool is still running, so this only shows up if the workers report it
+        assert entry['worker_cpu_s'] > 0
+        assert entry['peak_worker_rss_bytes'] > 0
+        assert os.path.exists(entry['profile'])
+        assert '_tokenize_book' in _profiled_functions(entry['profile'])
+    assert not [name for name in os.listdir(tmp_path) if '.worker.' in name]
+
+
+def test_tokenizing_while_loading_is_profiled_as_tokenized(corpus, tmp_path):
+    telemetry = LoaderTelemetry(profile_stage='tokenized', profile_dir=str(tmp_path))
+    with _loader(corpus, telemetry) as loader:
+        loader.load_splits(skip_first_and_last_words=5, tokenize=True)
+
+    train = [entry for entry in telemetry.report().stages
+             if entry['stage'] == 'load' and entry['split'] == 'final_train.csv']
+    assert train[0]['worker_profiles'] == [str(tmp_path / 'tokenized.final_train.csv.prof')]
+    assert '_tokenize_book' in _profiled_functions(train[0]['worker_profiles'][0])
+    assert train[0]['worker_cpu_s'] > 0
@@ -0,0 +1,48 @@
+import pytest
+
+from src.tokenizers import compare_tokenizers, diff_tokens, get_tokenizer
+
+# The fast backend only replaces Punkt with a sentence-boundary rule, so it may split a
+# sentence-final period differently (as after "Jan. 5.") on at most this fraction of the reference tokens
+MISMATCH_BUDGET = 0.02
+
+TEXTS = [
+    # Quotes
+    '"Come here," said he. \'Not yet,\' she answered, "not until ``the end\'\'." He laughed.',
+    '“Curly quotes,” she wrote, ‘and single ones.’ Then: "Done!" And "Why?" he asked.',
+    # Contractions
+    "I can't and won't. You'd've done it, wouldn't you? They're gonna say it's John's hat.",
+    "Cannot, gimme, lemme, wanna. We'll see; I'd rather not. O'Brien's dog isn't here.",
+    # Ellipses
+    'Wait... what was that... Nothing. Well.... Perhaps... no, it was the wind...',
+    'He paused . . . and went on. "So..." she began. Then...',
+    # Sentence-final punctuation
+    'Is it true? Yes! It is. Really?! Indeed; quite so: the end.',
+    'Mr. Smith met Dr. Jones at St. Paul\'s on Jan. 5. They spoke of the U.S. and went home.',
+    'It cost $3.50, i.e. a lot. Chapter 12. The next day, at 4 p.m., they left.',
+    # Parentheses and brackets
+    '(This is a parenthetical.) [So is this!] {And this?} <Not quite> -- but nearly (almost).',
+    'The results (see Table 2.) were clear (p. 14). "Quoted (and bracketed)." Done.',
+]
+
+
+def _has_punkt():
+    try:
+        get_tokenizer('nltk')('One. Two.')
+    except LookupError:
+        return False
+    return True
+
+
+@pytest.mark.skipif(not _has_punkt(), reason='NLTK punkt data not installed')
+def test_fast_tokenizer_matches_word_tokenize():
+    comparison = compare_tokenizers(TEXTS, candidate='fast', reference='nltk')
+    assert comparison.num_books == len(TEXTS)
+    assert comparison.error_rate <= MISMATCH_BUDGET, comparison.summary()
+
+    # Whatever differs is a period the two sentence splitters disagree on
+    reference, candidate = get_tokenizer('nltk'), get_tokenizer('fast')
+    for text in TEXTS:
+        expected, actual = reference(text), candidate(text)
+        for i1, i2, j1, j2 in diff_tokens(expected, actual):
+            assert '.' in ''.join(expected[i1:i2] + actual[j1:j2]), (text, expected[i1:i2], actual[j1:j2])
@@ -0,0 +1,29 @@
+import time
+
+from src.worker_pool import WorkerPool, default_mp_context, warm_up_worker
+
+
+def _fail_to_warm_up(text):
+    raise LookupError("Resource 'punkt_tab' not found.")
+
+
+def test_workers_are_not_forked():
+    assert default_mp_context().get_start_method() in ('forkserver', 'spawn')
+    with WorkerPool(1) as pool:
+        assert pool._executor._mp_context.get_start_method() != 'fork'
+        assert pool.map(abs, [-1, 2, -3], progress=False) == [1, 2, 3]
+
+
+def test_warm_up_warns_about_missing_nltk_data(capsys):
+    warm_up_worker(('tokenized',), tokenizer=_fail_to_warm_up)
+    output = capsys.readouterr().out
+    assert "Warning: could not warm up the worker, NLTK data is missing: Resource 'punkt_tab'" in output
+
+
+def test_close_cancels_queued_work():
+    pool = WorkerPool(1)
+    futures = [pool.submit(time.sleep, 0.2) for _ in range(20)]
+    start = time.perf_counter()
+    pool.close()
+    assert time.perf_counter() - start < 2
+    assert any(future.cancelled() for future in futures)